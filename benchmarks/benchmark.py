@@ -0,0 +1,343 @@
+"""
+Benchmarks of the data pipeline stages on synthetic datasets (see 'synthetic.py'), reporting the time,
+throughput and peak memory (RSS) of each stage at each scale as JSON, along with the scaling curve of
+each stage across the scales.
+
+Each stage is run in a fresh process, so its peak RSS is its own. Every stage is run twice: 'cold', with
+the stage's on-disk caches (eg. the Chronumental month index and parsed VCF sidecars) removed, and 'warm',
+reusing the caches written by the cold run.
+
+Passing a previous report with '--baseline' compares the runs against it, exiting with an error if any
+stage got slower (or used more memory) than the tolerance allows.
+
+Usage:
+    python3 benchmarks/benchmark.py [--scales tiny small] [--stages merge_datafiles ...] [--workers 1]
+        [--data-dir benchmarks/data] [--out benchmarks/results.json] [--baseline results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+from synthetic import SCALES, generate
+from fitness_stats import calculate_fitness_stats
+from month_index import MONTH_INDEX_SUFFIX
+from profiling import peak_rss_mb
+from scoring import get_fitness_scores
+from third_party.nuc_mutations_to_aa_mutations_modified import load_reference_sequence_modified
+from trio_vcf import TRIO_MUTATIONS_SUFFIX
+from util import Config, get_chronumental_dates, merge_datafiles
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BENCHMARKS_DIR, "data")
+DEFAULT_OUT = os.path.join(BENCHMARKS_DIR, "results.json")
+RUN_MODES = ["cold", "warm"]
+# Allowed slowdown (and memory growth) relative to the baseline report
+DEFAULT_TOLERANCE = 0.2
+# Changes below these are measurement noise, rather than regressions
+REGRESSION_FLOORS = {"seconds": 0.1, "peak_rss_mb": 16.0}
+
+
+class BenchmarkStage:
+    """
+    A pipeline stage to benchmark.
+    """
+
+    def __init__(self, prepare, run, size, unit, caches):
+        """
+        Parameters
+        ----------
+        prepare: Callable[[Config, argparse.Namespace], Dict]
+            Loads the stage's inputs that are not part of the benchmark, returning the arguments of 'run'.
+
+        run: Callable[..., None]
+            Runs the stage.
+
+        size: str
+            The dataset size (see 'synthetic.generate') the stage's throughput is measured in.
+
+        unit: str
+            The unit of the stage's throughput.
+
+        caches: Callable[[Config], List[str]]
+            The on-disk caches of the stage, removed before the cold run.
+        """
+        self.prepare = prepare
+        self.run = run
+        self.size = size
+        self.unit = unit
+        self.caches = caches
+
+
+def prepare_fitness_stats(config, args):
+    return {
+        "mutations_file_path": config.sample_mutations_path,
+        "refseq": load_reference_sequence_modified(config.DATA_DIR, "reference.fasta"),
+        "mutation_fitness_scores": get_fitness_scores(config.PYRO_MUTATIONS_FILE),
+        "sample_months": get_chronumental_dates(config.CHRONUMENTAL_FILE),
+        "workers": args.workers,
+    }
+
+
+def run_fitness_main():
+    # 'fitness.py' reads its config from the working directory
+    import fitness
+
+    sys.argv = ["fitness.py"]
+    fitness.main()
+
+
+STAGES = {
+    "get_chronumental_dates": BenchmarkStage(
+        lambda config, args: {"chronumental_filename": config.CHRONUMENTAL_FILE},
+        get_chronumental_dates,
+        "chronumental_rows",
+        "rows/s",
+        lambda config: [config.CHRONUMENTAL_FILE + MONTH_INDEX_SUFFIX],
+    ),
+    "fitness_main": BenchmarkStage(
+        lambda config, args: {},
+        run_fitness_main,
+        "trio_nodes",
+        "nodes/s",
+        lambda config: [config.RIVET_VCF_FILE + TRIO_MUTATIONS_SUFFIX],
+    ),
+    "merge_datafiles": BenchmarkStage(
+        lambda config, args: {"config": config},
+        merge_datafiles,
+        "rivet_rows",
+        "rows/s",
+        lambda config: [
+            config.CHRONUMENTAL_FILE + MONTH_INDEX_SUFFIX,
+            config.RIVET_VCF_FILE + TRIO_MUTATIONS_SUFFIX,
+        ],
+    ),
+    "calculate_fitness_stats": BenchmarkStage(
+        prepare_fitness_stats,
+        calculate_fitness_stats,
+        "store_samples",
+        "samples/s",
+        # Without a fitness cache, every sample is scored in both runs
+        lambda config: [],
+    ),
+}
+
+
+def run_stage(name, dataset_dir, mode, args):
+    """
+    Run a single stage on a dataset in the current process, measuring its time and peak RSS.
+
+    Returns
+    ----------
+    Dict
+        The stage's seconds, the peak RSS (MB) before and after running it, and the peak RSS of
+        its worker processes.
+    """
+    stage = STAGES[name]
+    # Stages read the dataset's 'config.yaml' relative to the working directory
+    os.chdir(dataset_dir)
+    config = Config("config.yaml")
+    if mode == "cold":
+        for path in stage.caches(config):
+            if os.path.exists(path):
+                os.remove(path)
+    stage_args = stage.prepare(config, args)
+    rss_before = peak_rss_mb(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    stage.run(**stage_args)
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "baseline_rss_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def benchmark_stage(name, dataset_dir, mode, args):
+    """
+    Run a stage in a fresh process, returning its measurements (see 'run_stage').
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json") as result:
+        command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--run-stage",
+            name,
+            "--mode",
+            mode,
+            "--dataset",
+            dataset_dir,
+            "--result",
+            result.name,
+            "--workers",
+            str(args.workers),
+        ]
+        log = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if log.returncode != 0:
+            print(log.stdout)
+            raise RuntimeError(f"Benchmark of stage '{name}' failed ({mode}) on dataset: '{dataset_dir}'")
+        with open(result.name) as f:
+            return json.load(f)
+
+
+def scaling_curves(runs):
+    """
+    Fit the scaling curve of each stage and run mode, as the exponent 'k' of 'seconds ~ size^k' (and of
+    the peak RSS), by least squares on the log-log points of every scale.
+    """
+    curves = {}
+    for name in STAGES:
+        for mode in RUN_MODES:
+            points = sorted(
+                (run["size"], run["seconds"], run["peak_rss_mb"])
+                for run in runs
+                if run["stage"] == name and run["mode"] == mode
+            )
+            if not points:
+                continue
+            sizes, seconds, rss = (np.array(values, dtype=np.float64) for values in zip(*points))
+            curve = {"sizes": sizes.tolist(), "seconds": seconds.tolist(), "peak_rss_mb": rss.tolist()}
+            if len(np.unique(sizes)) > 1:
+                curve["time_exponent"] = np.polyfit(np.log(sizes), np.log(seconds), 1)[0]
+                curve["rss_exponent"] = np.polyfit(np.log(sizes), np.log(rss), 1)[0]
+            curves[f"{name}/{mode}"] = curve
+    return curves
+
+
+def compare_reports(report, baseline, tolerance):
+    """
+    Compare the runs of a report with those of the same stage, mode and scale in a baseline report.
+
+    Returns
+    ----------
+    List[str]
+        The regressions, the runs more than 'tolerance' slower or with larger peak RSS than the baseline
+        (ignoring changes within the 'REGRESSION_FLOORS').
+    """
+    baseline_runs = {(run["scale"], run["stage"], run["mode"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in report["runs"]:
+        previous = baseline_runs.get((run["scale"], run["stage"], run["mode"]))
+        if previous is None:
+            continue
+        for metric, floor in REGRESSION_FLOORS.items():
+            change = run[metric] / previous[metric] - 1
+            if change > tolerance and run[metric] - previous[metric] > floor:
+                regressions.append(
+                    f"{run['stage']} ({run['mode']}, {run['scale']}): {metric} "
+                    f"{previous[metric]:.2f} -> {run[metric]:.2f} (+{change:.0%})"
+                )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline stages on synthetic datasets.")
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        choices=list(SCALES),
+        default=["tiny", "small"],
+        help="Scales of the synthetic datasets to benchmark, see 'synthetic.py'.",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(STAGES),
+        default=list(STAGES),
+        help="Stages to benchmark.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used by 'calculate_fitness_stats'.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic datasets.")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory to generate the datasets in.")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="Path to write the JSON report to.")
+    parser.add_argument("--baseline", help="Previous JSON report to check for regressions against.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative slowdown and memory growth over the baseline.",
+    )
+    # Used internally, to run a single stage in a fresh process
+    parser.add_argument("--run-stage", choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=RUN_MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--dataset", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.run_stage:
+        result = run_stage(args.run_stage, args.dataset, args.mode, args)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        return
+
+    runs = []
+    for scale in args.scales:
+        dataset_dir = os.path.abspath(os.path.join(args.data_dir, scale))
+        sizes = generate(dataset_dir, SCALES[scale], args.seed)["sizes"]
+        for name in args.stages:
+            stage = STAGES[name]
+            for mode in RUN_MODES:
+                result = benchmark_stage(name, dataset_dir, mode, args)
+                size = sizes[stage.size]
+                result.update(
+                    {
+                        "scale": scale,
+                        "stage": name,
+                        "mode": mode,
+                        "size": size,
+                        "throughput": size / result["seconds"],
+                        "unit": stage.unit,
+                    }
+                )
+                runs.append(result)
+                print(
+                    f"{scale:>8} {name:<25} {mode:<5} {result['seconds']:9.2f}s "
+                    f"{result['throughput']:14,.0f} {stage.unit:<10} peak RSS {result['peak_rss_mb']:9.1f} MB"
+                )
+
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {"seed": args.seed, "workers": args.workers},
+        "scales": {scale: vars(SCALES[scale]) for scale in args.scales},
+        "runs": runs,
+        "curves": scaling_curves(runs),
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Benchmark report written to: ", args.out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline: ", args.baseline)
+            for regression in regressions:
+                print("    " + regression)
+            sys.exit(1)
+        print("No regressions against baseline: ", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Generator of synthetic data pipeline inputs at the scale of the full MAT, for benchmarking the pipeline
+offline without the (private) MAT.
+
+A synthetic dataset is a directory with a 'config.yaml' and a 'data' directory holding the same files
+as the repository's 'data' directory:
+    - the Chronumental dates file, with a date for every sample (tip) and internal node of the tree
+    - the RIVET results file and recombinant trios VCF, with internal nodes as recombinants and parents
+    - the RIVET trios fitness file, so the merge stage can run without 'notebooks/fitness.py'
+    - the PyR0 'mutations.tsv' file, scoring the amino acid mutations found in the samples
+    - the sample mutations store ('all_sample_mutations.parquet', see 'notebooks/mutation_store.py')
+    - the JHU case counts, standing genetic diversity and reference sequence files
+
+Samples are drawn from a shared pool of haplotypes (as samples of the same lineage share most of their
+mutations), so caches keyed on haplotypes see realistic hit rates. The data is random, but reproducible
+from the seed.
+
+Usage:
+    python3 benchmarks/synthetic.py --scale small --out benchmarks/data/small [--seed 0]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "notebooks"))
+from month_index import DATE_COL, SAMPLE_COL
+from mutation_store import DEFAULT_ROW_GROUP_SIZE, SCHEMA
+from nucleotides import NUCLEOTIDES, encode_nucleotides
+from third_party.nuc_mutations_to_aa_mutations_modified import load_reference_sequence_modified
+from translation import AATranslator
+from util import MONTHS, RIVET_CONFIG, Config
+
+MANIFEST_FILE = "synthetic.json"
+# Bumped whenever the generated data changes, so previously generated datasets are regenerated
+GENERATOR_VERSION = 1
+GENOME_LENGTH = 29903
+# Inferred dates span a month either side of the analysed months, so some nodes fall outside of them
+FIRST_DATE = datetime(2019, 12, 1)
+LAST_DATE = datetime(2023, 4, 30)
+LINEAGES = ["B.1.1.7", "AY.4", "AY.103", "BA.1.1", "BA.2", "BA.2.12.1", "BA.5.2", "BQ.1.1", "XBB.1.5", "XBB.1.16"]
+# RIVET QC flags of the synthetic recombinants, and the fraction of recombinants given each
+QC_FLAGS = {
+    "PASS": 0.6,
+    "Too_many_mutations_near_INDELs": 0.15,
+    "Too_many_mutations_near_INDELs,Suspicious_mutation_clump": 0.1,
+    "Suspicious_mutation_clump": 0.1,
+    "Too_many_mutations_in_window": 0.05,
+}
+# Fraction of the amino acid mutations found in the samples that are ranked in the PyR0 file
+SCORED_FRACTION = 0.5
+
+
+class Scale:
+    """
+    The size of each synthetic input.
+    """
+
+    def __init__(
+        self,
+        chronumental_rows,
+        rivet_rows,
+        store_samples,
+        vcf_records,
+        mutations_per_sample=40,
+        samples_per_haplotype=20,
+    ):
+        """
+        Parameters
+        ----------
+        chronumental_rows: int
+            The number of samples and internal nodes dated in the Chronumental file.
+
+        rivet_rows: int
+            The number of recombinants in the RIVET results file.
+
+        store_samples: int
+            The number of samples in the sample mutations store, the tips of the tree.
+
+        vcf_records: int
+            The number of variable sites (records) in the recombinant trios VCF.
+
+        mutations_per_sample: int (Optional)
+            The mean number of nucleotide mutations of each sample and trio node.
+
+        samples_per_haplotype: int (Optional)
+            The mean number of samples sharing each haplotype.
+        """
+        self.chronumental_rows = chronumental_rows
+        self.rivet_rows = rivet_rows
+        self.store_samples = store_samples
+        self.vcf_records = vcf_records
+        self.mutations_per_sample = mutations_per_sample
+        self.samples_per_haplotype = samples_per_haplotype
+
+
+SCALES = {
+    "tiny": Scale(100_000, 1_000, 10_000, 200),
+    "small": Scale(1_000_000, 10_000, 100_000, 500),
+    "medium": Scale(5_000_000, 50_000, 500_000, 500),
+    "large": Scale(20_000_000, 200_000, 2_000_000, 500),
+}
+
+
+def month_end_dates(first_month, last_month):
+    """
+    The last day of each month from 'first_month' to 'last_month' (inclusive), as JHU column names.
+    """
+    dates = []
+    year, month = first_month
+    while (year, month) <= last_month:
+        next_month = datetime(year + month // 12, month % 12 + 1, 1)
+        last_day = next_month - timedelta(days=1)
+        dates.append(f"{last_day.month}/{last_day.day}/{last_day.year % 100}")
+        year, month = next_month.year, next_month.month
+    return dates
+
+
+def write_chronumental_dates(filename, scale, rng):
+    """
+    Write the Chronumental dates file, dating the store's samples ('sample_<i>') and the internal nodes
+    ('node_<i>') in random order.
+    """
+    num_nodes = scale.chronumental_rows
+    span_ms = int((LAST_DATE - FIRST_DATE).total_seconds() * 1000)
+    dates = pl.Series(rng.integers(0, span_ms, num_nodes), dtype=pl.Int64)
+    df = (
+        pl.DataFrame({"i": rng.permutation(num_nodes), "ms": dates})
+        .select(
+            pl.when(pl.col("i") < scale.store_samples)
+            .then(pl.format("sample_{}", pl.col("i")))
+            .otherwise(pl.format("node_{}", pl.col("i") - scale.store_samples))
+            .alias(SAMPLE_COL),
+            (pl.lit(FIRST_DATE) + pl.duration(milliseconds=pl.col("ms")))
+            .dt.strftime("%Y-%m-%d %H:%M:%S%.3f")
+            .alias(DATE_COL),
+        )
+    )
+    df.write_csv(filename, separator="\t")
+
+
+def write_rivet_results(filename, scale, rng):
+    """
+    Write the RIVET results file, with distinct internal nodes as recombinants and their parents drawn
+    from another pool of internal nodes.
+
+    Returns
+    ----------
+    List[str]
+        The recombinant and parent nodes, the samples of the trios VCF.
+    """
+    num_internal = scale.chronumental_rows - scale.store_samples
+    num_recombs = scale.rivet_rows
+    if num_internal < 2 * num_recombs:
+        raise ValueError("Too few internal nodes for the number of recombinants, increase 'chronumental_rows'.")
+    node_ids = rng.choice(num_internal, 2 * num_recombs, replace=False)
+    recombs = node_ids[:num_recombs]
+    donors = rng.choice(node_ids[num_recombs:], num_recombs)
+    acceptors = rng.choice(node_ids[num_recombs:], num_recombs)
+    flags = list(QC_FLAGS)
+    node_names = lambda ids: [f"node_{i}" for i in ids.tolist()]
+    df = pl.DataFrame(
+        {
+            RIVET_CONFIG["RECOMB_NODE_ID_COL"]: node_names(recombs),
+            "Donor Node ID": node_names(donors),
+            "Acceptor Node ID": node_names(acceptors),
+            "Breakpoint-1 Interval": [f"({a},{a + 500})" for a in rng.integers(1, 28000, num_recombs).tolist()],
+            "Recombinant Lineage": rng.choice(LINEAGES, num_recombs),
+            "Donor Lineage": rng.choice(LINEAGES, num_recombs),
+            "Acceptor Lineage": rng.choice(LINEAGES, num_recombs),
+            "Original Parsimony Score": rng.integers(6, 40, num_recombs),
+            "Recombination Parsimony Score": rng.integers(0, 5, num_recombs),
+            RIVET_CONFIG["QC_FLAG_COL"]: rng.choice(flags, num_recombs, p=list(QC_FLAGS.values())),
+            "Recomb Number Samples": rng.geometric(0.05, num_recombs),
+        }
+    )
+    df.write_csv(filename, separator="\t")
+    return node_names(np.unique(np.concatenate([recombs, donors, acceptors])))
+
+
+def write_trio_vcf(filename, samples, refseq, scale, rng):
+    """
+    Write the recombinant trios VCF, with a haploid genotype for each sample at every variable site.
+
+    Returns
+    ----------
+    np.ndarray
+        The number of nucleotide mutations of each sample.
+    """
+    positions = np.sort(rng.choice(np.arange(1, GENOME_LENGTH + 1), scale.vcf_records, replace=False))
+    # Probability of each sample being non-reference at a site
+    alt_rate = min(1.0, scale.mutations_per_sample / scale.vcf_records)
+    num_mutations = np.zeros(len(samples), dtype=np.int64)
+    line = np.full(2 * len(samples), ord("\t"), dtype=np.uint8)
+    line[-1] = ord("\n")
+    with open(filename, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        f.write(f"##contig=<ID=NC_045512v2,length={GENOME_LENGTH}>\n")
+        f.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + samples))
+        f.write("\n")
+        for position in positions.tolist():
+            ref = refseq[position - 1]
+            alts = [nt for nt in NUCLEOTIDES if nt != ref]
+            genotypes = np.where(rng.random(len(samples)) < alt_rate, rng.integers(1, len(alts) + 1, len(samples)), 0)
+            num_mutations += genotypes > 0
+            line[0::2] = genotypes + ord("0")
+            f.write(f"NC_045512v2\t{position}\t0\t{ref}\t{','.join(alts)}\t.\t.\t.\tGT\t")
+            f.write(line.tobytes().decode("ascii"))
+    return num_mutations
+
+
+def write_trios_fitness(filename, samples, num_mutations, rng):
+    """
+    Write the RIVET trios fitness file, as written by 'notebooks/fitness.py'.
+    """
+    log_scores = rng.normal(0.5, 1.0, len(samples))
+    pl.DataFrame(
+        {
+            "Node": samples,
+            "Score": np.exp(log_scores),
+            "NumNT": num_mutations,
+            "NumAA": rng.binomial(num_mutations, 0.6),
+            "LogScore": log_scores,
+        }
+    ).write_csv(filename)
+
+
+def make_haplotypes(refseq, scale, rng):
+    """
+    Generate the pool of haplotypes the store's samples are drawn from.
+
+    Returns
+    ----------
+    Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        The offset of each haplotype's mutations (one more than the number of haplotypes), and the
+        position, ref and alt nucleotide codes of every mutation, sorted by haplotype and position.
+    """
+    num_haplotypes = max(1, scale.store_samples // scale.samples_per_haplotype)
+    counts = rng.poisson(scale.mutations_per_sample, num_haplotypes)
+    # The first haplotype is identical to the reference
+    counts[0] = 0
+    haplotype = np.repeat(np.arange(num_haplotypes, dtype=np.int64), counts)
+    keys = np.unique(haplotype * (GENOME_LENGTH + 1) + rng.integers(1, GENOME_LENGTH + 1, len(haplotype)))
+    haplotype, positions = np.divmod(keys, GENOME_LENGTH + 1)
+    refs = encode_nucleotides(refseq)[positions - 1]
+    # Any of the other nucleotides (or any nucleotide, at ambiguous reference sites)
+    alts = ((refs % len(NUCLEOTIDES)) + rng.integers(1, len(NUCLEOTIDES), len(refs))) % len(NUCLEOTIDES)
+    offsets = np.searchsorted(haplotype, np.arange(num_haplotypes + 1))
+    return offsets, positions.astype(np.int32), refs, alts.astype(np.uint8)
+
+
+def dictionary_column(codes, valid):
+    """
+    Dictionary encoded nucleotide column, with null entries where not 'valid'.
+    """
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codes.astype(np.int32), mask=~valid), pa.array(list(NUCLEOTIDES), type=pa.string())
+    )
+
+
+def write_sample_mutations(filename, haplotypes, scale, rng, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Write the sample mutations store, each sample having the mutations of a random haplotype.
+
+    Returns
+    ----------
+    int
+        The number of rows (mutations) in the store.
+    """
+    offsets, positions, refs, alts = haplotypes
+    sample_haplotypes = rng.integers(0, len(offsets) - 1, scale.store_samples)
+    lengths = np.diff(offsets)[sample_haplotypes]
+    # Samples identical to the reference have a single null row
+    rows = np.maximum(lengths, 1)
+    # First sample of each row group, never splitting a sample's rows across row groups
+    group_starts = np.unique(np.searchsorted(np.cumsum(rows), np.arange(0, rows.sum(), row_group_size), side="right"))
+    bounds = np.append(group_starts, scale.store_samples)
+    num_rows = 0
+    tmp_filename = filename + ".tmp"
+    with pq.ParquetWriter(tmp_filename, SCHEMA, compression="zstd") as writer:
+        for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            group_rows = rows[first:last]
+            sample_idx = np.repeat(np.arange(last - first, dtype=np.int32), group_rows)
+            row_starts = np.cumsum(group_rows) - group_rows
+            within = np.arange(len(sample_idx)) - np.repeat(row_starts, group_rows)
+            valid = within < lengths[first:last][sample_idx]
+            mutation_idx = np.minimum(offsets[sample_haplotypes[first:last]][sample_idx] + within, len(positions) - 1)
+            table = pa.Table.from_arrays(
+                [
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(sample_idx), pa.array([f"sample_{i}" for i in range(first, last)])
+                    ),
+                    pa.array(positions[mutation_idx], mask=~valid),
+                    dictionary_column(refs[mutation_idx], valid),
+                    dictionary_column(alts[mutation_idx], valid),
+                ],
+                schema=SCHEMA,
+            )
+            writer.write_table(table, row_group_size=len(table))
+            num_rows += len(table)
+    os.replace(tmp_filename, filename)
+    return num_rows
+
+
+def write_pyro_mutations(filename, haplotypes, refseq, rng):
+    """
+    Write the PyR0 'mutations.tsv' file, ranking a random subset of the amino acid mutations found in
+    the haplotypes by a random Δlog R.
+
+    Returns
+    ----------
+    int
+        The number of ranked amino acid mutations.
+    """
+    _, positions, _, alts = haplotypes
+    sites = np.unique(positions.astype(np.int64) << 8 | alts)
+    translator = AATranslator(refseq)
+    aa_mutations = translator.translate_batch(np.zeros(len(sites), dtype=np.int64), sites >> 8, sites & 0xFF)
+    mutations = sorted(set(translator.format_mutations(aa_mutations)))
+    ranked = rng.choice(mutations, int(len(mutations) * SCORED_FRACTION), replace=False).tolist()
+    delta_log_r = np.sort(rng.normal(0.0, 0.1, len(ranked)))[::-1]
+    stddev = rng.uniform(0.005, 0.05, len(ranked))
+    with open(filename, "w") as f:
+        f.write("rank\tmutation\tmean/stddev\tmean\tΔ log R\tstddev\n")
+        for rank, (mutation, mean, sd) in enumerate(zip(ranked, delta_log_r.tolist(), stddev.tolist()), start=1):
+            f.write(f"{rank}\t{mutation}\t{mean / sd}\t{mean}\t{mean}\t{sd}\n")
+    return len(ranked)
+
+
+def write_case_counts(filename, rng, num_regions=200):
+    """
+    Write the JHU case counts file, with cumulative confirmed cases at the end of each month.
+    """
+    dates = month_end_dates((2020, 1), (2023, 2))
+    new_cases = rng.integers(0, 500_000, (num_regions, len(dates)))
+    cumulative = np.cumsum(new_cases, axis=1)
+    columns = {
+        "Province/State": [""] * num_regions,
+        "Country/Region": [f"Region {i}" for i in range(num_regions)],
+        "Lat": rng.uniform(-60, 70, num_regions),
+        "Long": rng.uniform(-180, 180, num_regions),
+    }
+    columns.update({date: cumulative[:, i] for i, date in enumerate(dates)})
+    pl.DataFrame(columns).write_csv(filename)
+
+
+def write_genetic_diversity(filename, rng):
+    """
+    Write the standing genetic diversity file, with a score for each month.
+    """
+    months = ["2020-01"] + MONTHS
+    pl.DataFrame({"Month": months, "Diversity": np.round(rng.uniform(20, 80, len(months)), 3)}).write_csv(filename)
+
+
+def write_config(dataset_dir, data_dir):
+    """
+    Write the dataset's 'config.yaml', the repository's config with the dataset's data directory.
+    """
+    with open(os.path.join(REPO_DIR, "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    # Absolute, so the config can be loaded from any directory
+    config["DATA_DIR"] = os.path.abspath(data_dir)
+    with open(os.path.join(dataset_dir, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+
+def load_manifest(dataset_dir):
+    """
+    Load the manifest of a generated dataset, None if the dataset was not (completely) generated.
+    """
+    path = os.path.join(dataset_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def generate(dataset_dir, scale, seed=0):
+    """
+    Generate a synthetic dataset, unless the directory already holds the dataset of the same scale and seed.
+
+    Parameters
+    ----------
+    dataset_dir: str
+        The directory to write the dataset ('config.yaml' and 'data' directory) to.
+
+    scale: Scale
+        The size of each input.
+
+    seed: int (Optional)
+        The seed of the random generator.
+
+    Returns
+    ----------
+    Dict
+        The dataset's manifest, with its scale, seed and the size of each input.
+    """
+    params = {"version": GENERATOR_VERSION, "scale": vars(scale), "seed": seed}
+    manifest = load_manifest(dataset_dir)
+    if manifest is not None and manifest["params"] == params:
+        print("Using existing synthetic dataset: ", dataset_dir)
+        return manifest
+
+    print("Generating synthetic dataset: ", dataset_dir)
+    data_dir = os.path.join(dataset_dir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    manifest_path = os.path.join(dataset_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    write_config(dataset_dir, data_dir)
+    config = Config(os.path.join(dataset_dir, "config.yaml"))
+    shutil.copyfile(os.path.join(REPO_DIR, "data", "reference.fasta"), config.reference_filepath)
+    refseq = load_reference_sequence_modified(data_dir, "reference.fasta")
+    rng = np.random.default_rng(seed)
+
+    write_chronumental_dates(config.CHRONUMENTAL_FILE, scale, rng)
+    trio_nodes = write_rivet_results(config.RIVET_RESULTS_FILE, scale, rng)
+    num_mutations = write_trio_vcf(config.RIVET_VCF_FILE, trio_nodes, refseq, scale, rng)
+    write_trios_fitness(config.fitness_results_path, trio_nodes, num_mutations, rng)
+    haplotypes = make_haplotypes(refseq, scale, rng)
+    store_rows = write_sample_mutations(config.sample_mutations_path, haplotypes, scale, rng)
+    ranked_mutations = write_pyro_mutations(config.PYRO_MUTATIONS_FILE, haplotypes, refseq, rng)
+    write_case_counts(config.CASES_FILE, rng)
+    write_genetic_diversity(config.GENETIC_DIVERSITY_FILE, rng)
+
+    manifest = {
+        "params": params,
+        "sizes": {
+            "chronumental_rows": scale.chronumental_rows,
+            "rivet_rows": scale.rivet_rows,
+            "trio_nodes": len(trio_nodes),
+            "store_samples": scale.store_samples,
+            "store_rows": store_rows,
+            "ranked_mutations": ranked_mutations,
+        },
+    }
+    # Written last, marking the dataset as complete
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic data pipeline inputs for benchmarking.")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="Size of the inputs.")
+    parser.add_argument("--out", required=True, help="Directory to write the dataset to.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    manifest = generate(args.out, SCALES[args.scale], args.seed)
+    print(json.dumps(manifest["sizes"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+In-memory cache of the figure data files as Polars data frames.
+
+Each data file (eg. 'rivet_recombs_data.csv', 'monthly_fitness_stats.csv' or a node TSV) is read once and
+held in memory, shared by every panel built from it, and is only read again after the file is modified.
+"""
+
+import threading
+import polars as pl
+
+from file_stamps import file_stamp
+
+
+class DatasetCache:
+    """
+    Thread-safe cache of data files read into Polars data frames, invalidated by the file's stamp.
+    """
+
+    def __init__(self):
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def get(self, path, raw=False):
+        """
+        Get the data frame of a CSV or TSV (.tsv) data file, reading it only if it changed since last read.
+
+        Parameters
+        ----------
+        path: str
+            The path to the data file.
+
+        raw: bool (Optional)
+            Read every column as strings, with missing values as empty strings, as done by d3.csv().
+
+        Returns
+        ----------
+        pl.DataFrame
+            The data file's data frame.
+        """
+        key = (path, raw)
+        stamp = file_stamp(path)
+        with self.lock:
+            cached = self.frames.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        separator = "\t" if path.endswith(".tsv") else ","
+        if raw:
+            df = pl.read_csv(path, separator=separator, infer_schema=False).with_columns(pl.all().fill_null(""))
+        else:
+            df = pl.read_csv(path, separator=separator)
+        with self.lock:
+            self.frames[key] = (stamp, df)
+        return df
@@ -0,0 +1,306 @@
+"""
+Flask blueprint serving precomputed per-panel aggregates of the figure data files.
+
+Instead of downloading and parsing whole data files (eg. 'rivet_recombs_data.csv') with d3 in the browser,
+each panel requests '/data/<figure>/<panel>', which returns only what the panel draws: histogram bins,
+per month values, or the scatter plot columns. The response is column-oriented JSON (the default), or an
+Arrow IPC stream with '?format=arrow'. The figure's data files themselves are served the same way from
+'/data/<figure>/files/<filename>', with every column as strings, like d3.csv() and d3.tsv(). Responses are
+built once per version of their source files (held in memory, see 'datasets.py'), and are served with an
+ETag (answered with 304 Not Modified when unchanged), gzip compressed when accepted.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import threading
+import numpy as np
+import polars as pl
+import polars.selectors as cs
+import pyarrow as pa
+from flask import Blueprint, Response, abort, request
+
+from datasets import DatasetCache
+from file_stamps import file_stamp
+from weighted_stats import SUBSTITUTION_SCORE_COL, substitution_weights, weighted_histogram
+
+# The figures directory, holding each figure's 'static/data' directory
+FIGURES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Directory of each figure, relative to the figures directory
+FIGURE_DIRS = {
+    "figure1": "figure1",
+    "figure2": "figure2",
+    "figure3": "figure3",
+    "figure4": "figure4",
+    "s2": "supplemental/s2",
+    "s3": "supplemental/s3",
+    "s4": "supplemental/s4",
+}
+# Data files that can be served whole
+DATA_FILE_EXTENSIONS = (".csv", ".tsv")
+DATA_FORMATS = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+def d3_thresholds(start, end, width):
+    """
+    The histogram bin thresholds used by the figures, as computed in JS by:
+        d3.range(start + width, end + width, width).map((val) => roundTo(val, 2))
+    """
+    first, stop = start + width, end + width
+    num = max(0, math.ceil((stop - first) / width))
+    # Math.round rounds halves up
+    return [math.floor((first + i * width) * 100 + 0.5) / 100 for i in range(num)]
+
+
+def histogram_bins(values, start, end, width, weights=None):
+    """
+    Bin values into a histogram, as done by d3.bin() with domain [start, end] and the 'd3_thresholds'.
+
+    Parameters
+    ----------
+    values: pl.Series
+        The values to bin, null, NaN and out of domain values are dropped.
+
+    start: float
+        The start of the histogram domain.
+
+    end: float
+        The end of the histogram domain.
+
+    width: float
+        The width of each bin.
+
+    weights: pl.Series (Optional)
+        The weight of each value, each value counts once if not given.
+
+    Returns
+    ----------
+    pl.DataFrame
+        The lower bound (x0), upper bound (x1) and count of each bin.
+    """
+    thresholds = [t for t in d3_thresholds(start, end, width) if start < t <= end]
+    x = values.cast(pl.Float64).to_numpy()
+    w = np.ones(len(x)) if weights is None else weights.cast(pl.Float64).to_numpy()
+    counts = weighted_histogram(x, w, start, end, thresholds)
+    if weights is None or weights.dtype.is_integer():
+        counts = counts.astype(np.int64)
+    return pl.DataFrame(
+        {
+            "x0": [start] + thresholds,
+            "x1": thresholds + [end],
+            "count": counts,
+        }
+    )
+
+
+def data_path(figures_dir, figure, filename):
+    """
+    The path to a data file in a figure's 'static/data' directory.
+    """
+    return os.path.join(figures_dir, FIGURE_DIRS[figure], "static", "data", filename)
+
+
+class Panel:
+    """
+    The data of a figure panel, aggregated from one or more of the figure's data files.
+    """
+
+    def __init__(self, sources, build, raw=False):
+        """
+        Parameters
+        ----------
+        sources: List[str]
+            The data files the panel is built from, within the figure's 'static/data' directory.
+
+        build: Callable[..., pl.DataFrame]
+            Builds the panel data from the data frame of each source file.
+
+        raw: bool (Optional)
+            Read the source files with every column as strings, see 'DatasetCache.get'.
+        """
+        self.sources = sources
+        self.build = build
+        self.raw = raw
+
+
+def select_columns(*columns):
+    """
+    Build function of a panel that draws the given columns of its data file.
+    """
+    return lambda df: df.select(columns)
+
+
+def first_by_month(*columns):
+    """
+    Build function of a panel that draws per month values, repeated on every row of the month.
+    """
+    return lambda df: df.group_by("Month", maintain_order=True).agg(pl.col(columns).first())
+
+
+PANELS = {
+    ("figure1", "panelb"): Panel(
+        ["rivet_recombs_data.csv"],
+        first_by_month("Infections", "DiversityScore", "NumRecombsDetectedByMonth"),
+    ),
+    ("figure2", "panela"): Panel(
+        ["rivet_recombs_data.csv"],
+        select_columns("Month", "LnScore", "UShERClusterSize"),
+    ),
+    ("figure2", "panelb"): Panel(
+        ["pango_recombs_cluster_sizes.csv"],
+        select_columns("Month", "LogScore", "UShERClusterSize"),
+    ),
+    ("figure3", "panela"): Panel(
+        ["snp_histogram.csv"],
+        lambda df: histogram_bins(df[SUBSTITUTION_SCORE_COL], 0.0, 1.8, 0.05, weights=substitution_weights(df)),
+    ),
+    ("figure3", "panelb"): Panel(
+        ["rivet_recombs_data.csv"],
+        select_columns("Month", "Score", "RecombFitnessNormalizedByMaxParents", "ParentsHD", "DiversityScore"),
+    ),
+    ("figure3", "panelc"): Panel(
+        ["rivet_recombs_data.csv"],
+        select_columns(
+            "Month",
+            "Score",
+            "RecombFitnessNormalizedByMaxParents",
+            "DonorFitness",
+            "AcceptorFitness",
+            "ParentsHD",
+            "DiversityScore",
+        ),
+    ),
+    ("figure3", "paneld"): Panel(
+        ["recomb_fitness_normalized.csv"],
+        lambda df: histogram_bins(df["NormFitness"], -10.0, 10.0, 0.5),
+    ),
+    ("s2", "panelb"): Panel(
+        ["covfit_data.csv"],
+        select_columns("Month", "Score", "RecombFitnessNormalizedByMaxParents", "ParentsHD", "DiversityScore"),
+    ),
+}
+
+
+def source_etag(key, data_format, paths):
+    """
+    ETag of a panel's data, changing whenever any of its source files change.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([list(key), data_format]).encode("utf-8"))
+    for path in paths:
+        stamp = file_stamp(path)
+        h.update(f"{path}:{stamp['mtime_ns']}:{stamp['size']}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def serialize(df, data_format):
+    """
+    Serialize panel data as column-oriented JSON (with NaN as null) or an Arrow IPC stream.
+    """
+    if data_format == "arrow":
+        table = df.to_arrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    df = df.with_columns(cs.float().fill_nan(None))
+    return json.dumps(df.to_dict(as_series=False), separators=(",", ":")).encode("utf-8")
+
+
+class PanelDataCache:
+    """
+    In-memory cache of the serialized (and gzipped) data of each panel, keyed by its ETag.
+    """
+
+    def __init__(self, figures_dir, datasets):
+        self.figures_dir = figures_dir
+        self.datasets = datasets
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, panel, data_format):
+        """
+        Get the ETag, body and gzipped body (None if too small to compress) of a panel's data.
+        """
+        figure = key[0]
+        paths = [data_path(self.figures_dir, figure, source) for source in panel.sources]
+        etag = source_etag(key, data_format, paths)
+        with self.lock:
+            entry = self.entries.get((key, data_format))
+        if entry is not None and entry[0] == etag:
+            return entry
+        frames = [self.datasets.get(path, raw=panel.raw) for path in paths]
+        body = serialize(panel.build(*frames), data_format)
+        gzipped = gzip.compress(body, mtime=0) if len(body) >= GZIP_MIN_SIZE else None
+        entry = (etag, body, gzipped)
+        with self.lock:
+            self.entries[(key, data_format)] = entry
+        return entry
+
+
+def panel_data_blueprint(figures_dir=FIGURES_DIR, datasets=None):
+    """
+    Create the blueprint serving '/data/<figure>/<panel>' for the panels in 'PANELS', and
+    '/data/<figure>/files/<filename>' for the figures' data files.
+
+    Parameters
+    ----------
+    figures_dir: str (Optional)
+        The figures directory.
+
+    datasets: DatasetCache (Optional)
+        The in-memory data files to build the panels from, a new cache if not given.
+
+    Returns
+    ----------
+    Blueprint
+        The panel data blueprint, to register with the figure server's Flask app.
+    """
+    blueprint = Blueprint("panel_data", __name__)
+    cache = PanelDataCache(figures_dir, datasets if datasets is not None else DatasetCache())
+
+    @blueprint.route("/data/<figure>/<panel>")
+    def panel_data(figure, panel):
+        key = (figure, panel)
+        if key not in PANELS:
+            abort(404, description=f"No data for panel: '{figure}/{panel}'")
+        return respond(key, PANELS[key])
+
+    @blueprint.route("/data/<figure>/files/<filename>")
+    def data_file(figure, filename):
+        if figure not in FIGURE_DIRS or not filename.endswith(DATA_FILE_EXTENSIONS):
+            abort(404, description=f"No data file: '{figure}/{filename}'")
+        return respond((figure, "files/" + filename), Panel([filename], lambda df: df, raw=True))
+
+    def respond(key, panel):
+        data_format = request.args.get("format", "json")
+        if data_format not in DATA_FORMATS:
+            abort(400, description="Data format must be one of: {}".format(list(DATA_FORMATS)))
+        try:
+            etag, body, gzipped = cache.get(key, panel, data_format)
+        except FileNotFoundError as e:
+            abort(404, description=f"Data file not found: '{e.filename}'")
+
+        response = Response(mimetype=DATA_FORMATS[data_format])
+        response.set_etag(etag)
+        # Browsers revalidate with the ETag before reusing their cached copy
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            return response
+        if gzipped is not None and request.accept_encodings["gzip"]:
+            response.set_data(gzipped)
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response.set_data(body)
+        return response
+
+    return blueprint
@@ -0,0 +1,214 @@
+"""
+Cache of the rendered (SVG/PNG) figure panels, keyed by the content hash of each panel's inputs.
+
+A panel is rendered once per version of its inputs (data files, template, scripts) and the cached
+artifact is reused until any of them change. Browser (d3) panels are rendered by loading the panel's
+page from the figure server in a headless browser (Playwright's Chromium), and Python panels by
+calling the 'plot' function of their script, eg) 'figure1/correlation_square.py'.
+"""
+
+import glob
+import hashlib
+import importlib.util
+import os
+import threading
+
+from file_stamps import file_fingerprint
+
+# The figures directory
+FIGURES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RENDER_CACHE_DIR = os.path.join(FIGURES_DIR, "render_cache")
+RENDER_FORMATS = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+# Device pixel ratio of rendered PNGs
+PNG_SCALE = 4
+# Time (ms) allowed for a page to load and draw its panel
+PAGE_TIMEOUT = 120_000
+
+
+class PythonPanel:
+    """
+    A panel plotted by the 'plot(*inputs, save_as, fmt)' function of a Python script.
+    """
+
+    def __init__(self, script, inputs):
+        """
+        Parameters
+        ----------
+        script: str
+            The script, relative to the figures directory.
+
+        inputs: List[str]
+            The data files passed to 'plot', relative to the figures directory.
+        """
+        self.script = script
+        self.inputs = inputs
+
+
+PYTHON_PANELS = {
+    ("figure1", "panelc"): PythonPanel(
+        "figure1/correlation_square.py", ["figure1/static/data/panelc-stats.csv"]
+    ),
+}
+
+
+def content_hash(paths):
+    """
+    Hash of the contents of the given files and (recursively) directories.
+
+    Parameters
+    ----------
+    paths: List[str]
+        The input files and directories.
+
+    Returns
+    ----------
+    str
+        The hex digest.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        if os.path.isdir(path):
+            files = [
+                os.path.join(root, name)
+                for root, dirs, names in os.walk(path)
+                if "__pycache__" not in root
+                for name in names
+            ]
+        else:
+            files = [path]
+        for file in sorted(files):
+            h.update(f"{os.path.relpath(file, path)}:{file_fingerprint(file)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def page_inputs(figures_dir, figure_dir, page):
+    """
+    The inputs of a browser panel: its template, the figure's static files (scripts and data files)
+    and the shared figure server modules, including those shared with the analysis.
+    """
+    return [
+        os.path.join(figures_dir, figure_dir, "templates", page),
+        os.path.join(figures_dir, figure_dir, "static"),
+        os.path.join(figures_dir, "common"),
+        os.path.join(os.path.dirname(figures_dir), "notebooks", "weighted_stats.py"),
+    ]
+
+
+def python_panel_inputs(figures_dir, panel):
+    """
+    The inputs of a Python panel: its data files and script.
+    """
+    return [os.path.join(figures_dir, path) for path in panel.inputs + [panel.script]]
+
+
+def render_page(url, save_as, fmt):
+    """
+    Render the panel (the first SVG element) of a figure page in a headless browser.
+
+    Parameters
+    ----------
+    url: str
+        The URL of the page on the figure server.
+
+    save_as: str
+        The path to write the rendered panel to.
+
+    fmt: str
+        The format to render, "svg" or "png".
+    """
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        page = browser.new_page(device_scale_factor=PNG_SCALE if fmt == "png" else 1)
+        page.goto(url, wait_until="networkidle", timeout=PAGE_TIMEOUT)
+        svg = page.locator("svg").first
+        svg.locator("*").first.wait_for(timeout=PAGE_TIMEOUT)
+        if fmt == "svg":
+            markup = svg.evaluate(
+                """(el) => {
+                  el.setAttribute("xmlns", "http://www.w3.org/2000/svg");
+                  return new XMLSerializer().serializeToString(el);
+                }"""
+            )
+            with open(save_as, "w") as f:
+                f.write('<?xml version="1.0" encoding="utf-8"?>\n' + markup)
+        else:
+            svg.screenshot(path=save_as, type="png")
+        browser.close()
+
+
+# matplotlib's pyplot state is not thread-safe
+_PLOT_LOCK = threading.Lock()
+
+
+def render_python_panel(figures_dir, panel, save_as, fmt):
+    """
+    Render a Python panel by calling its script's 'plot' function.
+    """
+    script = os.path.join(figures_dir, panel.script)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(script))[0], script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    inputs = [os.path.join(figures_dir, path) for path in panel.inputs]
+    with _PLOT_LOCK:
+        module.plot(*inputs, save_as, fmt)
+
+
+class RenderCache:
+    """
+    Directory of rendered panels, named '<figure>_<panel>-<input hash>.<format>'.
+    """
+
+    def __init__(self, cache_dir=RENDER_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def artifact_path(self, name, digest, fmt):
+        return os.path.join(self.cache_dir, f"{name}-{digest}.{fmt}")
+
+    def get(self, name, inputs, fmt, render):
+        """
+        Get the rendered panel for the current inputs, rendering it if not cached.
+
+        Parameters
+        ----------
+        name: str
+            The panel's name, eg) "figure3_panelb".
+
+        inputs: List[str]
+            The files and directories the panel is rendered from.
+
+        fmt: str
+            The format, "svg" or "png".
+
+        render: Callable[[str, str], None]
+            Renders the panel to the given path, in the given format.
+
+        Returns
+        ----------
+        str
+            The path to the rendered panel.
+        """
+        path = self.artifact_path(name, content_hash(inputs), fmt)
+        if os.path.exists(path):
+            return path
+        with self.lock:
+            lock = self.locks.setdefault((name, fmt), threading.Lock())
+        with lock:
+            if os.path.exists(path):
+                return path
+            print("Rendering panel: ", os.path.basename(path))
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            render(tmp_path, fmt)
+            os.replace(tmp_path, path)
+            # Discard the renders of previous versions of the inputs
+            for stale in glob.glob(self.artifact_path(name, "*", fmt)):
+                if stale != path:
+                    os.remove(stale)
+        return path
@@ -0,0 +1,117 @@
+"""
+Script to batch export every figure panel as SVG and/or PNG, rendering the panels in parallel worker
+processes through the render cache (see 'common/render_cache.py'). Only panels whose inputs changed
+since the last export are rendered again.
+
+The browser panels are rendered in headless Chromium, which can be installed with:
+    pixi run --environment render-env playwright install chromium
+
+Usage:
+    python3 figures/export.py [--out figures/export] [--formats svg png] [--workers 4]
+"""
+
+import argparse
+import os
+import shutil
+import threading
+from multiprocessing import Pool
+from werkzeug.serving import make_server
+
+from server import FIGURES_DIR, create_app, figure_pages, render_panel
+from panel_data import FIGURE_DIRS
+from render_cache import PYTHON_PANELS, RENDER_FORMATS, RenderCache
+
+DEFAULT_OUT_DIR = os.path.join(FIGURES_DIR, "export")
+
+# Per process state used to render panels, set by 'init_export_worker'
+_EXPORT_STATE = {}
+
+
+def init_export_worker(server_url, out_dir):
+    """
+    Set up the state needed by 'export_panel' in the current (worker) process.
+    """
+    _EXPORT_STATE["render_cache"] = RenderCache()
+    _EXPORT_STATE["server_url"] = server_url
+    _EXPORT_STATE["out_dir"] = out_dir
+
+
+def export_panel(task):
+    """
+    Render a panel (or get it from the render cache) and copy it to the output directory.
+
+    Parameters
+    ----------
+    task: Tuple[str, str, str]
+        The figure, panel and format to export.
+
+    Returns
+    ----------
+    str
+        The path to the exported panel.
+    """
+    figure, panel, fmt = task
+    cached = render_panel(
+        _EXPORT_STATE["render_cache"], FIGURES_DIR, figure, panel, fmt, _EXPORT_STATE["server_url"]
+    )
+    out_path = os.path.join(_EXPORT_STATE["out_dir"], f"{figure}_{panel}.{fmt}")
+    shutil.copyfile(cached, out_path)
+    return out_path
+
+
+def export_tasks(formats):
+    """
+    The (figure, panel, format) of every panel to export, skipping Python panels missing their data.
+    """
+    panels = [
+        (figure, os.path.splitext(page)[0]) for figure in FIGURE_DIRS for page in figure_pages(FIGURES_DIR, figure)
+    ]
+    for (figure, panel), python_panel in PYTHON_PANELS.items():
+        missing = [path for path in python_panel.inputs if not os.path.exists(os.path.join(FIGURES_DIR, path))]
+        if missing:
+            print(f"Skipping panel '{figure}/{panel}', input not found: ", missing[0])
+            continue
+        panels.append((figure, panel))
+    return [(figure, panel, fmt) for figure, panel in panels for fmt in formats]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export all the figure panels as SVG and/or PNG files.")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="Directory to write the exported panels to.")
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=list(RENDER_FORMATS),
+        default=["svg", "png"],
+        help="Formats to export.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes rendering the panels.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    # Serve the figure pages to the headless browsers from a local figure server
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server_url = f"http://127.0.0.1:{server.server_port}/"
+
+    tasks = export_tasks(args.formats)
+    print(f"Exporting {len(tasks)} panels with {args.workers} workers.")
+    try:
+        with Pool(args.workers, initializer=init_export_worker, initargs=(server_url, args.out)) as pool:
+            for out_path in pool.imap_unordered(export_panel, tasks):
+                print("Exported: ", out_path)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
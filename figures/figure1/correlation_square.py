@@ -2,6 +2,7 @@
 Script to plot the Pearson correlation matrix for Figure 1 Panel c,
 comparing the number of detectable recombinant lineages,
 the standing genetic diversity, and the number of infections.
+The plot is only rendered again when the data file (or this script) changes, see 'common/render_cache.py'.
 """
 
 from string import ascii_letters
@@ -10,14 +11,23 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import argparse
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+# Modules shared with the analysis, eg) 'file_stamps.py'
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "notebooks"))
+from render_cache import RENDER_FORMATS, RenderCache
 
 # Plot settings
 sns.set_theme(style="white")
 sns.set(font_scale=1.5)
-SAVE_AS = "panelc.svg"
+# Default output file name, with the extension of the plot format
+SAVE_AS = "panelc"
 
 
-def plot(filename, save_as):
+def plot(filename, save_as, fmt="svg"):
     """
     Plot a Pearson correlation matrix using Seaborn heatmap.
 
@@ -27,7 +37,10 @@ def plot(filename, save_as):
         The input data file (CSV) containing the recombinant lineage, diversity and infections data.
 
     save_as: str
-        The name of the file (.svg) to save the plot as.
+        The name of the file to save the plot as.
+
+    fmt: str (Optional)
+        The format to save the plot as, "svg" or "png".
     """
     df = pd.read_csv(filename)
     df = df.drop(columns="Month")
@@ -49,7 +62,8 @@ def plot(filename, save_as):
         linewidths=0.5,
         cbar_kws={"shrink": 0.5},
     )
-    f.savefig(save_as, format="svg", dpi=1200)
+    f.savefig(save_as, format=fmt, dpi=1200)
+    plt.close(f)
 
 
 def main():
@@ -57,8 +71,20 @@ def main():
         description="Script to create Pearson correlation matrix plot for Figure 1 Panel c."
     )
     parser.add_argument("--stats", "-s", required=True, help="Path to data (CSV) file.")
+    parser.add_argument(
+        "--output", "-o", help=f"Path to save the plot to, '{SAVE_AS}.<format>' by default."
+    )
+    parser.add_argument("--format", choices=list(RENDER_FORMATS), default="svg", help="Format of the plot.")
     args = parser.parse_args()
-    plot(args.stats, SAVE_AS)
+    output = args.output or f"{SAVE_AS}.{args.format}"
+    cached = RenderCache().get(
+        "figure1_panelc",
+        [args.stats, os.path.abspath(__file__)],
+        args.format,
+        lambda save_as, fmt: plot(args.stats, save_as, fmt),
+    )
+    shutil.copyfile(cached, output)
+    print("Plot saved to: ", output)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
 
+import { loadPanelData } from "./util.js";
+
 // Helper function to aggregate monthly data
 function aggregateData(data) {
   let cases_by_month = new Map();
@@ -19,7 +21,7 @@ function aggregateData(data) {
 }
 
 export async function panelb(svg, config) {
-  const data = await d3.csv(config["recombFilename"]);
+  const data = await loadPanelData(config["recombDataUrl"]);
 
   // Constants
   const height = config["height"];
@@ -115,6 +115,19 @@ function csvToArray(data, columnName, castAs) {
   return arr;
 }
 
+// Fetch a panel's data from the figure server ('/data/<figure>/<panel>'),
+// as an array of row objects like those returned by d3.csv()
+async function loadPanelData(url) {
+  const columns = await d3.json(url);
+  const names = Object.keys(columns);
+  const numRows = names.length > 0 ? columns[names[0]].length : 0;
+  return d3
+    .range(numRows)
+    .map((i) =>
+      Object.fromEntries(names.map((name) => [name, columns[name][i]])),
+    );
+}
+
 function csvToMap(data, key, value, castValueAs) {
   // Assumes that key is a string
   let map = new Map();
@@ -189,6 +202,7 @@ export { YEARS, MONTHS, QUARTERS };
 export {
   getMonthsCollection,
   csvToArray,
+  loadPanelData,
   csvToMap,
   getUniqueValues,
   replaceNaNwithZero,
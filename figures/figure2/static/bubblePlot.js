@@ -1,4 +1,4 @@
-import { csvToArray, getMonthsCollection } from "./util.js";
+import { csvToArray, getMonthsCollection, loadPanelData } from "./util.js";
 import { bindAxis, addCurve, addArea, addLegend } from "./plotUtil.js";
 
 async function bubblePlot(svg, config) {
@@ -51,8 +51,8 @@ async function bubblePlot(svg, config) {
   const HALF = 2;
   const BUBBLE_OPACITY = 0.8;
 
-  const statData = await d3.csv(config["statsFilename"]);
-  const data = await d3.csv(config["filename"]);
+  const statData = await loadPanelData(config["statsDataUrl"]);
+  const data = await loadPanelData(config["dataUrl"]);
 
   // Fitness scores (y-axis)
   let scores = csvToArray(data, CY_VAR, parseFloat);
@@ -1,16 +1,4 @@
-import { getMonthsCollection, minMaxValueFromColumn, roundTo } from "./util.js";
-
-function aggregate_scores(data) {
-  let snv_fitness_scores = [];
-  data.forEach((d) => {
-    const score = parseFloat(d["PyRoScore"]);
-    const occ = parseInt(d["Occurrence"]);
-    for (let i = 0; i < occ; ++i) {
-      snv_fitness_scores.push(score);
-    }
-  });
-  return snv_fitness_scores;
-}
+import { getMonthsCollection, loadPanelData } from "./util.js";
 
 async function histogram(svg, config) {
   // Plot Constants
@@ -31,32 +19,11 @@ async function histogram(svg, config) {
   // only considering 2020-02 to 2023-02
   YEAR_MONTH.shift();
 
-  // Get input recomb data and statistics data
-  const data = await d3.csv(config["filename"]);
-
-  const [minScore, maxScore] = minMaxValueFromColumn(
-    data,
-    config["Score"],
-    parseFloat,
-  );
-  const snv_scores = aggregate_scores(data);
-  const MAX_SCORE = d3.max(snv_scores);
-
-  // Histogram bins constants
-  const binWidth = 0.05;
+  // Histogram domain, SNV scores are binned (weighted by occurrence) by the figure server
   const domainStart = 0.0;
   const domainEnd = 1.8;
-  const thresholds = d3
-    .range(domainStart + binWidth, domainEnd + binWidth, binWidth)
-    .map((val) => roundTo(val, 2));
-
-  let histogram = d3
-    .bin()
-    .domain([domainStart, domainEnd])
-    .thresholds(thresholds);
-
-  let bins = histogram(snv_scores);
-  const maxBinCount = d3.max(bins, (bin) => bin.length);
+  const bins = await loadPanelData(config["dataUrl"]);
+  const maxBinCount = d3.max(bins, (bin) => bin.count);
 
   // Define axes
   const y = d3
@@ -79,9 +46,9 @@ async function histogram(svg, config) {
     .data(bins)
     .join("rect")
     .attr("x", (d) => x(d.x0) + 1)
-    .attr("y", (d) => y(d.length))
+    .attr("y", (d) => y(d.count))
     .attr("width", (d) => Math.max(0, x(d.x1) - x(d.x0) - BAR_PADDING))
-    .attr("height", (d) => y(0) - y(d.length))
+    .attr("height", (d) => y(0) - y(d.count))
     .attr("fill", "#90EE90");
 
   svg
@@ -1,4 +1,4 @@
-import { roundTo } from "./util.js";
+import { loadPanelData } from "./util.js";
 
 async function histogram(svg, config) {
   // Constants
@@ -11,13 +11,12 @@ async function histogram(svg, config) {
   const SCATTER_RADIUS = 5.0;
   const SHIFT_POINTS_RIGHT = width / 2;
   const BAR_PADDING = 2;
-  const binWidth = config["histConfig"].binWidth;
   const domainStart = config["histConfig"].domainStart;
   const domainEnd = config["histConfig"].domainEnd;
 
   // Get input recomb data and statistics data
-  const statsData = await d3.csv(config["statsFilename"]);
-  const data = await d3.csv(config["filename"]);
+  const statsData = await loadPanelData(config["statsDataUrl"]);
+  const bins = await loadPanelData(config["dataUrl"]);
 
   // Format monthly statistics values
   let statLookup = {};
@@ -38,18 +37,8 @@ async function histogram(svg, config) {
     .domain([domainStart, domainEnd])
     .range([0, SCATTER_WIDTH]);
 
-  const thresholds = d3
-    .range(domainStart + binWidth, domainEnd + binWidth, binWidth)
-    .map((val) => roundTo(val, 2));
-
-  let histogram = d3
-    .bin()
-    .value((d) => parseFloat(d[config["Score"]]))
-    .domain([domainStart, domainEnd])
-    .thresholds(thresholds);
-
-  let bins = histogram(data);
-  const [minCount, maxCount] = d3.extent(bins.map((d) => d.length));
+  // Bins of the normalized fitness scores, binned by the figure server
+  const [minCount, maxCount] = d3.extent(bins.map((d) => d.count));
 
   // y-axis max value buffer
   const OCC_BUFFER = 10;
@@ -71,13 +60,13 @@ async function histogram(svg, config) {
       return x(d.x0);
     })
     .attr("y", (d) => {
-      return y(d.length);
+      return y(d.count);
     })
     .attr("width", (d) => {
       return Math.max(0, x(d.x1) - x(d.x0) - BAR_PADDING);
     })
     .attr("height", (d) => {
-      return height - y(d.length);
+      return height - y(d.count);
     })
     .style("fill", "#87CEFA")
     .attr("stroke-width", 0.5)
@@ -0,0 +1,191 @@
+"""
+Figure server, serving every figure panel from a single process.
+
+Each figure's pages are served at '/<figure>/<page>' (eg. '/figure3/panelb.html', with the figure's static
+files under '/<figure>/static/'), and the panel data at '/data/...' (see 'common/panel_data.py'). The data
+files are read once into memory, shared by all the figures, and only read again when they change on disk.
+The rendered panels are served at '/render/<figure>/<panel>.<svg|png>' (eg. '/render/figure3/panelb.svg')
+from the render cache, rendered on first request for each version of their inputs (see
+'common/render_cache.py').
+The server runs under the waitress WSGI server, handling requests concurrently across threads.
+
+Usage:
+    python3 figures/server.py [--host 127.0.0.1] [--port 5000] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+from flask import Blueprint, Flask, abort, render_template, request, send_file
+from jinja2 import FileSystemLoader, PrefixLoader
+from waitress import serve
+
+FIGURES_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(FIGURES_DIR, "common"))
+# Shared with the analysis, eg) 'weighted_stats.py'
+sys.path.append(os.path.join(os.path.dirname(FIGURES_DIR), "notebooks"))
+from datasets import DatasetCache
+from panel_data import FIGURE_DIRS, panel_data_blueprint
+from render_cache import (
+    PYTHON_PANELS,
+    RENDER_FORMATS,
+    RenderCache,
+    page_inputs,
+    python_panel_inputs,
+    render_page,
+    render_python_panel,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 8
+
+
+def figure_pages(figures_dir, figure):
+    """
+    The pages (templates) of a figure.
+    """
+    templates_dir = os.path.join(figures_dir, FIGURE_DIRS[figure], "templates")
+    return sorted(page for page in os.listdir(templates_dir) if page.endswith(".html"))
+
+
+def render_panel(render_cache, figures_dir, figure, panel, fmt, server_url):
+    """
+    Get a rendered panel from the render cache, rendering it if its inputs changed.
+
+    Parameters
+    ----------
+    render_cache: RenderCache
+        The render cache.
+
+    figures_dir: str
+        The figures directory.
+
+    figure: str
+        The figure, eg) "figure3".
+
+    panel: str
+        The panel, a Python panel or the name of a figure page without '.html', eg) "panelb".
+
+    fmt: str
+        The format, "svg" or "png".
+
+    server_url: str
+        The URL of the figure server the browser panels' pages are loaded from.
+
+    Returns
+    ----------
+    str
+        The path to the rendered panel.
+    """
+    name = f"{figure}_{panel}"
+    if (figure, panel) in PYTHON_PANELS:
+        python_panel = PYTHON_PANELS[(figure, panel)]
+        return render_cache.get(
+            name,
+            python_panel_inputs(figures_dir, python_panel),
+            fmt,
+            lambda save_as, fmt: render_python_panel(figures_dir, python_panel, save_as, fmt),
+        )
+    url = f"{server_url.rstrip('/')}/{figure}/{panel}.html"
+    return render_cache.get(
+        name,
+        page_inputs(figures_dir, FIGURE_DIRS[figure], panel + ".html"),
+        fmt,
+        lambda save_as, fmt: render_page(url, save_as, fmt),
+    )
+
+
+def create_app(figures_dir=FIGURES_DIR, render_cache=None):
+    """
+    Create the figure server's Flask app.
+
+    Parameters
+    ----------
+    figures_dir: str (Optional)
+        The figures directory.
+
+    render_cache: RenderCache (Optional)
+        The cache of rendered panels, the default render cache directory if not given.
+
+    Returns
+    ----------
+    Flask
+        The figure server's app, a WSGI application.
+    """
+    app = Flask(__name__)
+    # Each figure's templates are rendered as '<figure>/<page>', since pages of different figures share names
+    app.jinja_loader = PrefixLoader(
+        {
+            figure: FileSystemLoader(os.path.join(figures_dir, figure_dir, "templates"))
+            for figure, figure_dir in FIGURE_DIRS.items()
+        }
+    )
+    pages = {figure: figure_pages(figures_dir, figure) for figure in FIGURE_DIRS}
+    render_cache = render_cache if render_cache is not None else RenderCache()
+
+    for figure, figure_dir in FIGURE_DIRS.items():
+        # Serve the figure's static files relative to its pages, as the pages import './static/...'
+        app.register_blueprint(
+            Blueprint(
+                figure,
+                __name__,
+                static_folder=os.path.join(figures_dir, figure_dir, "static"),
+                static_url_path="/static",
+                url_prefix="/" + figure,
+            )
+        )
+    app.register_blueprint(panel_data_blueprint(figures_dir, DatasetCache()))
+
+    @app.route("/")
+    def index():
+        links = [
+            f'<li><a href="/{figure}/{page}">{figure}/{page}</a></li>'
+            for figure in FIGURE_DIRS
+            for page in pages[figure]
+        ]
+        return "<!doctype html>\n<title>Figures</title>\n<ul>\n" + "\n".join(links) + "\n</ul>\n"
+
+    @app.route("/<figure>/<page>")
+    def figure_page(figure, page):
+        if page not in pages.get(figure, []):
+            abort(404, description=f"No figure page: '{figure}/{page}'")
+        return render_template(f"{figure}/{page}")
+
+    @app.route("/render/<figure>/<panel>.<fmt>")
+    def rendered_panel(figure, panel, fmt):
+        if (figure, panel) not in PYTHON_PANELS and panel + ".html" not in pages.get(figure, []):
+            abort(404, description=f"No figure panel: '{figure}/{panel}'")
+        if fmt not in RENDER_FORMATS:
+            abort(404, description="Render format must be one of: {}".format(list(RENDER_FORMATS)))
+        try:
+            path = render_panel(render_cache, figures_dir, figure, panel, fmt, request.host_url)
+        except FileNotFoundError as e:
+            abort(404, description=f"Panel input not found: '{e.filename}'")
+        return send_file(path, mimetype=RENDER_FORMATS[fmt], etag=True, conditional=True)
+
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve all the figure panels.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Host to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=DEFAULT_THREADS,
+        help="Number of threads handling requests.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app()
+    print(f"Serving figures at: http://{args.host}:{args.port}/")
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
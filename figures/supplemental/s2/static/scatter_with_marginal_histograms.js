@@ -1,6 +1,7 @@
 import {
   csvToArray,
   getMonthsCollection,
+  loadPanelData,
   minMaxValueFromColumn,
   roundTo,
   roundUpTo,
@@ -53,8 +54,8 @@ async function scatter(svg, config) {
   YEAR_MONTH.shift();
 
   // Get input recomb data and statistics data
-  const statsData = await d3.csv(config["statsFilename"]);
-  const recombData = await d3.csv(config["filename"]);
+  const statsData = await loadPanelData(config["statsDataUrl"]);
+  const recombData = await loadPanelData(config["dataUrl"]);
 
   // Format monthly statistics values
   let statLookup = {};
@@ -1,4 +1,9 @@
-import { csvToArray, replaceNaNwithZero, union } from "./util.js";
+import {
+  csvToArray,
+  loadPanelData,
+  replaceNaNwithZero,
+  union,
+} from "./util.js";
 import { fitnessHist } from "./fitnessHist.js";
 import {
   addMutationLabels,
@@ -34,9 +39,9 @@ async function track(svg, donorDataFile, acceptorDataFile, config) {
   let yPosUpdated = y_position;
 
   const informativeSitesFile = config["INFORMATIVE_SITES"];
-  const donorData = await d3.tsv(donorDataFile);
-  const acceptorData = await d3.tsv(acceptorDataFile);
-  const informativeSitesData = await d3.tsv(informativeSitesFile);
+  const donorData = await loadPanelData(donorDataFile);
+  const acceptorData = await loadPanelData(acceptorDataFile);
+  const informativeSitesData = await loadPanelData(informativeSitesFile);
 
   const informativeSites = csvToArray(informativeSitesData, "Sites", parseInt);
   let donorFitnessScores = csvToArray(donorData, Y_VAR, parseFloat);
@@ -165,6 +165,19 @@ function csvToArray(data, columnName, castAs) {
   return arr;
 }
 
+// Fetch a panel's data from the figure server ('/data/<figure>/<panel>'),
+// as an array of row objects like those returned by d3.csv()
+async function loadPanelData(url) {
+  const columns = await d3.json(url);
+  const names = Object.keys(columns);
+  const numRows = names.length > 0 ? columns[names[0]].length : 0;
+  return d3
+    .range(numRows)
+    .map((i) =>
+      Object.fromEntries(names.map((name) => [name, columns[name][i]])),
+    );
+}
+
 // TODO: Change to accept variable number of key-value pairs
 // ie) one pass over data
 function csvToMap(data, key, value, castValueAs) {
@@ -249,6 +262,7 @@ export {
   getMonthsCollection,
   getMonthsCollectionTest,
   csvToArray,
+  loadPanelData,
   csvToMap,
   getUniqueValues,
   replaceNaNwithZero,
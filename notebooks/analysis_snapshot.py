@@ -0,0 +1,115 @@
+"""
+On-disk snapshot of the datasets and derived tables of the 'analysis.ipynb' notebook.
+
+Each table is stored as an uncompressed Arrow IPC (Feather) file, recording the content hashes of the
+input files it was derived from. Reopening the notebook memory-maps the stored tables rather than
+reading and recomputing them, and a table is only rebuilt once the contents of one of its inputs change.
+Content hashes are only recomputed for inputs whose mtime or size changed since the table was written.
+Each table also records the version of its derivation (see 'AnalysisSnapshot.get'), so changing how one
+table is built only rebuilds that table.
+"""
+
+import json
+import os
+import polars as pl
+import pyarrow as pa
+
+from file_stamps import fingerprint_record
+
+SNAPSHOT_DIR = "analysis_snapshot"
+
+
+def input_fingerprints(paths, recorded=None):
+    """
+    Get the stamp (mtime and size) and content hash of each input file.
+
+    Parameters
+    ----------
+    paths: List[str]
+        The input files.
+
+    recorded: Dict[str, Dict] (Optional)
+        Previously recorded fingerprints, whose hash is reused for inputs with an unchanged stamp.
+
+    Returns
+    ----------
+    Dict[str, Dict]
+        The stamp and content hash of each input, keyed by path.
+    """
+    # Copied, so the recorded fingerprints are left as they were for comparison
+    memo = dict(recorded or {})
+    return {path: fingerprint_record(path, memo) for path in paths}
+
+
+class AnalysisSnapshot:
+    """
+    Directory of snapshot tables, one '<name>.feather' file per table.
+    """
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    def table_path(self, name):
+        return os.path.join(self.snapshot_dir, f"{name}.feather")
+
+    def _read(self, path):
+        """
+        Memory-map a stored table, returning it along with its recorded table version and input fingerprints.
+        """
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        metadata = json.loads(table.schema.metadata[b"snapshot"])
+        return table.replace_schema_metadata(None), metadata
+
+    def _write(self, path, df, version, fingerprints):
+        table = df.rechunk().to_arrow().replace_schema_metadata(
+            {"snapshot": json.dumps({"table_version": version, "inputs": fingerprints})}
+        )
+        tmp_path = path + ".tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def get(self, name, inputs, build, version=1):
+        """
+        Get a table from the snapshot, building (and storing) it if missing or any of its inputs changed.
+
+        Parameters
+        ----------
+        name: str
+            The table's name, eg) "recomb_data".
+
+        inputs: List[str]
+            The files the table is derived from.
+
+        build: Callable[[], pl.DataFrame]
+            Builds the table from its inputs.
+
+        version: int (Optional)
+            The version of the table's derivation, bumped whenever 'build' changes so the stored table
+            is rebuilt.
+
+        Returns
+        ----------
+        pl.DataFrame
+            The table.
+        """
+        path = self.table_path(name)
+        recorded = None
+        table = None
+        if os.path.exists(path):
+            table, metadata = self._read(path)
+            if metadata.get("table_version") == version and sorted(metadata["inputs"]) == sorted(inputs):
+                recorded = metadata["inputs"]
+        fingerprints = input_fingerprints(inputs, recorded)
+        if recorded is not None and all(fingerprints[p]["hash"] == recorded[p]["hash"] for p in inputs):
+            df = pl.from_arrow(table)
+            if fingerprints != recorded:
+                # Inputs rewritten with identical contents, record their new stamps
+                self._write(path, df, version, fingerprints)
+            return df
+        print(f"Building analysis table '{name}' from: ", inputs)
+        df = build()
+        self._write(path, df, version, fingerprints)
+        return df
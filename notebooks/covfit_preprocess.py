@@ -2,40 +2,24 @@
 TODO:
 """
 
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
 from Bio.Seq import Seq
+from itertools import product
+from multiprocessing import Pool
+from mat_extract import load_extraction_cache
+from trio_vcf import MISSING_ALLELE, read_trio_mutations
 from util import Config
+import argparse
+import numpy as np
 import os
 import polars as pl
-import subprocess
-import shutil
 
-
-def subprocess_runner(command):
-    """
-    Run the given string command as a subprocess.
-
-    Parameters
-    ----------
-    command: List[str]
-        The full command to run, including args.
-
-    Returns
-    ----------
-    Dict
-        The result of running the command as a subprocess.
-    """
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, check=False)
-        if result.stderr:
-            print("result.stderr: ", result.stderr)
-            exit(1)
-        return result
-
-    except Exception as e:
-        print(f"Error occurred: {e}")
-        exit(1)
+# Spike region of the reference (1-based, inclusive)
+SPIKE_START = 21563
+SPIKE_END = 25384
+# Nucleotide codes translated by the codon table
+IUPAC_NUCLEOTIDES = "ACGTRYSWKMBDHVN"
+# Number of nodes whose spike sequences are translated together
+CHUNK_NODES = 1024
 
 
 def get_trio_nodes(recomb_file):
@@ -50,68 +34,6 @@ def get_trio_nodes(recomb_file):
     return all_node_ids.unique().to_list()
 
 
-def write_node_ids(outfile, node_ids):
-    """
-    TODO:
-    """
-    fp_out = open(outfile, "w")
-    for _id in node_ids:
-        fp_out.write(_id + "\n")
-    fp_out.close()
-
-
-def matUtils_extract_vcf(mat_path, node_ids_path, output_vcf_path):
-    """
-    Run a matUtils extract command to extract the a VCF file for the given samples.
-
-    Parameters
-    ----------
-    mat_path: str
-        The path to the MAT (.pb) file.
-
-    node_ids_path: str
-        The path to the node ids file.
-
-    output_vcf_path: str
-        The path to the output VCF file to write.
-
-    Example:
-        matUtils extract -i <tree.pb> -s <node_ids.txt> -v <node_ids.vcf>
-    """
-    cmd = [
-        "matUtils",
-        "extract",
-        "-i",
-        "{}".format(mat_path),
-        "-s",
-        "{}".format(node_ids_path),
-        "-v",
-        "{}".format(output_vcf_path),
-    ]
-    print("Running matUtils command: ", cmd)
-    result = subprocess_runner(cmd)
-
-
-def vcf2fasta(reference_filepath, vcf_filepath, fasta_output_dir):
-    """
-    TODO:
-
-    vcf2fasta -f NC_045512v2.fa samples.vcf
-    """
-    CURRENT_DIR = os.getcwd()
-    reference_file = os.path.basename(reference_filepath)
-    # Increase the allowed number of open file descriptors, required for vcf2fasta
-    subprocess_runner(["ulimit", "-n", "10000"])
-
-    # Switch to fasta output dir to write all the fasta files
-    os.chdir(fasta_output_dir)
-
-    cmd = ["vcf2fasta", "-f", "{}".format(reference_file), "{}".format(vcf_filepath)]
-    # Convert all the trios to fasta files, from VCF
-    result = subprocess_runner(cmd)
-    os.chdir(CURRENT_DIR)
-
-
 def load_single_fasta_sequence(fasta_file):
     """
     This function assumes only a single sequence (record) per input FASTA file.
@@ -135,9 +57,7 @@ def extract_spike(seq):
     """
     TODO
     """
-    START = 21563 - 1  # -1 since seq is 0-indexed
-    END = 25384
-    return seq[START:END]
+    return seq[SPIKE_START - 1 : SPIKE_END]  # -1 since seq is 0-indexed
 
 
 def write_fasta(name, seq, fp_out):
@@ -147,61 +67,182 @@ def write_fasta(name, seq, fp_out):
     fp_out.write(name + seq + "\n")
 
 
-def write_spike_sequences(fastas_dir, spike_translated_outfile):
+def build_codon_table():
     """
-    TODO:
+    Build the lookup tables used to translate nucleotide sequences (as uint8 ASCII codes) into
+    amino acids, with every (IUPAC) codon translated once by Biopython.
+
+    Returns
+    ----------
+    Tuple[np.ndarray, np.ndarray]
+        The index of each ASCII character in 'IUPAC_NUCLEOTIDES' (-1 if not a nucleotide), and the
+        amino acid (ASCII code) of each codon, indexed by its three nucleotide indices in base
+        len(IUPAC_NUCLEOTIDES).
+    """
+    nucleotide_index = np.full(256, -1, dtype=np.int64)
+    for i, nt in enumerate(IUPAC_NUCLEOTIDES):
+        nucleotide_index[ord(nt)] = i
+        nucleotide_index[ord(nt.lower())] = i
+    codon_table = np.array(
+        [ord(str(Seq("".join(codon)).translate())) for codon in product(IUPAC_NUCLEOTIDES, repeat=3)],
+        dtype=np.uint8,
+    )
+    return nucleotide_index, codon_table
+
+
+def translate_sequences(seqs, nucleotide_index, codon_table):
+    """
+    Translate a batch of equal length nucleotide sequences, like Biopython's 'Seq.translate'.
+
+    Parameters
+    ----------
+    seqs: np.ndarray
+        The (N x L) uint8 ASCII codes of the sequences, with L a multiple of 3.
+
+    nucleotide_index: np.ndarray
+        See 'build_codon_table'.
+
+    codon_table: np.ndarray
+        See 'build_codon_table'.
+
+    Returns
+    ----------
+    List[str]
+        The protein sequence of each nucleotide sequence, with stop codons as '*'.
+    """
+    codes = nucleotide_index[seqs]
+    if (codes < 0).any():
+        bad = seqs[codes < 0][0]
+        raise ValueError(f"Invalid nucleotide in sequence: '{chr(bad)}'")
+    base = len(IUPAC_NUCLEOTIDES)
+    codons = (codes[:, 0::3] * base + codes[:, 1::3]) * base + codes[:, 2::3]
+    return [row.tobytes().decode("ascii") for row in codon_table[codons]]
+
+
+# Per process state used to translate chunks of trio nodes, set by 'init_spike_worker'
+_SPIKE_STATE = {}
+
+
+def init_spike_worker(ref_spike):
+    """
+    Set up the state needed by 'translate_spike_chunk' in the current (worker) process.
+    """
+    _SPIKE_STATE["ref_spike"] = np.frombuffer(ref_spike.encode("ascii"), dtype=np.uint8)
+    _SPIKE_STATE["nucleotide_index"], _SPIKE_STATE["codon_table"] = build_codon_table()
+
+
+def translate_spike_chunk(chunk):
+    """
+    Apply the spike mutations of a chunk of nodes to the reference spike, and translate them.
+
+    Parameters
+    ----------
+    chunk: Tuple[int, np.ndarray, np.ndarray, np.ndarray]
+        The number of nodes in the chunk, and the (chunk) node index, 1-based position and
+        alternate allele (ASCII code) of each of their spike mutations.
+
+    Returns
+    ----------
+    List[str]
+        The spike protein sequence of each node in the chunk.
     """
-    from os import listdir
-    from os.path import isfile, join
+    num_nodes, node_idx, positions, alts = chunk
+    spikes = np.tile(_SPIKE_STATE["ref_spike"], (num_nodes, 1))
+    spikes[node_idx, positions - SPIKE_START] = alts
+    return translate_sequences(spikes, _SPIKE_STATE["nucleotide_index"], _SPIKE_STATE["codon_table"])
+
+
+def iter_spike_chunks(trio_mutations, chunk_size=CHUNK_NODES):
+    """
+    Split the spike mutations of every node into chunks of nodes, see 'translate_spike_chunk'.
+    """
+    in_spike = (trio_mutations.positions >= SPIKE_START) & (trio_mutations.positions <= SPIKE_END)
+    sample_idx = trio_mutations.sample_idx[in_spike]
+    positions = trio_mutations.positions[in_spike].astype(np.int64)
+    alts = trio_mutations.alts[in_spike]
+    # Missing genotypes are written as 'N'
+    alts = np.where(alts == ord(MISSING_ALLELE), ord("N"), alts).astype(np.uint8)
+    for first in range(0, len(trio_mutations), chunk_size):
+        start, end = np.searchsorted(sample_idx, [first, first + chunk_size])
+        num_nodes = min(chunk_size, len(trio_mutations) - first)
+        yield num_nodes, sample_idx[start:end] - first, positions[start:end], alts[start:end]
+
+
+def write_spike_sequences(reference_file, vcf_file, spike_translated_outfile, workers=1):
+    """
+    Write the translated spike protein sequence of every node in the VCF file, with the node's
+    alleles applied directly to the reference spike region, across a pool of worker processes.
+
+    Parameters
+    ----------
+    reference_file: str
+        The reference sequence FASTA file.
+
+    vcf_file: str
+        The VCF file of the nodes, see 'matUtils_extract_vcf'.
+
+    spike_translated_outfile: str
+        The FASTA file to write the protein sequences to.
+
+    workers: int (Optional)
+        The number of worker processes used to translate the sequences.
+    """
+    _, refseq = load_single_fasta_sequence(reference_file)
+    ref_spike = extract_spike(refseq)
+    trio_mutations = read_trio_mutations(vcf_file)
+    chunks = iter_spike_chunks(trio_mutations)
 
-    exclude_files = ["NC_045512v2.fa.fai", "NC_045512v2.fa"]
-    fastas = [
-        f
-        for f in listdir(fastas_dir)
-        if (isfile(join(fastas_dir, f)) and f not in exclude_files)
-    ]
     f_out = open(spike_translated_outfile, "w")
-    count = 0
-    for file in fastas:
-        name, seq = load_single_fasta_sequence(os.path.join(fastas_dir, file))
-        spike_seq_nt = extract_spike(seq)
-        nt_seq = Seq(spike_seq_nt)
-        protein_seq = str(nt_seq.translate())
-        write_fasta(name, protein_seq, f_out)
-        count += 1
+    names = iter(trio_mutations.samples)
+
+    def write(results):
+        for proteins in results:
+            for protein_seq in proteins:
+                write_fasta(">" + next(names) + "\n", protein_seq, f_out)
+
+    if workers > 1:
+        with Pool(workers, initializer=init_spike_worker, initargs=(ref_spike,)) as pool:
+            write(pool.imap(translate_spike_chunk, chunks))
+    else:
+        init_spike_worker(ref_spike)
+        write(map(translate_spike_chunk, chunks))
     f_out.close()
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Write the translated spike protein sequences of all recombinant trio nodes, as input to CoVFit."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to translate the spike sequences.",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     CONFIG = "config.yaml"
     config = Config(CONFIG)
-    data_dir = "data"
+    data_dir = config.DATA_DIR
 
     # Ensure data directory is found
     if not os.path.isdir(data_dir):
         raise FileNotFoundError(f"Data Directory not found: '{data_dir}'")
 
-    FA_DIR = "covfit_fastas"
-    FA_DIR_PATH = os.path.join(data_dir, FA_DIR)
-    node_ids_outfile = os.path.join(data_dir, "node_ids.txt")
     output_vcf = os.path.join(data_dir, "node_ids.vcf")
     translated_fasta_file = os.path.join(data_dir, "all_spike_translated.fasta")
     # Get all the recombinant trio node ids from rivet results file
-    node_ids = get_trio_nodes(os.path.join(data_dir, config.RECOMBINATION_STATS_FILE))
-
-    # Write each id to a txt file, one per line, for input to matUtils
-    write_node_ids(node_ids_outfile, node_ids)
-    matUtils_extract_vcf(config.MAT, node_ids_outfile, output_vcf)
-
-    # Convert VCF trios file to a separate fasta file for each internal node
-    reference_file = "data/NC_045512v2.fa"
-    if not os.path.exists(FA_DIR_PATH):
-        os.mkdir(FA_DIR_PATH)
+    node_ids = get_trio_nodes(config.RECOMBINATION_STATS_FILE)
 
-    vcf2fasta(reference_file, os.path.abspath(output_vcf), FA_DIR_PATH)
+    # Extract the trio nodes' VCF with matUtils, or from the cached extractions of the same MAT
+    load_extraction_cache(config.MAT, data_dir).extract(vcf_requests=[(node_ids, output_vcf)])
 
-    # Extract the spike protein region from each FASTA file, as input to covfit model
-    write_spike_sequences(FA_DIR_PATH, translated_fasta_file)
+    # Apply each node's alleles to the reference spike region and translate it, as input to covfit model
+    write_spike_sequences(config.reference_filepath, output_vcf, translated_fasta_file, args.workers)
+    print("Translated spike sequences written to: ", translated_fasta_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""
+Invalidation stamps and content fingerprints of the data files.
+
+A file's stamp (its mtime and size) changes whenever the file is rewritten, and is cheap enough to check
+on every access. Its fingerprint (a hash of its contents) only changes when the contents do, so derived
+files keyed on it survive a file being rewritten with identical contents, but hashing large files (eg.
+the MAT) is slow. Fingerprints are therefore memoized on the file's stamp, either for the lifetime of the
+process or in a memo persisted by the caller (eg. the pipeline state file), and a file is only rehashed
+once its stamp changes.
+"""
+
+import hashlib
+import os
+import threading
+
+# Process-wide memo of file fingerprints, keyed by path, see 'fingerprint_record'
+_FILE_STAMPS_STATE = {"memo": {}}
+_FILE_STAMPS_LOCK = threading.Lock()
+
+
+def file_stamp(filename):
+    """
+    Get the invalidation stamp (mtime and size) of the given file.
+
+    Parameters
+    ----------
+    filename: str
+        The path to the file.
+
+    Returns
+    ----------
+    Dict[str, int]
+        The file's modification time (ns) and size (bytes).
+    """
+    stat = os.stat(filename)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def hash_contents(filename):
+    """
+    Compute a hash of the contents of the given file, without memoization.
+
+    Parameters
+    ----------
+    filename: str
+        The path to the file to hash.
+
+    Returns
+    ----------
+    str
+        The hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_record(filename, memo=None):
+    """
+    Get the stamp and fingerprint of the given file, only rehashing it if its stamp changed since it
+    was last memoized.
+
+    Parameters
+    ----------
+    filename: str
+        The path to the file.
+
+    memo: Dict[str, Dict] (Optional)
+        The memo of records to reuse and update, keyed by path, eg) loaded from a state file. Defaults to
+        the process-wide memo.
+
+    Returns
+    ----------
+    Dict
+        The file's "stamp" (see 'file_stamp') and "hash" (see 'hash_contents').
+    """
+    if memo is None:
+        memo = _FILE_STAMPS_STATE["memo"]
+    stamp = file_stamp(filename)
+    with _FILE_STAMPS_LOCK:
+        record = memo.get(filename)
+    if record is not None and record["stamp"] == stamp:
+        return record
+    record = {"stamp": stamp, "hash": hash_contents(filename)}
+    with _FILE_STAMPS_LOCK:
+        memo[filename] = record
+    return record
+
+
+def file_fingerprint(filename, memo=None):
+    """
+    Get the fingerprint (content hash) of the given file, see 'fingerprint_record'.
+
+    Parameters
+    ----------
+    filename: str
+        The path to the file.
+
+    memo: Dict[str, Dict] (Optional)
+        The memo of records to reuse and update, defaults to the process-wide memo.
+
+    Returns
+    ----------
+    str
+        The hex digest of the file contents.
+    """
+    return fingerprint_record(filename, memo)["hash"]
@@ -2,81 +2,36 @@
 TODO: docs
 """
 
-import numpy as np
+import argparse
 import math
 import os
-from cyvcf2 import VCF
 from third_party.nuc_mutations_to_aa_mutations_modified import (
-    nuc_mutations_to_aa_mutations_modified,
     load_reference_sequence_modified,
 )
+from translation import AATranslator, encode_nucleotides
+from scoring import FitnessScorer, get_fitness_scores, scores_fingerprint
+from tree_fitness import load_node_fitness
 
+from trio_vcf import load_trio_mutations
 from util import Config
 
 CONFIG = "config.yaml"
 
-def get_nt_mutations(vcf_filename):
-    """
-    TODO:
-    """
-    print("Parsing VCF file: {}".format(vcf_filename))
-    vcf_reader = VCF(vcf_filename)
-
-    samples = vcf_reader.samples
-    positions = []
-    ref_positions = {}
-    nodes_ids = {_id: [] for _id in samples}
-
-    for record in vcf_reader:
-        # Report the position
-        positions.append(str(record.POS))
-        alleles_indexes = np.nonzero(record.gt_types)
-        genotype_array = record.gt_bases
-        for i in np.nditer(alleles_indexes):
-            sample_name = samples[i]
-            ref = str(record.REF)
-            assert len(ref) == 1
-            pos = str(record.POS)
-            alt = genotype_array[i]
-            assert len(alt) == 1
-            new_nt_string = ref + pos + alt
-            nodes_ids[sample_name].append(new_nt_string)
-    return nodes_ids
-
-
-def get_fitness_scores(mutations_filename):
-    """
-    TODO:
-    """
-    r_ra = {}
-    fp = open(mutations_filename, "r")
-    # Skip over file header
-    next(fp)
-    for line in fp:
-        splitline = line.split("\t")
-        rank = int(splitline[0])
-        strain = splitline[1]
-        delta_log_R = round(float(splitline[4]), 10)
-        r_ra[strain] = delta_log_R
-    fp.close()
-    return r_ra
-
-
-def compute_fitness(aa_mutations, mutations_r_ra):
-    """
-    TODO:
-    """
-    # Calculate fitness of sample given additivity of mutations in this model
-    fitness = 0.0
-    for m in aa_mutations:
-        # Exclude any mutations unranked by PyR0
-        if m not in mutations_r_ra.keys():
-            continue
-        fitness += mutations_r_ra[m]
-    return float(math.exp(fitness))
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Calculate the fitness of every recombinant trio node in the RIVET VCF file."
+    )
+    parser.add_argument(
+        "--node-fitness",
+        action="store_true",
+        help="Read the trio node scores from the node fitness table written by 'notebooks/tree_fitness.py', "
+        "which can differ from scoring their mutations by a few ulps.",
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     config = Config(CONFIG)
     data_dir = config.DATA_DIR
     # Ensure data directory is found
@@ -88,7 +43,7 @@ def main():
     refseq = load_reference_sequence_modified(data_dir, "reference.fasta")
 
     # Get RIVET-inferred recombinant trios vcf
-    nt_mutations = get_nt_mutations(config.RIVET_VCF_FILE)
+    trio_mutations = load_trio_mutations(config.RIVET_VCF_FILE)
 
     # Calculate fitness scores for all recombinant trios in RIVET results file,
     # write results to intermediate fitness file
@@ -111,15 +66,29 @@ def main():
     HEADER = ",".join(COLUMNS)
     fp_out.write(HEADER + "\n")
 
-    data = {}
-    for node_id, nt_list in nt_mutations.items():
-        num_nt_mutations = len(nt_list)
-        aa_mutations = nuc_mutations_to_aa_mutations_modified(refseq, nt_list)
-        num_aa_mutations = len(aa_mutations)
-        node_fitness = compute_fitness(
-            aa_mutations,
-            mutation_fitness_scores,
+    if args.node_fitness:
+        # Look up the trio nodes' scores accumulated down the MAT
+        node_fitness_table = load_node_fitness(
+            config.node_fitness_path, scores_fingerprint(config.PYRO_MUTATIONS_FILE), config.node_mutations_path
+        )
+        fitness = node_fitness_table.lookup(trio_mutations.samples)
+        num_aa = node_fitness_table.lookup(trio_mutations.samples, "num_aa")
+    else:
+        # Translate and score all the trio nodes together
+        scorer = FitnessScorer(AATranslator(refseq), mutation_fitness_scores)
+        aa_mutations = scorer.translator.translate_batch(
+            trio_mutations.sample_idx,
+            trio_mutations.positions,
+            encode_nucleotides(trio_mutations.alt_alleles()),
         )
+        fitness, num_aa = scorer.score(aa_mutations, len(trio_mutations))
+
+    for node_id, num_nt_mutations, node_fitness, num_aa_mutations in zip(
+        trio_mutations.samples,
+        trio_mutations.num_mutations().tolist(),
+        fitness.tolist(),
+        num_aa.tolist(),
+    ):
         out = [
             node_id,
             str(node_fitness),
@@ -0,0 +1,179 @@
+"""
+Memoization of sample fitness scores keyed on the sample's nucleotide mutation set.
+
+Most circulating samples share their haplotype with many other samples, so each distinct mutation
+set only needs to be translated and scored once. The cache is bounded with an LRU eviction policy,
+and can be persisted on disk where it is only reused while the PyR0 scores file is unchanged.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import numpy as np
+
+# Default maximum number of distinct mutation sets held in the cache
+DEFAULT_CACHE_SIZE = 1_000_000
+
+
+def mutation_set_key(ms):
+    """
+    Canonical hash of a set of nucleotide mutations, independent of their order.
+
+    Parameters
+    ----------
+    ms: Iterable[str]
+        The nucleotide mutations of a sample, eg) {"A1234G", "C5678T"}.
+
+    Returns
+    ----------
+    bytes
+        The 16-byte key of the mutation set.
+    """
+    canonical = "\n".join(sorted(set(ms))).encode("utf-8")
+    return hashlib.blake2b(canonical, digest_size=16).digest()
+
+
+def mutation_array_key(positions, alts):
+    """
+    Canonical hash of a sample's nucleotide mutations given as position and alternate allele arrays,
+    as read from the sample mutation store. Positions must be sorted.
+
+    Parameters
+    ----------
+    positions: np.ndarray
+        The sorted 1-based positions of the sample's mutations.
+
+    alts: np.ndarray
+        The alternate allele codes of the sample's mutations.
+
+    Returns
+    ----------
+    bytes
+        The 16-byte key of the mutation set.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(positions, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(alts, dtype=np.uint8).tobytes())
+    return digest.digest()
+
+
+class FitnessCache:
+    """
+    LRU cache mapping mutation set keys (see 'mutation_set_key') to sample fitness scores.
+    """
+
+    def __init__(self, scores_fingerprint, max_size=DEFAULT_CACHE_SIZE, path=None):
+        """
+        Parameters
+        ----------
+        scores_fingerprint: str
+            Fingerprint of the PyR0 scores file the cached fitness values were computed from.
+
+        max_size: int (Optional)
+            The maximum number of entries held before the least recently used are evicted.
+
+        path: str (Optional)
+            The file to load the cache from and save it to. If not given, the cache is in-memory only.
+        """
+        self.scores_fingerprint = scores_fingerprint
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        # Entries added since the last call to 'pop_updates'
+        self.updates = []
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    # Worker processes reload a persisted cache from its file, rather than being sent a copy of its entries
+    def __getstate__(self):
+        if self.path is None:
+            return self.__dict__
+        return {"scores_fingerprint": self.scores_fingerprint, "max_size": self.max_size, "path": self.path}
+
+    def __setstate__(self, state):
+        if "entries" in state:
+            self.__dict__.update(state)
+            return
+        self.__init__(state["scores_fingerprint"], state["max_size"])
+        self.path = state["path"]
+        self.load(verbose=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get the cached fitness for the given key, or None if it is not cached.
+        """
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def put(self, key, fitness):
+        """
+        Cache the fitness for the given key, evicting the least recently used entry if full.
+        """
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        self.updates.append((key, fitness))
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop_updates(self):
+        """
+        Get and clear the entries added since the last call, used to merge the entries computed
+        by a worker process's copy of the cache back into the main process's cache.
+
+        Returns
+        ----------
+        List[Tuple[bytes, float]]
+            The (key, fitness) entries added to the cache.
+        """
+        updates = self.updates
+        self.updates = []
+        return updates
+
+    def load(self, verbose=True):
+        """
+        Load the persisted cache, discarding it if it was built from a different PyR0 scores file.
+
+        Parameters
+        ----------
+        verbose: bool (Optional)
+            Whether to print whether the cache was loaded or invalidated.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = pickle.load(f)
+        if data["scores_fingerprint"] != self.scores_fingerprint:
+            if verbose:
+                print("PyR0 scores file changed, invalidating fitness cache: ", self.path)
+            return
+        self.entries = OrderedDict(data["entries"])
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        if verbose:
+            print(f"Loaded {len(self.entries)} cached fitness scores from: ", self.path)
+
+    def save(self):
+        """
+        Persist the cache to disk, if a path was given.
+        """
+        if self.path is None:
+            return
+        data = {
+            "scores_fingerprint": self.scores_fingerprint,
+            "entries": list(self.entries.items()),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
@@ -2,87 +2,484 @@
 Script run by `circulating-fitness-stats` pixi task to generate basic statistics for the fitness of all circulating samples for each month.
 """
 import numpy as np
+import argparse
 import math
 import os
-import pickle
-import dbm
-import statistics
+import polars as pl
+from multiprocessing import Pool
 from cyvcf2 import VCF
 from third_party.nuc_mutations_to_aa_mutations_modified import (
-    nuc_mutations_to_aa_mutations_modified,
     load_reference_sequence_modified,
 )
+from translation import AATranslator
+from scoring import FitnessScorer, get_fitness_scores, scores_fingerprint
+from fitness_cache import FitnessCache, mutation_array_key
+from mutation_store import open_store, read_batch
+from sample_scores import (
+    SAMPLE_SCORES_SUFFIX,
+    SampleScoreWriter,
+    load_sample_scores,
+    score_part_path,
+    write_score_part,
+)
+from tree_fitness import load_node_fitness
+from monthly_stats import DEFAULT_RELATIVE_ACCURACY, STATS_MODES, new_fitness_stats
+from profiling import count, profiled
 
 from util import Config, download_data_files, get_chronumental_dates, get_months
 
 CONFIG = "config.yaml"
-PICKLED_SAMPLE_MUTATIONS_FILE = "all_sample_mutations.pkl"
+# Suffix of the persisted fitness cache, written next to the sample mutations store
+FITNESS_CACHE_SUFFIX = ".fitness_cache"
 
-def get_fitness_scores(mutations_filename):
+def score_mutations(scorer, sample_idx, positions, alts, num_samples):
     """
-    TODO:
+    Translate and score the nucleotide mutations of a batch of samples together.
+
+    Parameters
+    ----------
+    scorer: FitnessScorer
+        The PyR0 fitness scorer, with the translator built from the reference sequence.
+
+    sample_idx: np.ndarray
+        The (sorted) sample index of each nucleotide mutation.
+
+    positions: np.ndarray
+        The 1-based position of each nucleotide mutation.
+
+    alts: np.ndarray
+        The alternate allele code of each nucleotide mutation.
+
+    num_samples: int
+        The number of samples in the batch.
+
+    Returns
+    ----------
+    np.ndarray
+        The fitness of each sample in the batch.
     """
-    r_ra = {}
-    fp = open(mutations_filename, "r")
-    # Skip over file header
-    next(fp)
-    for line in fp:
-        splitline = line.split("\t")
-        rank = int(splitline[0])
-        strain = splitline[1]
-        delta_log_R = round(float(splitline[4]), 10)
-        r_ra[strain] = delta_log_R
-    fp.close()
-    return r_ra
+    aa_mutations = scorer.translator.translate_batch(sample_idx, positions, alts)
+    fitness, num_aa_mutations = scorer.score(aa_mutations, num_samples)
+    return fitness
 
 
-def compute_fitness(aa_mutations, mutations_r_ra):
+def score_batch(scorer, batch, cache=None):
     """
-    TODO:
+    Score every sample in a batch read from the sample mutations store.
+
+    If a FitnessCache is given, samples whose mutation set has already been scored are looked up
+    instead of being translated and scored again, and each distinct mutation set is scored once.
+
+    Parameters
+    ----------
+    scorer: FitnessScorer
+        The PyR0 fitness scorer, with the translator built from the reference sequence.
+
+    batch: SampleMutationBatch
+        The samples and their nucleotide mutations.
+
+    cache: FitnessCache (Optional)
+        The cache of previously computed sample fitness scores.
+
+    Returns
+    ----------
+    np.ndarray
+        The fitness of each sample in the batch.
     """
-    # Calculate fitness of sample given additivity of mutations in this model
-    fitness = 0.0
-    for m in aa_mutations:
-        # Exclude any mutations unranked by PyR0
-        if m not in mutations_r_ra.keys():
+    if cache is None:
+        return score_mutations(scorer, batch.sample_idx, batch.positions, batch.alts, len(batch))
+
+    bounds = batch.sample_bounds()
+    keys = [
+        mutation_array_key(batch.positions[start:end], batch.alts[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    fitness = [cache.get(key) for key in keys]
+
+    # Score one representative sample for each distinct uncached mutation set
+    representatives = {}
+    for i, key in enumerate(keys):
+        if fitness[i] is None and key not in representatives:
+            representatives[key] = i
+    if representatives:
+        lookup = np.full(len(batch), -1, dtype=np.int64)
+        lookup[list(representatives.values())] = np.arange(len(representatives))
+        remapped = lookup[batch.sample_idx]
+        rows = remapped >= 0
+        new_fitness = score_mutations(
+            scorer,
+            remapped[rows],
+            batch.positions[rows],
+            batch.alts[rows],
+            len(representatives),
+        )
+        scored = dict(zip(representatives.keys(), new_fitness.tolist()))
+        for key, sample_fitness in scored.items():
+            cache.put(key, sample_fitness)
+        fitness = [scored[key] if f is None else f for key, f in zip(keys, fitness)]
+    return np.array(fitness, dtype=np.float64)
+
+
+# Per process state used to score shards of the sample mutations store, set by 'init_shard_worker'
+_SHARD_STATE = {}
+
+
+def init_shard_worker(
+    mutations_file_path,
+    refseq,
+    mutation_fitness_scores,
+    sample_months,
+    cache,
+    stats_mode,
+    relative_accuracy,
+    node_fitness=None,
+    score_parts_dir=None,
+):
+    """
+    Set up the state needed by 'score_shard' in the current (worker) process.
+    """
+    _SHARD_STATE["node_fitness"] = node_fitness
+    _SHARD_STATE["score_parts_dir"] = score_parts_dir
+    _SHARD_STATE["store"] = open_store(mutations_file_path)
+    _SHARD_STATE["scorer"] = FitnessScorer(AATranslator(refseq), mutation_fitness_scores)
+    _SHARD_STATE["sample_months"] = sample_months
+    # Chronumental month code -> index in 'get_months()', -1 for months outside of the analysis
+    month_index = {month: i for i, month in enumerate(get_months())}
+    _SHARD_STATE["month_index"] = np.array(
+        [month_index.get(month, -1) for month in sample_months.months], dtype=np.int64
+    )
+    _SHARD_STATE["cache"] = cache
+    _SHARD_STATE["stats_mode"] = stats_mode
+    _SHARD_STATE["relative_accuracy"] = relative_accuracy
+
+
+def score_shard(row_group):
+    """
+    Score all the samples in a single shard (row group) of the sample mutations store.
+
+    If a scores parts directory was given, the name, fitness, inferred month and haplotype digest of each
+    sample in the shard are written to the shard's part (see 'sample_scores.write_score_part').
+
+    Parameters
+    ----------
+    row_group: int
+        The index of the row group to score.
+
+    Returns
+    ----------
+    Tuple[Dict[str, ExactFitnessStats or SketchFitnessStats], int, str, List[Tuple[bytes, float]], Tuple[int, int]]
+        The partial fitness statistics of the shard's samples for each month, the number of samples in the
+        shard, the path to the shard's scores part (or None), the new fitness cache entries, and the number
+        of fitness cache hits and misses in the shard.
+    """
+    sample_months = _SHARD_STATE["sample_months"]
+    month_index = _SHARD_STATE["month_index"]
+    cache = _SHARD_STATE["cache"]
+
+    node_fitness = _SHARD_STATE["node_fitness"]
+    batch = read_batch(_SHARD_STATE["store"], row_group)
+    samples = batch.samples
+    if node_fitness is not None:
+        # Look up the scores accumulated down the MAT, rather than scoring each sample's mutations
+        fitness = node_fitness.lookup(samples)
+    else:
+        fitness = score_batch(_SHARD_STATE["scorer"], batch, cache)
+    chronumental_codes = sample_months.month_codes(samples)
+    part_path = None
+    if _SHARD_STATE["score_parts_dir"] is not None:
+        part_path = score_part_path(_SHARD_STATE["score_parts_dir"], row_group)
+        write_score_part(
+            part_path,
+            samples,
+            fitness,
+            [sample_months.months[code] for code in chronumental_codes.tolist()],
+            batch.haplotype_digests(),
+        )
+    # Month of each sample, -1 for months outside of the analysis
+    month_codes = month_index[chronumental_codes]
+    months = get_months()
+    month_scores = {}
+    for code in np.unique(month_codes):
+        if code < 0:
             continue
-        fitness += mutations_r_ra[m]
-    return float(math.exp(fitness))
+        month_fitness = fitness[month_codes == code]
+        month_stats = new_fitness_stats(_SHARD_STATE["stats_mode"], _SHARD_STATE["relative_accuracy"])
+        month_stats.add(month_fitness)
+        month_scores[months[code]] = month_stats
+
+    if cache is None:
+        return month_scores, len(samples), part_path, [], (0, 0)
+    cache_stats = (cache.hits, cache.misses)
+    cache.hits = cache.misses = 0
+    return month_scores, len(samples), part_path, cache.pop_updates(), cache_stats
 
 
-def calculate_fitness_stats(mutations_file_path, refseq, mutation_fitness_scores, sample_months):
+@profiled(unit="samples")
+def calculate_fitness_stats(
+    mutations_file_path,
+    refseq,
+    mutation_fitness_scores,
+    sample_months,
+    cache=None,
+    workers=1,
+    stats_mode="exact",
+    relative_accuracy=DEFAULT_RELATIVE_ACCURACY,
+    row_groups=None,
+    score_writer=None,
+    node_fitness=None,
+):
     """
     TODO:
+
+    Each row group of the sample mutations store is an independent shard. With more than one worker,
+    shards are scored in parallel, and their partial per-month statistics merged so the results are
+    identical to the serial run.
+    A persisted 'cache' is reloaded by each worker from its file (see 'FitnessCache.__getstate__'),
+    and the entries the workers add are merged back into it.
+
+    Only the given 'row_groups' are scored if given. If a 'score_writer' (eg. a SampleScoreWriter) is
+    given, the score of every scored sample is written by the worker to a part in the writer's
+    'parts_dir', and each part passed to the writer's 'add_part' in shard order. If the 'node_fitness' table (see
+    'tree_fitness.py') is given, sample scores are looked up in it rather than computed.
     """
     scores = dict()
-    # Collecting samples fitness scores for each month
+    # Collecting samples fitness statistics for each month, see 'monthly_stats'
     months = get_months()
     for month in months:
-        scores[month] = []
+        scores[month] = new_fitness_stats(stats_mode, relative_accuracy)
 
-    try:
-        with dbm.open(mutations_file_path, 'r') as db:
-            for key in db:
-                month = sample_months[key.decode('utf-8')]
-                value = pickle.loads(db[key])
-                nt_mutations = list(value['mutations'])
+    shards = row_groups
+    if shards is None:
+        shards = range(open_store(mutations_file_path).num_row_groups)
+    init_args = (
+        mutations_file_path,
+        refseq,
+        mutation_fitness_scores,
+        sample_months,
+        cache,
+        stats_mode,
+        relative_accuracy,
+        node_fitness,
+        score_writer.parts_dir if score_writer is not None else None,
+    )
 
-                # Translate to amino acid mutations
-                aa_mutations = nuc_mutations_to_aa_mutations_modified(refseq, nt_mutations)
+    def combine(results):
+        hits = misses = 0
+        for month_scores, num_samples, part_path, cache_updates, (shard_hits, shard_misses) in results:
+            for month, month_stats in month_scores.items():
+                scores[month].merge(month_stats)
+            count("samples", num_samples)
+            count("shards")
+            if score_writer is not None:
+                score_writer.add_part(part_path)
+            hits += shard_hits
+            misses += shard_misses
+            if cache is not None and workers > 1:
+                for key, sample_fitness in cache_updates:
+                    cache.put(key, sample_fitness)
+        if cache is not None:
+            cache.pop_updates()
+            print(f"Fitness cache hits: {hits}, misses: {misses}")
 
-                sample_fitness = compute_fitness(aa_mutations, mutation_fitness_scores)
-                if month in scores.keys():
-                    scores[month].append(sample_fitness)
-
-    except dbm.error as e:
-        print(f"dbm error: {e}")
-        raise SystemExit(1)
+    if workers > 1:
+        print(f"Scoring {len(shards)} shards with {workers} workers.")
+        with Pool(workers, initializer=init_shard_worker, initargs=init_args) as pool:
+            combine(pool.imap(score_shard, shards))
+    else:
+        init_shard_worker(*init_args)
+        combine(map(score_shard, shards))
 
     return scores
 
-def write_fitness_stats(data, outfile):
+def read_fitness_stats_rows(filename):
+    """
+    Read the row of each month from a previously written monthly fitness stats file.
+
+    Parameters
+    ----------
+    filename: str
+        The monthly fitness stats file (CSV), see 'write_fitness_stats'.
+
+    Returns
+    ----------
+    Dict[str, str]
+        Each month's CSV line.
+    """
+    rows = {}
+    with open(filename, "r") as f:
+        # Skip over file header
+        next(f)
+        for line in f:
+            line = line.rstrip("\n")
+            rows[line.split(",", 1)[0]] = line
+    return rows
+
+
+def update_fitness_stats(
+    mutations_file_path,
+    refseq,
+    mutation_fitness_scores,
+    sample_months,
+    sample_scores,
+    previous_rows,
+    provenance,
+    score_writer,
+    cache=None,
+    workers=1,
+    node_fitness=None,
+):
+    """
+    Incrementally update the monthly fitness statistics after the sample mutations store was updated
+    (see 'get_mutations.update_mutations_file'), using the sample scores table of the previous run.
+
+    Only the samples added to the store, or whose haplotype changed, are scored, and only the statistics
+    of months whose samples changed are recomputed (from the sample scores table), so the results are identical to
+    rescoring every sample.
+
+    Parameters
+    ----------
+    mutations_file_path: str
+        The path to the updated sample mutations store.
+
+    refseq: str
+        The reference sequence.
+
+    mutation_fitness_scores: Dict[str, float]
+        The PyR0 amino acid mutation Δlog R scores.
+
+    sample_months: MonthIndex
+        The index of samples to their inferred months.
+
+    sample_scores: LazyFrame
+        The previous sample scores table, read lazily, see 'sample_scores.load_sample_scores'.
+
+    previous_rows: Dict[str, str]
+        The previous monthly fitness stats rows, see 'read_fitness_stats_rows'.
+
+    provenance: Dict
+        The provenance of the previous sample scores table.
+
+    score_writer: SampleScoreWriter
+        Writer of the updated sample scores table, whose parts directory holds the intermediate parts.
+
+    cache: FitnessCache (Optional)
+        The cache of previously computed sample fitness scores.
+
+    workers: int (Optional)
+        The number of worker processes used to score shards of the store.
+
+    node_fitness: NodeFitness (Optional)
+        The node fitness table to look up the added samples' scores in.
+
+    Returns
+    ----------
+    Tuple[Dict[str, ExactFitnessStats or SketchFitnessStats], Dict[str, str]]
+        The recomputed statistics of the affected months, and the reused rows of the other months.
+    """
+    store = open_store(mutations_file_path)
+    keys = ["sample", "haplotype"]
+    current = []
+    for row_group in range(store.num_row_groups):
+        batch = read_batch(store, row_group)
+        current.append(
+            pl.DataFrame(
+                {
+                    "sample": batch.samples,
+                    "haplotype": batch.haplotype_digests(),
+                    "row_group": np.full(len(batch), row_group, dtype=np.int64),
+                },
+                schema={"sample": pl.String, "haplotype": pl.UInt64, "row_group": pl.Int64},
+            )
+        )
+    current = pl.concat(current)
+    # The samples added to the store (or whose haplotype changed), joined once against the previous table
+    added = current.lazy().join(sample_scores.select(keys), on=keys, how="anti").collect()
+    new_row_groups = added["row_group"].unique().sort().to_list()
+    current = current.lazy().select(keys)
+
+    # Drop the removed (and changed) samples, and re-date all samples if the Chronumental file changed
+    removed = sample_scores.join(current, on=keys, how="anti").select("month").collect()["month"]
+    affected = set(removed.to_list())
+    previous = sample_scores.join(current, on=keys, how="semi")
+    if provenance["chronumental"] != sample_months.source:
+
+        def redate(samples):
+            codes = sample_months.month_codes(samples).tolist()
+            return pl.Series([sample_months.months[code] for code in codes], dtype=pl.String)
+
+        previous = previous.with_columns(
+            pl.col("sample").map_batches(redate, return_dtype=pl.String, is_elementwise=True).alias("redated")
+        )
+        redated = previous.filter(pl.col("month") != pl.col("redated")).select("month", "redated").collect()
+        affected.update(redated["month"].to_list())
+        affected.update(redated["redated"].to_list())
+        previous = previous.with_columns(pl.col("redated").alias("month")).drop("redated")
+    previous_path = score_part_path(score_writer.parts_dir, "previous")
+    previous.sink_parquet(previous_path)
+
+    # Score the samples in the row groups with added samples, keeping the added samples' scores
+    parts = _ScorePartCollector(score_writer.parts_dir)
+    calculate_fitness_stats(
+        mutations_file_path,
+        refseq,
+        mutation_fitness_scores,
+        sample_months,
+        cache=cache,
+        workers=workers,
+        row_groups=new_row_groups,
+        score_writer=parts,
+        node_fitness=node_fitness,
+    )
+    added_path = score_part_path(score_writer.parts_dir, "added")
+    if parts.paths:
+        pl.scan_parquet(parts.paths).join(added.lazy().select(keys), on=keys, how="semi").sink_parquet(added_path)
+        for path in parts.paths:
+            os.remove(path)
+    else:
+        write_score_part(added_path, [], [], [], [])
+    new_months = pl.scan_parquet(added_path).select("month").collect()["month"]
+    affected.update(new_months.to_list())
+    print(
+        f"Samples added or changed: {len(new_months)}, removed or changed: {len(removed)}, "
+        f"affected months: {len(affected)}"
+    )
+
+    # Recompute the statistics of the affected months, only reading their samples' scores
+    months = [month for month in get_months() if month in affected or month not in previous_rows]
+    all_scores = pl.concat([pl.scan_parquet(previous_path), pl.scan_parquet(added_path)])
+    scores = {}
+    for month, month_scores in all_scores.filter(pl.col("month").is_in(months)).collect().group_by("month"):
+        month_stats = new_fitness_stats(provenance["stats_mode"], provenance["relative_accuracy"])
+        month_stats.add(month_scores["fitness"].to_numpy())
+        scores[month[0]] = month_stats
+    for month in months:
+        if month not in scores:
+            scores[month] = new_fitness_stats(provenance["stats_mode"], provenance["relative_accuracy"])
+    score_writer.add_part(previous_path)
+    score_writer.add_part(added_path)
+    return scores, {month: row for month, row in previous_rows.items() if month not in scores}
+
+
+class _ScorePartCollector:
+    """
+    Collects the paths of the sample scores parts written by 'calculate_fitness_stats', rather than
+    adding them to the table.
+    """
+
+    def __init__(self, parts_dir):
+        self.parts_dir = parts_dir
+        self.paths = []
+
+    def add_part(self, path):
+        self.paths.append(path)
+
+
+def write_fitness_stats(data, outfile, reused_rows=None):
     """
     TODO
+
+    'data' maps each month to its fitness statistics accumulator, see 'monthly_stats'. Months missing
+    from 'data' are written with their row from 'reused_rows' (month -> CSV line), see 'read_fitness_stats_rows'.
     """
     fp_out = open(outfile, "w")
 
@@ -110,18 +507,22 @@ def write_fitness_stats(data, outfile):
 
     HEADER = ",".join(COLUMNS)
     fp_out.write(HEADER + "\n")
-    for month, scores in data.items():
-        mean = statistics.mean(scores)
+    for month in get_months():
+        if month not in data:
+            fp_out.write(reused_rows[month] + "\n")
+            continue
+        summary = data[month].summary()
+        mean = summary["Mean"]
         log_mean = math.log(mean)
-        median = statistics.median(scores)
+        median = summary["Median"]
         log_median = math.log(median)
-        max_ = max(scores)
-        std_dev = statistics.stdev(scores) 
-        percentile_50 = np.percentile(scores, 50)
-        percentile_75 = np.percentile(scores, 75)
-        percentile_90 = np.percentile(scores, 90)
-        percentile_99 = np.percentile(scores, 99)
-        percentile_99_99 = np.percentile(scores, 99.99)
+        max_ = summary["Max"]
+        std_dev = summary["StandardDeviation"]
+        percentile_50 = summary["Percentile50"]
+        percentile_75 = summary["Percentile75"]
+        percentile_90 = summary["Percentile90"]
+        percentile_99 = summary["Percentile99"]
+        percentile_99_99 = summary["Percentile99.99"]
         ROW = [
             month,
             str(mean),
@@ -144,8 +545,46 @@ def write_fitness_stats(data, outfile):
             str(math.log(percentile_99_99))
         ]
         fp_out.write(",".join(ROW) + "\n")
+    fp_out.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate monthly fitness statistics for all circulating samples."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to score shards of the sample mutations store.",
+    )
+    parser.add_argument(
+        "--stats",
+        choices=STATS_MODES,
+        default="exact",
+        help="'exact' keeps every score in memory, 'sketch' estimates the median and percentiles in flat memory.",
+    )
+    parser.add_argument(
+        "--relative-accuracy",
+        type=float,
+        default=DEFAULT_RELATIVE_ACCURACY,
+        help="Relative error bound of the median and percentiles in 'sketch' mode.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rescore every sample, instead of only the samples added (or changed) since the previous run.",
+    )
+    parser.add_argument(
+        "--node-fitness",
+        action="store_true",
+        help="Read the sample scores from the node fitness table written by 'notebooks/tree_fitness.py', "
+        "which can differ from scoring their mutations by a few ulps.",
+    )
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
     config = Config(CONFIG)
     data_dir = config.DATA_DIR
 
@@ -163,9 +602,69 @@ def main():
     # Get months of each sample from Chronumental file
     sample_months = get_chronumental_dates(config.CHRONUMENTAL_FILE)
 
-    mutations_file_path = os.path.join(data_dir, PICKLED_SAMPLE_MUTATIONS_FILE)
-    scores = calculate_fitness_stats(mutations_file_path, refseq, mutation_fitness_scores, sample_months)
-    write_fitness_stats(scores, config.MONTHLY_FITNESS_STATS_FILE)
+    mutations_file_path = config.sample_mutations_path
+    pyro_scores = scores_fingerprint(config.PYRO_MUTATIONS_FILE)
+    cache = None
+    node_fitness = None
+    if args.node_fitness:
+        node_fitness = load_node_fitness(config.node_fitness_path, pyro_scores, config.node_mutations_path)
+    else:
+        # Reuse fitness scores of previously seen mutation sets, while the PyR0 scores file is unchanged
+        cache = FitnessCache(
+            pyro_scores,
+            path=mutations_file_path + FITNESS_CACHE_SUFFIX,
+        )
+
+    # The previous run's sample scores can be reused while the PyR0 scores and stats settings are unchanged
+    provenance = {
+        "pyro_scores": pyro_scores,
+        "chronumental": sample_months.source,
+        "stats_mode": args.stats,
+        "relative_accuracy": args.relative_accuracy,
+    }
+    sample_scores_path = mutations_file_path + SAMPLE_SCORES_SUFFIX
+    previous = None
+    if not args.full and os.path.exists(config.MONTHLY_FITNESS_STATS_FILE):
+        previous = load_sample_scores(sample_scores_path)
+    if previous is not None and any(
+        previous[1][key] != provenance[key] for key in ["pyro_scores", "stats_mode", "relative_accuracy"]
+    ):
+        print("PyR0 scores or stats settings changed, rescoring all samples.")
+        previous = None
+
+    with SampleScoreWriter(sample_scores_path, provenance) as score_writer:
+        if previous is not None:
+            print("Updating monthly fitness stats with the samples added or changed since the previous run.")
+            scores, reused_rows = update_fitness_stats(
+                mutations_file_path,
+                refseq,
+                mutation_fitness_scores,
+                sample_months,
+                previous[0],
+                read_fitness_stats_rows(config.MONTHLY_FITNESS_STATS_FILE),
+                previous[1],
+                score_writer,
+                cache=cache,
+                workers=args.workers,
+                node_fitness=node_fitness,
+            )
+        else:
+            scores = calculate_fitness_stats(
+                mutations_file_path,
+                refseq,
+                mutation_fitness_scores,
+                sample_months,
+                cache=cache,
+                workers=args.workers,
+                stats_mode=args.stats,
+                relative_accuracy=args.relative_accuracy,
+                score_writer=score_writer,
+                node_fitness=node_fitness,
+            )
+            reused_rows = None
+    if cache is not None:
+        cache.save()
+    write_fitness_stats(scores, config.MONTHLY_FITNESS_STATS_FILE, reused_rows)
     print("All sample monthly fitness stats written to: ", config.MONTHLY_FITNESS_STATS_FILE)
 
 
@@ -1,38 +1,187 @@
 """
 Script to get set of single-nucelotide mutations from each sample in the given MAT.
 TODO: docs
+
+If the sample mutations store already exists, it is updated incrementally: only the haplotypes of the
+leaves added to the MAT since the store was written, or whose haplotype changed (eg. leaves moved in a
+re-optimized MAT), are written, and removed leaves are dropped.
+The haplotypes are extracted in a single depth-first traversal of the MAT, which also writes the branch
+mutations of every node to the node mutations table, see 'node_mutations.py'.
 """
+import argparse
 import bte
 import os
+import pyarrow as pa
 from util import Config, download_data_files
-import pickle
-import dbm
-import glob
+from mutation_store import MASK64, SampleMutationWriter, mutation_digest, open_store, read_batch
+from node_mutations import NodeMutationWriter
+from profiling import count, profiled
 
 CONFIG = "config.yaml"
-PICKLED_SAMPLE_MUTATIONS_FILE = "all_sample_mutations.pkl"
 
-def write_mutations_file(tree, filename):
+@profiled("bte_walk", unit="nodes")
+def traverse_tree(tree, writer=None, stored=None, node_writer=None):
     """
-    # TODO:
+    Extract the haplotypes of the leaves of the tree in a single depth-first traversal.
+
+    The haplotype of the current node is kept as a running state of its mutated positions, each node's
+    branch mutations are applied on the way down and undone on the way back up, so mutations shared by
+    a clade are only processed once, rather than once per leaf (as with 'tree.get_haplotype').
+    Reversions to the root allele are dropped from the haplotype.
+
+    Parameters
+    ----------
+    tree: MATree
+        The MAT.
+
+    writer: SampleMutationWriter (Optional)
+        The sample mutations store to add the leaf haplotypes to.
+
+    stored: Dict[str, int] (Optional)
+        The haplotype digest of each leaf already in the store (see 'mutation_store'). Only the leaves
+        missing from it, or whose haplotype digest differs, are added to the store. All leaves are added if
+        not given.
+
+    node_writer: NodeMutationWriter (Optional)
+        The node mutations table to add every node and its branch mutations to.
+
+    Returns
+    ----------
+    Set[str]
+        The leaves added to the store.
     """
-    leaves = tree.get_leaves_ids()
+    # Mutated position -> (root allele, current allele) of the current node's haplotype
+    state = {}
+    # Haplotype digest of the current node, maintained along with 'state' when comparing to the store
+    digest = 0
+    # (node id, node table index, undo list, digest of the parent) of each node on the path from the root
+    # to the current node
+    path = []
+    written = set()
+    i = 0
+    num_nodes = 0
+    interval = 100_000
+    for node in tree.depth_first_expansion():
+        num_nodes += 1
+        parent = node.parent
+        parent_id = parent.id if parent is not None else None
+        # Undo the branch mutations of the nodes of the previous subtree
+        while path and path[-1][0] != parent_id:
+            _, _, undo, digest = path.pop()
+            for position, previous in reversed(undo):
+                if previous is None:
+                    state.pop(position, None)
+                else:
+                    state[position] = previous
 
-    with dbm.open(filename, 'c') as db:
-        i = 0
-        interval = 100_000
-        for sample in leaves:
-            # Get the nucleotide mutations for the given sample
-            haplotype = tree.get_haplotype(sample)
-            value = pickle.dumps({'mutations': haplotype})
-            db[sample.encode('utf-8')] = value
+        mutations = node.mutations
+        undo = []
+        parent_digest = digest
+        for mutation in mutations:
+            position = int(mutation[1:-1])
+            previous = state.get(position)
+            undo.append((position, previous))
+            ref = mutation[0] if previous is None else previous[0]
+            alt = mutation[-1]
+            if stored is not None and previous is not None:
+                digest = (digest - mutation_digest(position, previous[1])) & MASK64
+            if alt == ref:
+                state.pop(position, None)
+            else:
+                state[position] = (ref, alt)
+                if stored is not None:
+                    digest = (digest + mutation_digest(position, alt)) & MASK64
 
+        is_leaf = node.is_leaf()
+        index = -1
+        if node_writer is not None:
+            parent_index = path[-1][1] if path else -1
+            index = node_writer.add(node.id, parent_index, is_leaf, mutations)
+        path.append((node.id, index, undo, parent_digest))
+
+        if is_leaf and writer is not None and (stored is None or stored.get(node.id) != digest):
+            writer.add(node.id, [ref + str(position) + alt for position, (ref, alt) in state.items()])
+            written.add(node.id)
             if (i + 1) % interval == 0:
                 print(f"{i + 1} samples processed.")
-            i+=1
+            i += 1
+    count("nodes", num_nodes)
+    count("samples", i)
+    return written
+
+
+def write_mutations_file(tree, filename, node_filename):
+    """
+    Write the nucleotide mutations of every leaf in the tree to the Parquet sample mutations store,
+    and the branch mutations of every node to the node mutations table.
+    """
+    with NodeMutationWriter(node_filename) as node_writer:
+        with SampleMutationWriter(filename) as writer:
+            traverse_tree(tree, writer, node_writer=node_writer)
+
+
+def update_mutations_file(tree, filename, node_filename):
+    """
+    Incrementally update the sample mutations store to the leaves of the given tree, writing only the
+    haplotypes of leaves that were added or whose haplotype changed, and dropping removed leaves.
+    The node mutations table is always rewritten.
+
+    Parameters
+    ----------
+    tree: MATree
+        The (new) MAT.
+
+    filename: str
+        The path to the existing Parquet sample mutations store.
+
+    node_filename: str
+        The path to write the Parquet node mutations table to.
+    """
+    store = open_store(filename)
+    stored = {}
+    for row_group in range(store.num_row_groups):
+        batch = read_batch(store, row_group)
+        stored.update(zip(batch.samples, batch.haplotype_digests().tolist()))
+
+    # The added and changed leaves are written first, followed by the unchanged leaves of the existing store
+    writer = SampleMutationWriter(filename)
+    try:
+        with NodeMutationWriter(node_filename) as node_writer:
+            written = traverse_tree(tree, writer, stored, node_writer)
+        removed = stored.keys() - set(tree.get_leaves_ids())
+    except BaseException:
+        writer.discard()
+        raise
+    changed = written.intersection(stored)
+    print(
+        f"MAT leaves added: {len(written) - len(changed)}, changed: {len(changed)}, removed: {len(removed)}, "
+        f"unchanged: {len(stored) - len(changed) - len(removed)}"
+    )
+    if not written and not removed:
+        writer.discard()
+        return
+
+    # Leave the removed and changed leaves out of the copied row groups
+    dropped = pa.array(sorted(removed | changed), type=pa.string())
+    for row_group in range(store.num_row_groups):
+        writer.copy_row_group(store, row_group, dropped)
+    writer.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Write the nucleotide mutations of every sample in the MAT to the sample mutations store."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the sample mutations store from scratch, instead of updating an existing store incrementally.",
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     config = Config(CONFIG)
     data_dir = config.DATA_DIR
 
@@ -40,18 +189,21 @@ def main():
     if not os.path.isdir(data_dir):
         raise FileNotFoundError(f"Data Directory not found: '{data_dir}'")
     
-    mutations_file_path = os.path.join(data_dir, PICKLED_SAMPLE_MUTATIONS_FILE)
-    mutations_db_files = glob.glob(f'{mutations_file_path}.*')
-
-    # Check if sample mutations database files have already been generated, if not create db
-    if not mutations_db_files:
-        # Load MAT
-        print("Loading MAT file: ", config.MAT)
-        tree = bte.MATree(config.MAT)
-        write_mutations_file(tree, mutations_file_path)
+    mutations_file_path = config.sample_mutations_path
+    node_mutations_path = config.node_mutations_path
+
+    # Load MAT
+    print("Loading MAT file: ", config.MAT)
+    tree = bte.MATree(config.MAT)
+    # Update the sample mutations store if it has already been generated, otherwise create it
+    if os.path.exists(mutations_file_path) and not args.full:
+        print("Updating sample mutations store: ", mutations_file_path)
+        update_mutations_file(tree, mutations_file_path, node_mutations_path)
+    else:
+        write_mutations_file(tree, mutations_file_path, node_mutations_path)
     print("All samples mutations file written to disk: ", mutations_file_path)
+    print("Node mutations file written to disk: ", node_mutations_path)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,233 @@
+"""
+Cached, batched 'matUtils extract' runs on the MAT.
+
+Loading the protobuf MAT dominates the cost of every 'matUtils extract' run, so extractions are cached
+in a directory next to the data files, keyed by the content hash of the MAT and the extracted node set.
+All the node ID lists requested together are extracted to a single VCF in one 'matUtils' run, and a
+later request for a subset of the nodes of a cached VCF is served by subsetting that VCF, without
+running 'matUtils' again. Extractions from a different MAT are discarded once the MAT changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from cyvcf2 import VCF, Writer
+
+from file_stamps import file_fingerprint
+
+MAT_EXTRACT_CACHE_DIR = "mat_extract_cache"
+MANIFEST_FILE = "manifest.json"
+
+
+def node_set_hash(node_ids):
+    """
+    Canonical hash of a set of node ids, independent of their order.
+    """
+    canonical = "\n".join(sorted(set(node_ids))).encode("utf-8")
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+def matUtils_extract(mat_path, output_dir, node_ids_file=None, vcf=None, newick=None):
+    """
+    Run a single matUtils extract command, writing all the requested outputs.
+
+    Parameters
+    ----------
+    mat_path: str
+        The path to the MAT (.pb) file.
+
+    output_dir: str
+        The directory to write the outputs to.
+
+    node_ids_file: str (Optional)
+        The file of node ids (one per line) to extract, all nodes if not given.
+
+    vcf: str (Optional)
+        The name of the VCF file to write, within 'output_dir'.
+
+    newick: str (Optional)
+        The name of the Newick tree file to write, within 'output_dir'.
+
+    Example:
+        matUtils extract -i <tree.pb> -s <node_ids.txt> -v <node_ids.vcf> -d <output_dir>
+    """
+    cmd = ["matUtils", "extract", "-i", mat_path, "-d", output_dir]
+    if node_ids_file is not None:
+        cmd += ["-s", node_ids_file]
+    if vcf is not None:
+        cmd += ["-v", vcf]
+    if newick is not None:
+        cmd += ["-t", newick]
+    print("Running matUtils command: ", cmd)
+    subprocess.run(cmd, check=True)
+
+
+def subset_vcf(vcf_path, node_ids, output_vcf_path):
+    """
+    Write the VCF records of a subset of the samples in a VCF file, dropping records where none of
+    the subset's genotypes are non-reference (as 'matUtils extract' does).
+
+    Parameters
+    ----------
+    vcf_path: str
+        The VCF file to subset.
+
+    node_ids: List[str]
+        The samples to keep.
+
+    output_vcf_path: str
+        The path to write the subset VCF file to.
+    """
+    vcf_reader = VCF(vcf_path, samples=list(node_ids))
+    writer = Writer(output_vcf_path, vcf_reader)
+    for record in vcf_reader:
+        if record.gt_types.any():
+            writer.write_record(record)
+    writer.close()
+    vcf_reader.close()
+
+
+class MATExtractionCache:
+    """
+    Cache of the outputs of 'matUtils extract' runs on a MAT, see the module docs.
+    """
+
+    def __init__(self, mat_path, cache_dir):
+        """
+        Parameters
+        ----------
+        mat_path: str
+            The path to the MAT (.pb) file.
+
+        cache_dir: str
+            The directory holding the cached extractions.
+        """
+        self.mat_path = mat_path
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+        self.manifest = {"hashes": {}, "entries": []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+        # Content hash of the MAT, memoized in the manifest so the MAT is not rehashed on every run
+        self.mat_hash = file_fingerprint(self.mat_path, self.manifest.setdefault("hashes", {}))
+        self._discard_stale()
+
+    def _discard_stale(self):
+        # Remove the extractions of any other MAT, or whose files are missing
+        entries = []
+        for entry in self.manifest["entries"]:
+            path = os.path.join(self.cache_dir, entry["file"])
+            if entry["mat_hash"] == self.mat_hash and os.path.exists(path):
+                entries.append(entry)
+            elif os.path.exists(path):
+                os.remove(path)
+        self.manifest["entries"] = entries
+        self.save()
+
+    def save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _find(self, kind, node_ids=None):
+        """
+        Find the smallest cached extraction of the given kind holding all the given nodes.
+        """
+        best = None
+        for entry in self.manifest["entries"]:
+            if entry["kind"] != kind:
+                continue
+            if node_ids is not None and not node_ids.issubset(entry["nodes"]):
+                continue
+            if best is None or len(entry["nodes"]) < len(best["nodes"]):
+                best = entry
+        return best
+
+    def _add(self, kind, filename, node_ids=None):
+        entry = {
+            "mat_hash": self.mat_hash,
+            "kind": kind,
+            "file": filename,
+            "nodes": sorted(node_ids) if node_ids is not None else [],
+        }
+        self.manifest["entries"].append(entry)
+        self.save()
+        return entry
+
+    def extract(self, vcf_requests=(), newick=False):
+        """
+        Extract VCF files of the requested nodes and/or the Newick tree of the MAT, serving each
+        request from the cache where possible, and running at most one 'matUtils' extraction for
+        all the uncached VCF requests together.
+
+        Parameters
+        ----------
+        vcf_requests: List[Tuple[List[str], str]] (Optional)
+            The node ids to extract, and the path to write their VCF file to, of each VCF request.
+
+        newick: bool (Optional)
+            Whether to extract the Newick tree of the whole MAT.
+
+        Returns
+        ----------
+        str or None
+            The path to the (cached) Newick tree file, if requested.
+        """
+        requests = [(set(node_ids), output_path) for node_ids, output_path in vcf_requests]
+        pending = [node_ids for node_ids, _ in requests if self._find("vcf", node_ids) is None]
+        if pending:
+            # Extract the union of all the uncached node sets in one run
+            union = set().union(*pending)
+            name = node_set_hash(union)
+            node_ids_file = os.path.join(self.cache_dir, name + ".txt")
+            with open(node_ids_file, "w") as f:
+                f.write("\n".join(sorted(union)) + "\n")
+            matUtils_extract(self.mat_path, self.cache_dir, node_ids_file, vcf=name + ".vcf")
+            os.remove(node_ids_file)
+            self._add("vcf", name + ".vcf", union)
+        elif requests:
+            print("Serving matUtils VCF extraction(s) from cache: ", self.cache_dir)
+
+        for node_ids, output_path in requests:
+            entry = self._find("vcf", node_ids)
+            cached_path = os.path.join(self.cache_dir, entry["file"])
+            if node_ids == set(entry["nodes"]):
+                shutil.copyfile(cached_path, output_path)
+            else:
+                subset_vcf(cached_path, sorted(node_ids), output_path)
+
+        if not newick:
+            return None
+        entry = self._find("newick")
+        if entry is None:
+            name = os.path.splitext(os.path.basename(self.mat_path))[0] + ".nwk"
+            matUtils_extract(self.mat_path, self.cache_dir, newick=name)
+            entry = self._add("newick", name)
+        else:
+            print("Serving matUtils Newick extraction from cache: ", self.cache_dir)
+        return os.path.join(self.cache_dir, entry["file"])
+
+
+def load_extraction_cache(mat_path, data_dir):
+    """
+    Open the cache of matUtils extractions of the given MAT in the data directory.
+
+    Parameters
+    ----------
+    mat_path: str
+        The path to the MAT (.pb) file.
+
+    data_dir: str
+        The path to the data directory.
+
+    Returns
+    ----------
+    MATExtractionCache
+        The extraction cache.
+    """
+    return MATExtractionCache(mat_path, os.path.join(data_dir, MAT_EXTRACT_CACHE_DIR))
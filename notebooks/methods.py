@@ -3,32 +3,95 @@ Main classes and methods used in the recombinant analysis in 'analysis.ipynb' no
 """
 
 from util import *
+from functools import cached_property
 import sys
 
+from analysis_snapshot import SNAPSHOT_DIR, AnalysisSnapshot
+from resampling import DEFAULT_REPLICATES, recombinant_fitness_tests
+
+NORM_FITNESS_FILE = "recomb_fitness_normalized.csv"
+
 
 class RecombAnalysis:
+    """
+    Analysis session of the 'analysis.ipynb' notebook.
+
+    The datasets and derived tables are only loaded on first access, from the analysis snapshot
+    ('analysis_snapshot.py') in the data directory, and are only recomputed after their input files change.
+    """
+
     def __init__(self, config):
         self.config = config
-        print("Loading all datasets for analysis")
-        start_time = time.perf_counter()
-
-        self.substitution_stats = get_substitution_stats(config.SUBTITUTION_SCORES)
-        self.monthly_fitness_stats = get_monthly_fitness_stats(
-            config.MONTHLY_FITNESS_STATS_FILE
+        self.snapshot = AnalysisSnapshot(os.path.join(config.DATA_DIR, SNAPSHOT_DIR))
+        print("Analysis ready, datasets are loaded on first use from: ", self.snapshot.snapshot_dir)
+
+    @cached_property
+    def substitution_stats(self):
+        df = self.snapshot.get(
+            "substitution_stats",
+            [self.config.SUBTITUTION_SCORES],
+            # The statistics reported in the manuscript count each substitution once more than it occurs
+            lambda: pl.DataFrame([get_substitution_stats(self.config.SUBTITUTION_SCORES, legacy_extra_copy=True)]),
+        )
+        return df.row(0, named=True)
+
+    @cached_property
+    def monthly_fitness_stats(self):
+        return self.snapshot.get(
+            "monthly_fitness_stats",
+            [self.config.MONTHLY_FITNESS_STATS_FILE],
+            lambda: get_monthly_fitness_stats(self.config.MONTHLY_FITNESS_STATS_FILE),
         )
 
-        recomb_data = get_recombinant_data(config.RECOMBINATION_STATS_FILE)
+    @cached_property
+    def norm_fitness(self):
         # Calculate min-max normalization of fitness for each recombinant,
-        # return DataFrame and write results to CSV file.
-        OUTFILE = os.path.join(self.config.DATA_DIR, "recomb_fitness_normalized.csv")
-        self.norm_fitness = calc_norm_fitness(recomb_data, OUTFILE)
+        # and write results to CSV file when (re)computed
+        outfile = os.path.join(self.config.DATA_DIR, NORM_FITNESS_FILE)
+        df = self.snapshot.get(
+            "norm_fitness",
+            [self.config.RECOMBINATION_STATS_FILE],
+            lambda: calc_norm_fitness(get_recombinant_data(self.config.RECOMBINATION_STATS_FILE), outfile),
+        )
+        if not os.path.exists(outfile):
+            df.write_csv(outfile)
+        return df
 
+    @cached_property
+    def recomb_data(self):
         # Merge monthly fitness stats data with individual recombinant fitness stats data
-        self.recomb_data = recomb_data.join(self.monthly_fitness_stats, on="Month")
+        return self.snapshot.get(
+            "recomb_data",
+            [self.config.RECOMBINATION_STATS_FILE, self.config.MONTHLY_FITNESS_STATS_FILE],
+            lambda: get_recombinant_data(self.config.RECOMBINATION_STATS_FILE).join(
+                self.monthly_fitness_stats, on="Month"
+            ),
+        )
+
+    @cached_property
+    def pango_recomb_data(self):
+        return self.snapshot.get(
+            "pango_recomb_data",
+            [self.config.PANGO_RECOMBS_FILE, self.config.MONTHLY_FITNESS_STATS_FILE],
+            lambda: load_df(self.config.PANGO_RECOMBS_FILE).join(self.monthly_fitness_stats, on="Month"),
+        )
 
-        end_time = time.perf_counter()
-        elapsed_time = end_time - start_time
+    def load(self):
+        """
+        Load every dataset now, rather than on first use.
+        """
+        start_time = time.perf_counter()
+        for name in [
+            "substitution_stats",
+            "monthly_fitness_stats",
+            "norm_fitness",
+            "recomb_data",
+            "pango_recomb_data",
+        ]:
+            getattr(self, name)
+        elapsed_time = time.perf_counter() - start_time
         print(f"Data loaded, analysis ready. Elapsed time: {elapsed_time:.4f} seconds")
+        return self
 
     def getNormFitness(self):
         """ """
@@ -56,8 +119,7 @@ class RecombAnalysis:
 
     def getPangoRecombData(self):
         """ """
-        pango_df = load_df(self.config.PANGO_RECOMBS_FILE)
-        return pango_df.join(self.monthly_fitness_stats, on="Month")
+        return self.pango_recomb_data
 
     def toDataframe(self):
         """ """
@@ -69,5 +131,35 @@ class RecombAnalysis:
         """
         return get_epidemiological_df(self.recomb_data)
 
+    def getResamplingTests(self, replicates=DEFAULT_REPLICATES, seed=0, workers=1):
+        """
+        Bootstrap confidence intervals and permutation tests of recombinant fitness against their parents
+        and the circulating fitness of their month (see 'resampling.py'). The results are stored in the
+        analysis snapshot for each number of replicates and seed, as they do not depend on the workers.
+
+        Parameters
+        ----------
+        replicates: int (Optional)
+            The number of replicates of each test.
+
+        seed: int (Optional)
+            The seed of the resampling.
+
+        workers: int (Optional)
+            The number of worker processes.
+
+        Returns
+        ----------
+        DataFrame
+            The estimate, confidence interval and p-value of each test.
+        """
+        return self.snapshot.get(
+            f"resampling_tests-{replicates}-{seed}",
+            [self.config.RECOMBINATION_STATS_FILE, self.config.MONTHLY_FITNESS_STATS_FILE],
+            lambda: recombinant_fitness_tests(self.recomb_data, self.norm_fitness, replicates, seed, workers),
+            # 2: two-sided p-values centred on the mean of the replicates
+            version=2,
+        )
+
     def correlation_matrix(self):
         return self.df.to_pandas().corr()
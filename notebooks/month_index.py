@@ -0,0 +1,215 @@
+"""
+Columnar index of the Chronumental-inferred emergence month of every sample (tip and internal node).
+
+The Chronumental dates file is parsed once with vectorized Polars expressions, and stored next to it as
+an uncompressed Arrow (Feather) file, sorted by node name, with a compact integer month code per node.
+The index records the mtime and size of the Chronumental file it was built from, and is rebuilt when
+they change. Lookups binary search the memory-mapped index, so only the pages holding the requested
+nodes are read, rather than loading every entry.
+"""
+
+import json
+import os
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from file_stamps import file_stamp
+
+MONTH_INDEX_SUFFIX = ".months.feather"
+SAMPLE_COL = "strain"
+DATE_COL = "predicted_date"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S%.f"
+
+
+def build_month_index(chronumental_filename, index_filename):
+    """
+    Parse the Chronumental results file (TSV) and write the sorted node -> month code index.
+
+    Parameters
+    ----------
+    chronumental_filename: str
+        The Chronumental results file (TSV).
+
+    index_filename: str
+        The path to write the index (Feather) to.
+    """
+    stamp = file_stamp(chronumental_filename)
+    df = (
+        pl.scan_csv(chronumental_filename, separator="\t")
+        .select(
+            pl.col(SAMPLE_COL).alias("node"),
+            pl.col(DATE_COL).str.to_datetime(DATE_FORMAT, strict=True).dt.strftime("%Y-%m").alias("month"),
+        )
+        .sort("node")
+        .collect()
+    )
+    if df["node"].is_duplicated().any():
+        raise ValueError(f"Repeated samples in Chronumental file: '{chronumental_filename}'")
+
+    months = df["month"].unique().sort()
+    month_codes = df["month"].cast(pl.Enum(months)).to_physical().cast(pl.UInt16)
+    table = pa.table(
+        {"node": df["node"].to_arrow().cast(pa.large_string()), "month_code": month_codes.to_arrow()}
+    ).replace_schema_metadata(
+        {"months": json.dumps(months.to_list()), "source": json.dumps(stamp)}
+    )
+    tmp_filename = index_filename + ".tmp"
+    with pa.OSFile(tmp_filename, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_filename, index_filename)
+
+
+def sorted_positions(sorted_nodes, nodes):
+    """
+    Find the rows of the given nodes in a sorted array of node names, with a vectorized binary search.
+
+    Parameters
+    ----------
+    sorted_nodes: pa.Array
+        The sorted (large string) node names searched.
+
+    nodes: Iterable[str]
+        The node names to look up.
+
+    Returns
+    ----------
+    np.ndarray
+        The row of each node, or -1 if it is not in 'sorted_nodes'.
+    """
+    queries = pa.array(nodes, type=pa.large_string())
+    lo = np.zeros(len(queries), dtype=np.int64)
+    hi = np.full(len(queries), len(sorted_nodes), dtype=np.int64)
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi) // 2
+        rows = np.flatnonzero(active)
+        below = pc.less(pc.take(sorted_nodes, mid[rows]), pc.take(queries, rows)).to_numpy(
+            zero_copy_only=False
+        )
+        lo[rows[below]] = mid[rows[below]] + 1
+        hi[rows[~below]] = mid[rows[~below]]
+        active = lo < hi
+    found = lo < len(sorted_nodes)
+    found[found] = pc.equal(
+        pc.take(sorted_nodes, lo[found]), pc.take(queries, np.flatnonzero(found))
+    ).to_numpy(zero_copy_only=False)
+    return np.where(found, lo, -1)
+
+
+class MonthIndex:
+    """
+    Read-only, dict-like mapping of node names to their inferred months, see 'build_month_index'.
+    """
+
+    def __init__(self, index_filename):
+        self.path = index_filename
+        self._open()
+
+    def _open(self):
+        table = pa.ipc.open_file(pa.memory_map(self.path, "r")).read_all()
+        metadata = table.schema.metadata
+        self.months = json.loads(metadata[b"months"])
+        self.source = json.loads(metadata[b"source"])
+        self.nodes = table.column("node").combine_chunks()
+        self.codes = table.column("month_code").combine_chunks()
+
+    # Reopen the memory map rather than copying the index into worker processes
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return self.positions([node])[0] >= 0
+
+    def __getitem__(self, node):
+        position = self.positions([node])[0]
+        if position < 0:
+            raise KeyError(node)
+        return self.months[self.codes[position].as_py()]
+
+    def get(self, node, default=None):
+        position = self.positions([node])[0]
+        if position < 0:
+            return default
+        return self.months[self.codes[position].as_py()]
+
+    def positions(self, nodes):
+        """
+        Find the rows of the given nodes in the index, see 'sorted_positions'.
+        """
+        return sorted_positions(self.nodes, nodes)
+
+    def month_codes(self, nodes):
+        """
+        Batch look up the month codes (indices into 'months') of the given nodes.
+
+        Parameters
+        ----------
+        nodes: Iterable[str]
+            The node names to look up.
+
+        Returns
+        ----------
+        np.ndarray
+            The month code of each node.
+        """
+        nodes = list(nodes)
+        positions = self.positions(nodes)
+        missing = np.flatnonzero(positions < 0)
+        if len(missing) > 0:
+            raise KeyError(nodes[missing[0]])
+        return self.codes.to_numpy()[positions]
+
+    def lookup(self, nodes):
+        """
+        Batch look up the inferred months of the given nodes.
+
+        Parameters
+        ----------
+        nodes: Iterable[str]
+            The node names to look up.
+
+        Returns
+        ----------
+        List[str]
+            The inferred month of each node, eg) "2021-03".
+        """
+        return [self.months[code] for code in self.month_codes(nodes).tolist()]
+
+
+def load_month_index(chronumental_filename):
+    """
+    Load the month index of the Chronumental results file, (re)building it if it is missing or
+    the Chronumental file changed since it was built.
+
+    Parameters
+    ----------
+    chronumental_filename: str
+        The Chronumental results file (TSV).
+
+    Returns
+    ----------
+    MonthIndex
+        The index of samples (tips and internal node ids) to their inferred months.
+    """
+    index_filename = chronumental_filename + MONTH_INDEX_SUFFIX
+    if os.path.exists(index_filename):
+        index = MonthIndex(index_filename)
+        if index.source == file_stamp(chronumental_filename):
+            print("Loaded Chronumental month index from: ", index_filename)
+            return index
+        print("Chronumental file changed, rebuilding month index: ", index_filename)
+    else:
+        print("Building Chronumental month index. This could take a minute.")
+    build_month_index(chronumental_filename, index_filename)
+    print("Chronumental month index written to: ", index_filename)
+    return MonthIndex(index_filename)
@@ -0,0 +1,302 @@
+"""
+Mergeable accumulators for the monthly circulating fitness statistics.
+
+Both accumulators compute the mean, standard deviation and max exactly (identical to the 'statistics'
+module) from integer moment sums, so partial results from shards can be merged in any order:
+- ExactFitnessStats stores every score in a NumPy float array, and reads the median and all the
+  percentiles from a single sort.
+- SketchFitnessStats keeps memory flat as the MAT grows, estimating the median and percentiles with
+  a mergeable log-binned quantile sketch (DDSketch-style) with a configurable relative error bound.
+"""
+
+from fractions import Fraction
+import math
+import statistics
+import numpy as np
+
+STATS_MODES = ["exact", "sketch"]
+# Percentiles reported for each month
+PERCENTILES = [50, 75, 90, 99, 99.99]
+# Default relative error bound of the percentiles estimated by the quantile sketch
+DEFAULT_RELATIVE_ACCURACY = 0.0005
+
+# Each 53-bit float mantissa is split into three 18-bit pieces, so sums of piece products fit in int64
+_PIECE_BITS = 18
+_PIECE_MASK = (1 << _PIECE_BITS) - 1
+# Maximum number of values summed together in int64 without overflow
+_MAX_CHUNK = 1 << 24
+
+
+def _float_sqrt_of_fraction(fraction):
+    """
+    Square root of a non-negative Fraction, correctly rounded to a float (as in 'statistics.stdev').
+    """
+    n, m = fraction.numerator, fraction.denominator
+    # Compute the root with at least 2 * 53 + 3 bits, rounding to odd before the final float rounding
+    q = (n.bit_length() - m.bit_length() - 109) // 2
+    if q >= 0:
+        m <<= 2 * q
+    else:
+        n <<= -2 * q
+    root = math.isqrt(n // m)
+    root |= root * root * m != n
+    if q >= 0:
+        return float(root << q)
+    return root / (1 << -q)
+
+
+class ExactMoments:
+    """
+    Exact count, sum, sum of squares and max of a stream of floats, using integer arithmetic.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.max = -math.inf
+        # Binary exponent -> [a, b, c, aa, ab, ac, bb, bc, cc] sums of the mantissa pieces
+        self.sums = {}
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.max = max(self.max, float(values.max()))
+        for start in range(0, len(values), _MAX_CHUNK):
+            self._add_chunk(values[start : start + _MAX_CHUNK])
+
+    def _add_chunk(self, values):
+        mantissas, exponents = np.frexp(values)
+        mantissas = np.ldexp(mantissas, 53).astype(np.int64)
+        exponents = exponents.astype(np.int64) - 53
+        signs = np.sign(mantissas)
+        mantissas = np.abs(mantissas)
+        a = mantissas >> (2 * _PIECE_BITS)
+        b = (mantissas >> _PIECE_BITS) & _PIECE_MASK
+        c = mantissas & _PIECE_MASK
+        terms = np.stack([signs * a, signs * b, signs * c, a * a, a * b, a * c, b * b, b * c, c * c])
+
+        # Sum the pieces of values sharing the same binary exponent
+        order = np.argsort(exponents, kind="stable")
+        unique_exponents, starts = np.unique(exponents[order], return_index=True)
+        group_sums = np.add.reduceat(terms[:, order], starts, axis=1)
+        for exponent, column in zip(unique_exponents.tolist(), group_sums.T.tolist()):
+            sums = self.sums.setdefault(exponent, [0] * 9)
+            for i, term in enumerate(column):
+                sums[i] += term
+
+    def merge(self, other):
+        self.count += other.count
+        self.max = max(self.max, other.max)
+        for exponent, other_sums in other.sums.items():
+            sums = self.sums.setdefault(exponent, [0] * 9)
+            for i, term in enumerate(other_sums):
+                sums[i] += term
+
+    def _exact_sums(self):
+        total = Fraction(0)
+        total_squares = Fraction(0)
+        for exponent, (a, b, c, aa, ab, ac, bb, bc, cc) in self.sums.items():
+            linear = (a << (2 * _PIECE_BITS)) + (b << _PIECE_BITS) + c
+            squares = (
+                (aa << (4 * _PIECE_BITS))
+                + (2 * ab << (3 * _PIECE_BITS))
+                + ((2 * ac + bb) << (2 * _PIECE_BITS))
+                + (2 * bc << _PIECE_BITS)
+                + cc
+            )
+            total += linear * Fraction(2) ** exponent
+            total_squares += squares * Fraction(2) ** (2 * exponent)
+        return total, total_squares
+
+    def mean(self):
+        if self.count < 1:
+            raise statistics.StatisticsError("mean requires at least one data point")
+        total, _ = self._exact_sums()
+        return float(total / self.count)
+
+    def stdev(self):
+        if self.count < 2:
+            raise statistics.StatisticsError("stdev requires at least two data points")
+        total, total_squares = self._exact_sums()
+        sum_squared_deviations = total_squares - total * total / self.count
+        return _float_sqrt_of_fraction(sum_squared_deviations / (self.count - 1))
+
+
+class ExactFitnessStats:
+    """
+    Stores every fitness score of a month in a NumPy array, reading all order statistics from one sort.
+    """
+
+    def __init__(self, capacity=1024):
+        self.moments = ExactMoments()
+        self.scores = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.size + len(values) > len(self.scores):
+            capacity = max(2 * len(self.scores), self.size + len(values))
+            scores = np.empty(capacity, dtype=np.float64)
+            scores[: self.size] = self.scores[: self.size]
+            self.scores = scores
+        self.scores[self.size : self.size + len(values)] = values
+        self.size += len(values)
+        self.moments.add(values)
+
+    def merge(self, other):
+        self.add(other.scores[: other.size])
+
+    def summary(self):
+        """
+        Compute the statistics reported for the month.
+
+        Returns
+        ----------
+        Dict[str, float]
+            The mean, median, max, standard deviation and each of the 'PERCENTILES'.
+        """
+        scores = np.sort(self.scores[: self.size])
+        n = len(scores)
+        if n == 0:
+            raise statistics.StatisticsError("no median for empty data")
+        i = n // 2
+        median = float(scores[i]) if n % 2 == 1 else (float(scores[i - 1]) + float(scores[i])) / 2
+        summary = {
+            "Mean": self.moments.mean(),
+            "Median": median,
+            "Max": self.moments.max,
+            "StandardDeviation": self.moments.stdev(),
+        }
+        for percentile, value in zip(PERCENTILES, np.percentile(scores, PERCENTILES)):
+            summary[f"Percentile{percentile}"] = float(value)
+        return summary
+
+
+class QuantileSketch:
+    """
+    Mergeable log-binned quantile sketch of positive values. Every quantile estimate is within the
+    given relative error of a value of the requested rank.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.zero_count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        # Bin index -> count
+        self.bins = {}
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        if (values < 0).any():
+            raise ValueError("QuantileSketch only supports non-negative values")
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        keys, counts = np.unique(
+            np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True
+        )
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge quantile sketches with different relative accuracy")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def quantile(self, q):
+        """
+        Estimate the q-th quantile (0 <= q <= 1), using the same rank as numpy's linear method.
+        """
+        if self.count == 0:
+            raise statistics.StatisticsError("no quantile for empty data")
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                estimate = 2 * self.gamma**key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+
+class SketchFitnessStats:
+    """
+    Flat-memory monthly fitness statistics, with exact moments and sketched percentiles.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.moments = ExactMoments()
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def __len__(self):
+        return self.moments.count
+
+    def add(self, values):
+        self.moments.add(values)
+        self.sketch.add(values)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+
+    def summary(self):
+        """
+        Compute the statistics reported for the month.
+
+        Returns
+        ----------
+        Dict[str, float]
+            The mean, median, max, standard deviation and each of the 'PERCENTILES'.
+        """
+        summary = {
+            "Mean": self.moments.mean(),
+            "Median": self.sketch.quantile(0.5),
+            "Max": self.moments.max,
+            "StandardDeviation": self.moments.stdev(),
+        }
+        for percentile in PERCENTILES:
+            summary[f"Percentile{percentile}"] = self.sketch.quantile(percentile / 100)
+        return summary
+
+
+def new_fitness_stats(mode="exact", relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Create an empty monthly fitness statistics accumulator.
+
+    Parameters
+    ----------
+    mode: str (Optional)
+        One of 'STATS_MODES': "exact" stores every score, "sketch" estimates percentiles in flat memory.
+
+    relative_accuracy: float (Optional)
+        The relative error bound of the percentiles in "sketch" mode.
+
+    Returns
+    ----------
+    ExactFitnessStats or SketchFitnessStats
+        The empty accumulator.
+    """
+    if mode == "exact":
+        return ExactFitnessStats()
+    if mode == "sketch":
+        return SketchFitnessStats(relative_accuracy)
+    raise ValueError(f"Unknown fitness stats mode '{mode}', expected one of: {STATS_MODES}")
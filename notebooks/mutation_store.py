@@ -0,0 +1,341 @@
+"""
+Columnar (Parquet) store of the nucleotide mutations of every sample in the MAT.
+
+The store has one row per (sample, position, ref, alt) mutation, with dictionary-encoded sample,
+ref and alt columns. Rows are written in row groups as samples stream out of the MAT, and a sample's
+mutations are never split across row groups, so consumers can memory-map the file and process it
+one row group at a time. Samples identical to the reference are stored as a single row with a
+null position, ref and alt.
+
+The store is written to a temporary file that only replaces the existing store once complete, so an
+existing store can be updated incrementally by copying its row groups (minus any removed or changed
+samples) into the new store, along with the added and changed samples.
+
+A sample's haplotype digest, the sum (modulo 2^64) of a 64-bit hash of each of its (position, alt)
+mutations, identifies its haplotype independently of the order of its mutations, so it can be computed
+for stored samples (see 'SampleMutationBatch.haplotype_digests') and maintained incrementally while
+walking the MAT (see 'mutation_digest'), to find samples whose haplotype changed.
+"""
+
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from nucleotides import NUCLEOTIDES, NUM_NT_CODES, UNKNOWN_NT, encode_nucleotides
+
+# Target number of mutation rows per row group
+DEFAULT_ROW_GROUP_SIZE = 2_000_000
+MASK64 = (1 << 64) - 1
+_ALT_CODES = {nt: code for code, nt in enumerate(NUCLEOTIDES)}
+
+SCHEMA = pa.schema(
+    [
+        ("sample", pa.dictionary(pa.int32(), pa.string())),
+        ("position", pa.int32()),
+        ("ref", pa.dictionary(pa.int32(), pa.string())),
+        ("alt", pa.dictionary(pa.int32(), pa.string())),
+    ]
+)
+
+
+def mutation_digest(position, alt):
+    """
+    Get the 64-bit hash of a single mutation (the SplitMix64 finalizer of its position and alt allele),
+    equal to the hash computed by 'mutation_digests'.
+
+    Parameters
+    ----------
+    position: int
+        The mutated position.
+
+    alt: str
+        The alternate allele, eg) "G".
+
+    Returns
+    ----------
+    int
+        The hash, as an unsigned 64-bit integer.
+    """
+    z = (position * NUM_NT_CODES + _ALT_CODES.get(alt, UNKNOWN_NT) + 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def mutation_digests(positions, alt_codes):
+    """
+    Vectorized 'mutation_digest' of arrays of mutated positions and alt allele codes (see 'encode_nucleotides').
+    """
+    z = positions.astype(np.uint64) * np.uint64(NUM_NT_CODES) + alt_codes.astype(np.uint64)
+    z += np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class SampleMutationWriter:
+    """
+    Streams samples and their nucleotide mutations into the Parquet sample mutation store.
+    """
+
+    def __init__(self, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression="zstd")
+        self.num_samples = 0
+        self._reset()
+
+    def _reset(self):
+        self.samples = []
+        self.sample_idx = []
+        self.positions = []
+        self.refs = []
+        self.alts = []
+
+    def add(self, sample, mutations):
+        """
+        Add a sample and its nucleotide mutations to the store.
+
+        Parameters
+        ----------
+        sample: str
+            The sample name.
+
+        mutations: Iterable[str]
+            The nucleotide mutations of the sample, eg) {"A1234G", "C5678T"}.
+        """
+        idx = len(self.samples)
+        self.samples.append(sample)
+        parsed = sorted((int(m[1:-1]), m[0], m[-1]) for m in mutations)
+        if not parsed:
+            # Sample identical to the reference
+            parsed = [(None, None, None)]
+        for position, ref, alt in parsed:
+            self.sample_idx.append(idx)
+            self.positions.append(position)
+            self.refs.append(ref)
+            self.alts.append(alt)
+        self.num_samples += 1
+        if len(self.positions) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered samples to the store as a single row group.
+        """
+        if not self.samples:
+            return
+        sample_column = pa.DictionaryArray.from_arrays(
+            pa.array(self.sample_idx, type=pa.int32()), pa.array(self.samples, type=pa.string())
+        )
+        table = pa.Table.from_arrays(
+            [
+                sample_column,
+                pa.array(self.positions, type=pa.int32()),
+                pa.array(self.refs, type=pa.string()).dictionary_encode(),
+                pa.array(self.alts, type=pa.string()).dictionary_encode(),
+            ],
+            schema=SCHEMA,
+        )
+        self.writer.write_table(table, row_group_size=len(table))
+        self._reset()
+
+    def copy_row_group(self, store, row_group, removed_samples=None):
+        """
+        Copy a row group of an existing store into this store as a single row group.
+
+        Parameters
+        ----------
+        store: ParquetFile
+            The existing sample mutation store, see 'open_store'.
+
+        row_group: int
+            The index of the row group to copy.
+
+        removed_samples: pa.Array (Optional)
+            The names of samples to leave out of the copy.
+        """
+        self.flush()
+        table = store.read_row_group(row_group)
+        if removed_samples is not None:
+            samples = table.column("sample").cast(pa.string())
+            table = table.filter(pc.invert(pc.is_in(samples, value_set=removed_samples)))
+        if len(table) == 0:
+            return
+        # Re-encode the dictionaries, so they only hold the remaining samples
+        columns = [
+            pc.dictionary_encode(table.column(name).cast(pa.string()).combine_chunks())
+            if pa.types.is_dictionary(field.type)
+            else table.column(name).combine_chunks()
+            for name, field in zip(SCHEMA.names, SCHEMA)
+        ]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=SCHEMA), row_group_size=len(table))
+        self.num_samples += len(columns[0].dictionary)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """
+        Close the writer without replacing the existing store.
+        """
+        self.writer.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Leave any existing store untouched
+            self.discard()
+            return
+        self.close()
+
+
+class SampleMutationBatch:
+    """
+    The samples and nucleotide mutations read from a single row group of the store.
+    """
+
+    def __init__(self, samples, sample_idx, positions, alts):
+        # Sample names in this batch
+        self.samples = samples
+        # Per mutation arrays, ordered by sample. Samples identical to the reference have no entries.
+        self.sample_idx = sample_idx
+        self.positions = positions
+        self.alts = alts
+
+    def __len__(self):
+        return len(self.samples)
+
+    def sample_bounds(self):
+        """
+        Get the [start, end) range of mutation entries of each sample in this batch.
+
+        Returns
+        ----------
+        np.ndarray
+            Array of length len(samples) + 1, where sample i's mutations are in [bounds[i], bounds[i + 1]).
+        """
+        return np.searchsorted(self.sample_idx, np.arange(len(self.samples) + 1))
+
+    def haplotype_digests(self):
+        """
+        Get the haplotype digest of each sample in this batch, see the module docstring.
+
+        Returns
+        ----------
+        np.ndarray
+            The uint64 digest of each sample, 0 for samples identical to the reference.
+        """
+        # Wrapping sums of the mutation hashes of each sample, from the running (wrapping) sum
+        running = np.zeros(len(self.positions) + 1, dtype=np.uint64)
+        np.cumsum(mutation_digests(self.positions, self.alts), out=running[1:])
+        bounds = self.sample_bounds()
+        return running[bounds[1:]] - running[bounds[:-1]]
+
+
+def open_store(path):
+    """
+    Open the sample mutation store, memory-mapped.
+
+    Parameters
+    ----------
+    path: str
+        The path to the Parquet sample mutation store.
+
+    Returns
+    ----------
+    ParquetFile
+        The opened Parquet file.
+    """
+    return pq.ParquetFile(path, memory_map=True)
+
+
+def _dictionary_column(table, name):
+    column = table.column(name).combine_chunks()
+    if not pa.types.is_dictionary(column.type):
+        column = column.dictionary_encode()
+    return column
+
+
+def read_row_group_samples(store, row_group):
+    """
+    Read the names of the samples in a single row group of the store.
+
+    Parameters
+    ----------
+    store: ParquetFile
+        The sample mutation store, see 'open_store'.
+
+    row_group: int
+        The index of the row group to read.
+
+    Returns
+    ----------
+    pa.Array
+        The names of the samples in the row group.
+    """
+    table = store.read_row_group(row_group, columns=["sample"])
+    return _dictionary_column(table, "sample").dictionary
+
+
+def read_batch(store, row_group):
+    """
+    Read the samples and mutations in a single row group of the store.
+
+    Parameters
+    ----------
+    store: ParquetFile
+        The sample mutation store, see 'open_store'.
+
+    row_group: int
+        The index of the row group to read.
+
+    Returns
+    ----------
+    SampleMutationBatch
+        The samples and mutations of the row group, with alternate alleles encoded by 'encode_nucleotides'.
+    """
+    table = store.read_row_group(row_group, columns=["sample", "position", "alt"])
+    samples = _dictionary_column(table, "sample")
+    alts = _dictionary_column(table, "alt")
+    positions = table.column("position").combine_chunks()
+
+    # Drop the null entries of samples identical to the reference
+    valid = positions.is_valid().to_numpy(zero_copy_only=False)
+    sample_idx = samples.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    alt_idx = alts.indices.fill_null(0).to_numpy(zero_copy_only=False)
+    # Map the alt dictionary to nucleotide codes, the extra entry covers null entries
+    alt_codes = np.append(encode_nucleotides(alts.dictionary.to_pylist()), 0).astype(np.uint8)
+    return SampleMutationBatch(
+        samples.dictionary.to_pylist(),
+        sample_idx[valid],
+        positions.fill_null(0).to_numpy(zero_copy_only=False).astype(np.int64)[valid],
+        alt_codes[alt_idx][valid],
+    )
+
+
+def iter_batches(path):
+    """
+    Iterate over the sample mutation store one row group at a time.
+
+    Parameters
+    ----------
+    path: str
+        The path to the Parquet sample mutation store.
+
+    Returns
+    ----------
+    Iterator[SampleMutationBatch]
+        The samples and mutations of each row group.
+    """
+    store = open_store(path)
+    for row_group in range(store.num_row_groups):
+        yield read_batch(store, row_group)
@@ -0,0 +1,203 @@
+"""
+Columnar (Parquet) table of the branch mutations of every node in the MAT.
+
+The table has one row per node, in depth-first (preorder) order, so every node comes after its parent.
+Each row holds the node id, the row index of its parent (-1 for the root), whether it is a leaf, and the
+nucleotide mutations on the branch leading to it as position, ref (parent allele) and alt lists. Unlike
+the sample mutations store, mutations shared by a clade are stored once on the branch they occur on, so
+per node quantities (eg. fitness) can be accumulated down the tree in a single pass.
+"""
+
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Number of nodes per row group
+DEFAULT_ROW_GROUP_SIZE = 1_000_000
+
+SCHEMA = pa.schema(
+    [
+        ("node", pa.string()),
+        ("parent", pa.int32()),
+        ("is_leaf", pa.bool_()),
+        ("position", pa.list_(pa.int32())),
+        ("ref", pa.list_(pa.uint8())),
+        ("alt", pa.list_(pa.uint8())),
+    ]
+)
+
+
+class NodeMutationWriter:
+    """
+    Streams the nodes of the MAT (in preorder) and their branch mutations into the node mutations table.
+    """
+
+    def __init__(self, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression="zstd")
+        self.num_nodes = 0
+        self._reset()
+
+    def _reset(self):
+        self.nodes = []
+        self.parents = []
+        self.is_leaf = []
+        self.offsets = [0]
+        self.mutations = []
+
+    def add(self, node, parent, is_leaf, mutations):
+        """
+        Add a node and the nucleotide mutations on its branch to the table.
+
+        Parameters
+        ----------
+        node: str
+            The node id.
+
+        parent: int
+            The index of the node's parent in the table, -1 for the root.
+
+        is_leaf: bool
+            Whether the node is a leaf (sample).
+
+        mutations: List[str]
+            The nucleotide mutations on the branch leading to the node, eg) ["A1234G", "C5678T"].
+
+        Returns
+        ----------
+        int
+            The index of the node in the table.
+        """
+        self.nodes.append(node)
+        self.parents.append(parent)
+        self.is_leaf.append(is_leaf)
+        self.mutations.extend(mutations)
+        self.offsets.append(len(self.mutations))
+        self.num_nodes += 1
+        if len(self.nodes) >= self.row_group_size:
+            self.flush()
+        return self.num_nodes - 1
+
+    def flush(self):
+        """
+        Write all buffered nodes to the table as a single row group.
+        """
+        if not self.nodes:
+            return
+        offsets = pa.array(self.offsets, type=pa.int32())
+        positions = np.array([int(m[1:-1]) for m in self.mutations], dtype=np.int32)
+        refs = np.frombuffer("".join(m[0] for m in self.mutations).encode("ascii"), dtype=np.uint8)
+        alts = np.frombuffer("".join(m[-1] for m in self.mutations).encode("ascii"), dtype=np.uint8)
+        table = pa.Table.from_arrays(
+            [
+                pa.array(self.nodes, type=pa.string()),
+                pa.array(self.parents, type=pa.int32()),
+                pa.array(self.is_leaf, type=pa.bool_()),
+                pa.ListArray.from_arrays(offsets, pa.array(positions)),
+                pa.ListArray.from_arrays(offsets, pa.array(refs)),
+                pa.ListArray.from_arrays(offsets, pa.array(alts)),
+            ],
+            schema=SCHEMA,
+        )
+        self.writer.write_table(table, row_group_size=len(table))
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Leave any existing table untouched
+            self.writer.close()
+            os.remove(self.tmp_path)
+            return
+        self.close()
+
+
+class NodeMutations:
+    """
+    The nodes of the MAT in preorder, and the nucleotide mutations on each node's branch.
+    """
+
+    def __init__(self, nodes, parents, is_leaf, offsets, positions, refs, alts):
+        """
+        Parameters
+        ----------
+        nodes: List[str]
+            The node ids, in preorder.
+
+        parents: np.ndarray
+            The index of each node's parent, -1 for the root.
+
+        is_leaf: np.ndarray
+            Whether each node is a leaf.
+
+        offsets: np.ndarray
+            Array of length len(nodes) + 1, where node i's branch mutations are in [offsets[i], offsets[i + 1]).
+
+        positions: np.ndarray
+            The 1-based position of each branch mutation.
+
+        refs: np.ndarray
+            The parent allele of each branch mutation, as uint8 ASCII codes.
+
+        alts: np.ndarray
+            The alternate allele of each branch mutation, as uint8 ASCII codes.
+        """
+        self.nodes = nodes
+        self.parents = parents
+        self.is_leaf = is_leaf
+        self.offsets = offsets
+        self.positions = positions
+        self.refs = refs
+        self.alts = alts
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def branch_node_idx(self):
+        """
+        Get the index of the node each branch mutation is on.
+        """
+        return np.repeat(np.arange(len(self.nodes)), np.diff(self.offsets))
+
+
+def load_node_mutations(path):
+    """
+    Load the node mutations table.
+
+    Parameters
+    ----------
+    path: str
+        The path to the Parquet node mutations table.
+
+    Returns
+    ----------
+    NodeMutations
+        The nodes of the MAT and their branch mutations.
+    """
+    table = pq.read_table(path, memory_map=True)
+
+    def flatten(name):
+        column = table.column(name).combine_chunks()
+        return column.flatten().to_numpy(zero_copy_only=False)
+
+    num_mutations = pc.list_value_length(table.column("position")).to_numpy()
+    return NodeMutations(
+        table.column("node").to_pylist(),
+        table.column("parent").to_numpy(),
+        table.column("is_leaf").to_numpy(),
+        np.concatenate([[0], np.cumsum(num_mutations, dtype=np.int64)]),
+        flatten("position").astype(np.int64),
+        flatten("ref"),
+        flatten("alt"),
+    )
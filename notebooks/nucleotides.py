@@ -0,0 +1,37 @@
+"""
+Integer encoding of nucleotides, shared by the sample mutation store and the amino acid translator.
+
+Kept free of the pyrocov dependency, so it can be used in every pixi environment.
+"""
+
+import numpy as np
+
+NUCLEOTIDES = "ACGT"
+# Code given to any nucleotide character not in 'NUCLEOTIDES'
+UNKNOWN_NT = len(NUCLEOTIDES)
+NUM_NT_CODES = len(NUCLEOTIDES) + 1
+
+# ASCII character -> nucleotide code lookup table
+_NT_CODES = np.full(256, UNKNOWN_NT, dtype=np.uint8)
+for _i, _nt in enumerate(NUCLEOTIDES):
+    _NT_CODES[ord(_nt)] = _i
+
+
+def encode_nucleotides(nucleotides):
+    """
+    Encode a string (or sequence of single characters) of nucleotides as integer codes.
+
+    Parameters
+    ----------
+    nucleotides: str or List[str]
+        The nucleotides to encode, eg) "ACGT" or ["A", "G"].
+
+    Returns
+    ----------
+    np.ndarray
+        The uint8 nucleotide codes, with any character not in 'NUCLEOTIDES' given 'UNKNOWN_NT'.
+    """
+    if not isinstance(nucleotides, str):
+        nucleotides = "".join(nucleotides)
+    ascii_codes = np.frombuffer(nucleotides.encode("ascii"), dtype=np.uint8)
+    return _NT_CODES[ascii_codes]
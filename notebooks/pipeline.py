@@ -0,0 +1,429 @@
+"""
+Incremental, content-hash based runner for the data generation pipeline.
+
+Each stage declares the artifacts (files) it reads and writes. After a stage runs, the content hashes of
+its inputs are recorded in a state file in the data directory, and on later runs a stage is only rerun
+if one of its outputs is missing or the content of one of its inputs changed. Since downstream stages
+read the outputs of upstream stages, swapping one input file only reruns the stages downstream of it,
+and an upstream stage that reproduces identical outputs does not trigger its downstream stages.
+
+Stages whose inputs are not available (eg. the MAT, when using the provided data files) are treated as
+external sources, and their existing outputs are used as is. On the first run (with no state file), stages
+whose outputs all exist are adopted as up to date, recording the current hashes of their inputs, rather
+than being rerun.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+from file_stamps import file_fingerprint
+from profiling import stage as profiled_stage
+from util import download_data_files, merge_datafiles, run_chronumental
+
+STATE_FILE = ".pipeline_state.json"
+# Suffix of the previous outputs of a running stage, restored if the stage fails
+PREVIOUS_OUTPUT_SUFFIX = ".previous"
+# Stages run by default, along with any of their out of date upstream stages
+DEFAULT_TARGETS = ["merge"]
+# Reason given for the stages whose inputs are missing, see 'Pipeline.plan'
+CANNOT_RUN = "CANNOT RUN"
+GB = 1 << 30
+
+
+class Stage:
+    """
+    A single step of the pipeline, producing its output files from its input files.
+    """
+
+    def __init__(self, name, inputs, outputs, run, base_seconds, seconds_per_gb=0, incremental=False):
+        """
+        Parameters
+        ----------
+        name: str
+            The name of the stage.
+
+        inputs: List[str]
+            The paths of the files the stage reads.
+
+        outputs: List[str]
+            The paths of the files the stage writes.
+
+        run: Callable[[], None]
+            Runs the stage.
+
+        base_seconds: float
+            Rough fixed cost of running the stage, used for the '--dry-run' estimates.
+
+        seconds_per_gb: float (Optional)
+            Rough additional cost of running the stage per GB of input.
+
+        incremental: bool (Optional)
+            Whether the stage updates its existing outputs, rather than rebuilding them from scratch.
+        """
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.base_seconds = base_seconds
+        self.seconds_per_gb = seconds_per_gb
+        self.incremental = incremental
+
+    def estimated_seconds(self):
+        input_bytes = sum(os.path.getsize(path) for path in self.inputs if os.path.exists(path))
+        return self.base_seconds + self.seconds_per_gb * input_bytes / GB
+
+
+def pixi_command(environment, script):
+    """
+    Build a stage run function that runs one of the notebook scripts in its pixi environment.
+    """
+
+    def run():
+        cmd = ["pixi", "run", "--environment", environment, "python", script]
+        print("Running: ", " ".join(cmd))
+        subprocess.run(cmd, check=True)
+
+    return run
+
+
+def build_stages(config):
+    """
+    Build the stages of the data generation pipeline, in dependency order.
+
+    Parameters
+    ----------
+    config: Config
+        The loaded 'config.yaml'.
+
+    Returns
+    ----------
+    List[Stage]
+        The pipeline stages.
+    """
+    return [
+        Stage(
+            "download",
+            [],
+            [config.CASES_FILE, config.PYRO_MUTATIONS_FILE],
+            lambda: download_data_files(config.DATA_DIR),
+            base_seconds=10,
+        ),
+        Stage(
+            "chronumental",
+            [config.MAT, config.METADATA],
+            [config.CHRONUMENTAL_FILE],
+            lambda: run_chronumental(
+                config.MAT, config.METADATA, config.DATA_DIR, config.CHRONUMENTAL_FILE
+            ),
+            base_seconds=3600,
+            seconds_per_gb=3600,
+        ),
+        Stage(
+            "recomb-trios-fitness",
+            [config.RIVET_VCF_FILE, config.PYRO_MUTATIONS_FILE, config.reference_filepath],
+            [config.fitness_results_path],
+            pixi_command("pyro-env", "notebooks/fitness.py"),
+            base_seconds=20,
+            seconds_per_gb=60,
+        ),
+        Stage(
+            "merge",
+            [
+                config.GENETIC_DIVERSITY_FILE,
+                config.CASES_FILE,
+                config.CHRONUMENTAL_FILE,
+                config.RIVET_RESULTS_FILE,
+                config.RIVET_VCF_FILE,
+                config.fitness_results_path,
+            ],
+            [config.RECOMBINATION_STATS_FILE],
+            lambda: merge_datafiles(config),
+            base_seconds=10,
+            seconds_per_gb=20,
+        ),
+        Stage(
+            "sample-mutations",
+            [config.MAT],
+            [config.sample_mutations_path, config.node_mutations_path],
+            pixi_command("bte-env", "notebooks/get_mutations.py"),
+            base_seconds=600,
+            seconds_per_gb=900,
+            incremental=True,
+        ),
+        Stage(
+            "node-fitness",
+            [config.node_mutations_path, config.PYRO_MUTATIONS_FILE, config.reference_filepath],
+            [config.node_fitness_path],
+            pixi_command("pyro-env", "notebooks/tree_fitness.py"),
+            base_seconds=120,
+            seconds_per_gb=600,
+        ),
+        Stage(
+            "circulating-fitness-stats",
+            [
+                config.sample_mutations_path,
+                config.PYRO_MUTATIONS_FILE,
+                config.CHRONUMENTAL_FILE,
+                config.reference_filepath,
+            ],
+            [config.MONTHLY_FITNESS_STATS_FILE],
+            pixi_command("pyro-env", "notebooks/fitness_stats.py"),
+            base_seconds=300,
+            seconds_per_gb=120,
+            incremental=True,
+        ),
+    ]
+
+
+class Pipeline:
+    """
+    Runs the out of date stages needed to build the target stages' outputs.
+    """
+
+    def __init__(self, stages, state_path):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.state = {"stages": {}, "hashes": {}}
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def file_hash(self, path):
+        """
+        Content hash of the given file, memoized in the state file (see 'file_stamps.file_fingerprint') so
+        unchanged (large) files are not rehashed on every run.
+        """
+        return file_fingerprint(path, self.state["hashes"])
+
+    def upstream(self, name):
+        """
+        Get the stages producing the inputs of the given stage.
+        """
+        inputs = set(self.stages[name].inputs)
+        return [
+            other.name
+            for other in self.stages.values()
+            if other.name != name and inputs.intersection(other.outputs)
+        ]
+
+    def plan_order(self, targets):
+        """
+        Get the target stages and all their upstream stages, in dependency order.
+        """
+        order = []
+
+        def visit(name, path):
+            if name in order:
+                return
+            if name in path:
+                raise ValueError(f"Pipeline stage dependency cycle: {path + [name]}")
+            for upstream in self.upstream(name):
+                visit(upstream, path + [name])
+            order.append(name)
+
+        for name in targets:
+            if name not in self.stages:
+                raise ValueError(f"Unknown pipeline stage '{name}', expected one of: {list(self.stages)}")
+            visit(name, [])
+        return order
+
+    def stale_reason(self, name, rerun, force, ran=()):
+        """
+        Get the reason the given stage must be rerun, or None if it is up to date.
+
+        Parameters
+        ----------
+        name: str
+            The name of the stage.
+
+        rerun: Set[str]
+            The stages planned to (re)run upstream of this stage.
+
+        force: Set[str]
+            The stages to rerun even if they are up to date.
+
+        ran: Set[str] (Optional)
+            The stages already run (by 'run'), whose outputs are newer than any unrecorded stage's outputs.
+
+        Returns
+        ----------
+        str or None
+            Why the stage is out of date.
+        """
+        stage = self.stages[name]
+        missing_outputs = [path for path in stage.outputs if not os.path.exists(path)]
+        missing_inputs = [path for path in stage.inputs if not os.path.exists(path)]
+        if name in force:
+            if missing_inputs and not rerun:
+                raise FileNotFoundError(f"Stage '{name}' can't be rerun without its inputs: {missing_inputs}")
+            return "forced"
+        upstream_reruns = [upstream for upstream in self.upstream(name) if upstream in rerun]
+        if upstream_reruns:
+            return "upstream stage(s) {} out of date".format(", ".join(upstream_reruns))
+        if missing_inputs:
+            # Can't be (re)built here, use the existing outputs as an external source
+            if missing_outputs:
+                raise FileNotFoundError(
+                    f"Stage '{name}' outputs {missing_outputs} not found, and can't be built without its inputs: {missing_inputs}"
+                )
+            return None
+        if missing_outputs:
+            return "missing output(s): {}".format(", ".join(map(os.path.basename, missing_outputs)))
+        recorded = self.state["stages"].get(name)
+        if recorded is None:
+            ran_upstream = [upstream for upstream in self.upstream(name) if upstream in ran]
+            if ran_upstream:
+                return "no record of previous run, upstream stage(s) {} ran".format(", ".join(ran_upstream))
+            # Outputs built before the pipeline kept state (eg. provided with the repository), see 'adopt'
+            return None
+        changed = [
+            path for path in stage.inputs if recorded["inputs"].get(path) != self.file_hash(path)
+        ]
+        if changed:
+            return "changed input(s): {}".format(", ".join(map(os.path.basename, changed)))
+        return None
+
+    def plan(self, targets, force=()):
+        """
+        Determine which stages need to run to bring the targets up to date.
+
+        Returns
+        ----------
+        List[Tuple[str, str or None]]
+            Each stage (in dependency order) and the reason it is out of date, None if up to date.
+        """
+        rerun = set()
+        plan = []
+        for name in self.plan_order(targets):
+            try:
+                reason = self.stale_reason(name, rerun, set(force))
+            except FileNotFoundError as e:
+                reason = f"{CANNOT_RUN}, {e}"
+            if reason is not None:
+                rerun.add(name)
+            plan.append((name, reason))
+        return plan
+
+    def print_plan(self, targets, force=()):
+        """
+        Print the plan (see 'plan') and its estimated run time, listing the stages that cannot run
+        separately, as they are left out of the estimate.
+        """
+        total = 0
+        blocked = []
+        print("Pipeline plan:")
+        for name, reason in self.plan(targets, force):
+            if reason is None:
+                print(f"  {name:<28} up to date")
+            elif reason.startswith(CANNOT_RUN):
+                blocked.append((name, reason))
+            else:
+                seconds = self.stages[name].estimated_seconds()
+                total += seconds
+                print(f"  {name:<28} RUN  (~{format_duration(seconds)}): {reason}")
+        print(f"Estimated total: ~{format_duration(total)}")
+        if blocked:
+            print("Not included in the estimate:")
+            for name, reason in blocked:
+                print(f"  {name:<28} {reason}")
+
+    def record(self, name, seconds=None):
+        """
+        Record the input and output hashes of a stage, as of its last run.
+        """
+        stage = self.stages[name]
+        self.state["stages"][name] = {
+            "inputs": {path: self.file_hash(path) for path in stage.inputs},
+            "outputs": {path: self.file_hash(path) for path in stage.outputs},
+            "seconds": seconds,
+        }
+        self.save_state()
+
+    def adopt(self, name):
+        """
+        Record the current hashes of a stage with no previous run recorded, whose inputs and outputs all exist,
+        so it is treated as up to date until one of its inputs changes.
+        """
+        stage = self.stages[name]
+        if name in self.state["stages"] or not all(os.path.exists(path) for path in stage.inputs + stage.outputs):
+            return
+        print(f"Stage '{name}' has no record of a previous run, using its existing outputs.")
+        self.record(name)
+
+    def run_stage(self, name):
+        """
+        Run a stage. Unless the stage is incremental, its previous outputs are moved aside so it rebuilds them,
+        and are only removed once it succeeds, being restored if it fails.
+        """
+        stage = self.stages[name]
+        previous = []
+        if not stage.incremental:
+            for path in stage.outputs:
+                if os.path.exists(path):
+                    os.replace(path, path + PREVIOUS_OUTPUT_SUFFIX)
+                    previous.append(path)
+        try:
+            stage.run()
+        except BaseException:
+            for path in previous:
+                os.replace(path + PREVIOUS_OUTPUT_SUFFIX, path)
+            raise
+        for path in previous:
+            os.remove(path + PREVIOUS_OUTPUT_SUFFIX)
+
+    def run(self, targets, force=()):
+        """
+        Run the out of date stages needed to build the targets, recording the inputs of each stage run.
+        Unlike the plan, a stage whose upstream stage reran but reproduced identical outputs is skipped.
+        """
+        ran = set()
+        for name in self.plan_order(targets):
+            reason = self.stale_reason(name, set(), set(force), ran)
+            if reason is None:
+                self.adopt(name)
+                print(f"Stage '{name}' up to date.")
+                continue
+            print(f"Running stage '{name}': {reason}")
+            start = time.time()
+            with profiled_stage(f"pipeline:{name}"):
+                self.run_stage(name)
+            self.record(name, round(time.time() - start, 1))
+            ran.add(name)
+            print(f"Stage '{name}' finished in {format_duration(time.time() - start)}.")
+
+
+def format_duration(seconds):
+    """
+    Format a duration in seconds as a short human readable string, eg) "2h 05m".
+    """
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+def load_pipeline(config):
+    """
+    Build the data generation pipeline with its recorded state from the data directory.
+
+    Parameters
+    ----------
+    config: Config
+        The loaded 'config.yaml'.
+
+    Returns
+    ----------
+    Pipeline
+        The pipeline.
+    """
+    return Pipeline(build_stages(config), os.path.join(config.DATA_DIR, STATE_FILE))
@@ -0,0 +1,294 @@
+"""
+Stage-level instrumentation of the data pipeline.
+
+A stage is a timed block of code, a function decorated with 'profiled' or a 'with stage(...)' block,
+recording its wall time, CPU time (of the process and of its reaped worker processes), memory and
+counters of the items it processed (eg. rows or samples, see 'count'), along with the throughput of
+its main counter. Stages can be nested, eg) 'get_chronumental_dates' within a pipeline stage.
+
+The operating system only reports the peak RSS of a process over its lifetime (its high-water mark, which
+on Linux includes that of the process it was forked from), so a stage records the process's peak RSS when
+it started and finished, and its RSS growth: how far the stage raised the high-water mark. A stage using
+less memory than an earlier stage of the same process has no growth, its own peak is then only known to
+be below the process's peak.
+
+Every finished stage prints a one line summary. When the 'RECOMB_RUN_REPORT' environment variable is set
+to a path, the stages of the process are also appended to the JSON run report at that path, all at once
+when the process exits. Since the variable is inherited by subprocesses, the stages of every script run
+by the pipeline (see 'run.py') end up in the same report, each process appending under an exclusive lock
+of the report's '.lock' file.
+
+When the 'RECOMB_PROFILE_DIR' environment variable is set to a directory, each outermost stage is also run
+under cProfile, its stats dumped to '<stage>-<pid>.prof' in that directory (see 'pstats' or 'snakeviz').
+
+Kept free of third party dependencies, so it can be used in every pixi environment.
+"""
+
+import atexit
+import cProfile
+import fcntl
+import functools
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+RUN_REPORT_ENV = "RECOMB_RUN_REPORT"
+PROFILE_DIR_ENV = "RECOMB_PROFILE_DIR"
+# ru_maxrss is in bytes on macOS and kilobytes on Linux
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+MB = 1 << 20
+
+# Per process stack of the running stages (innermost last), the active profiler if any, and the records of
+# the finished stages not yet written to the run report
+_PROFILING_STATE = {"stack": [], "profiler": None, "records": []}
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Get the peak resident set size (MB) of the current process (or of its reaped child processes).
+    """
+    return resource.getrusage(who).ru_maxrss * RSS_UNIT / MB
+
+
+def cpu_seconds(who=resource.RUSAGE_SELF):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageMetrics:
+    """
+    The measurements of a running stage.
+    """
+
+    def __init__(self, name, unit=None, parent=None):
+        """
+        Parameters
+        ----------
+        name: str
+            The name of the stage.
+
+        unit: str (Optional)
+            The counter the stage's throughput is measured in, eg) "rows".
+
+        parent: str (Optional)
+            The name of the stage this stage runs within.
+        """
+        self.name = name
+        self.unit = unit
+        self.parent = parent
+        self.counters = {}
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.baseline_rss_mb = peak_rss_mb()
+        self.start_cpu = cpu_seconds()
+        self.start_children_cpu = cpu_seconds(resource.RUSAGE_CHILDREN)
+        self.start = time.perf_counter()
+
+    def add(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + int(n)
+
+    def finish(self):
+        """
+        Get the record of the finished stage.
+
+        Returns
+        ----------
+        Dict
+            The stage's wall and CPU seconds, the process's peak RSS (MB) before and after running it and
+            the stage's growth of the peak RSS (see the module docstring), its counters and the throughput
+            of its unit counter (per second).
+        """
+        wall_seconds = time.perf_counter() - self.start
+        throughput = None
+        if self.unit in self.counters and wall_seconds > 0:
+            throughput = self.counters[self.unit] / wall_seconds
+        process_peak_rss_mb = peak_rss_mb()
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "pid": os.getpid(),
+            "started": self.started,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds() - self.start_cpu,
+            "children_cpu_seconds": cpu_seconds(resource.RUSAGE_CHILDREN) - self.start_children_cpu,
+            "baseline_rss_mb": self.baseline_rss_mb,
+            "process_peak_rss_mb": process_peak_rss_mb,
+            "rss_growth_mb": process_peak_rss_mb - self.baseline_rss_mb,
+            # Peak RSS of the largest reaped subprocess so far, eg) the workers of the stage
+            "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "counters": self.counters,
+            "unit": self.unit,
+            "throughput": throughput,
+        }
+
+
+def format_stage(record):
+    """
+    Format a stage record as a one line summary.
+    """
+    summary = (
+        f"Stage '{record['name']}': {record['wall_seconds']:.2f}s wall, {record['cpu_seconds']:.2f}s CPU"
+    )
+    if record["children_cpu_seconds"] > 0:
+        summary += f" (+{record['children_cpu_seconds']:.2f}s in subprocesses)"
+    summary += f", process peak RSS {record['process_peak_rss_mb']:.1f} MB (+{record['rss_growth_mb']:.1f} MB)"
+    for counter, n in record["counters"].items():
+        summary += f", {n:,} {counter}"
+    if record["throughput"] is not None:
+        summary += f" ({record['throughput']:,.0f} {record['unit']}/s)"
+    return summary
+
+
+@contextmanager
+def run_report_lock(path):
+    """
+    Hold an exclusive lock of the run report at the given path, while it is read and rewritten.
+
+    The lock is taken on a '.lock' file next to the report, since the report itself is replaced on
+    every write (see 'write_run_report').
+    """
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_run_report(path, report):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def start_run_report(path):
+    """
+    Start a new (empty) JSON run report at the given path, that the stages of this process and of its
+    subprocesses are appended to.
+
+    Parameters
+    ----------
+    path: str
+        The path of the JSON run report.
+    """
+    os.environ[RUN_REPORT_ENV] = os.path.abspath(path)
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "argv": sys.argv,
+        "cpus": os.cpu_count(),
+        "stages": [],
+    }
+    with run_report_lock(os.environ[RUN_REPORT_ENV]):
+        write_run_report(os.environ[RUN_REPORT_ENV], report)
+
+
+def append_to_run_report(record):
+    """
+    Buffer a finished stage, to be appended to the run report when the process exits, if one is enabled
+    (see 'RUN_REPORT_ENV').
+    """
+    if not os.environ.get(RUN_REPORT_ENV):
+        return
+    records = _PROFILING_STATE["records"]
+    if not records:
+        atexit.register(flush_run_report)
+    records.append(record)
+
+
+def flush_run_report():
+    """
+    Append the buffered stages of this process to the run report, see 'append_to_run_report'.
+    """
+    path = os.environ.get(RUN_REPORT_ENV)
+    records = _PROFILING_STATE["records"]
+    if not path or not records:
+        return
+    with run_report_lock(path):
+        report = {"stages": []}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                report = json.load(f)
+        report["stages"].extend(records)
+        write_run_report(path, report)
+    records.clear()
+
+
+@contextmanager
+def stage(name, unit=None):
+    """
+    Time a block of code as a pipeline stage, see the module docstring.
+
+    Parameters
+    ----------
+    name: str
+        The name of the stage.
+
+    unit: str (Optional)
+        The counter the stage's throughput is measured in, eg) "rows".
+
+    Yields
+    ----------
+    StageMetrics
+        The stage's measurements, whose counters can be added to directly or with 'count'.
+    """
+    stack = _PROFILING_STATE["stack"]
+    metrics = StageMetrics(name, unit, stack[-1].name if stack else None)
+    profiler = None
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    if profile_dir and _PROFILING_STATE["profiler"] is None:
+        # Nested stages are covered by the profile of their outermost stage
+        profiler = _PROFILING_STATE["profiler"] = cProfile.Profile()
+        profiler.enable()
+    stack.append(metrics)
+    try:
+        yield metrics
+    finally:
+        stack.pop()
+        record = metrics.finish()
+        if profiler is not None:
+            profiler.disable()
+            _PROFILING_STATE["profiler"] = None
+            os.makedirs(profile_dir, exist_ok=True)
+            filename = "{}-{}.prof".format(name.replace(":", "-"), os.getpid())
+            record["profile"] = os.path.join(profile_dir, filename)
+            profiler.dump_stats(record["profile"])
+        print(format_stage(record))
+        append_to_run_report(record)
+
+
+def profiled(name=None, unit=None):
+    """
+    Decorator timing every call of a function as a pipeline stage, see 'stage'.
+
+    Parameters
+    ----------
+    name: str (Optional)
+        The name of the stage, the function's name if not given.
+
+    unit: str (Optional)
+        The counter the stage's throughput is measured in, eg) "rows".
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__, unit):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(counter, n=1):
+    """
+    Add to a counter of the innermost running stage, eg) count("rows", len(df)). Does nothing outside of
+    a stage.
+    """
+    stack = _PROFILING_STATE["stack"]
+    if stack:
+        stack[-1].add(counter, n)
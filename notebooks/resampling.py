@@ -0,0 +1,396 @@
+"""
+Vectorized bootstrap and permutation tests of recombinant fitness.
+
+Replicates are drawn in batches, each batch being one matrix of random indices (or signs, or sort keys)
+over all the observations, so a batch of replicates is computed with a handful of NumPy operations. Every
+batch has its own seed, spawned from the test's seed, so the results only depend on the seed and number of
+replicates, and are identical whether the batches run serially or across worker processes.
+
+    - 'bootstrap_ci': percentile bootstrap confidence interval of a statistic (eg. the mean)
+    - 'paired_permutation_test': sign-flip test of paired differences, eg) each recombinant's fitness
+      minus the circulating median fitness of its month, against a mean difference of zero
+    - 'stratified_permutation_test': difference in means between two groups, with the group labels
+      permuted within each stratum (eg. month), eg) recombinants versus their parents
+"""
+
+from multiprocessing import Pool
+import numpy as np
+import polars as pl
+
+DEFAULT_REPLICATES = 100_000
+DEFAULT_CONFIDENCE = 0.95
+# Number of random draws (replicates x observations) in each batch of replicates
+BATCH_DRAWS = 1 << 22
+ALTERNATIVES = ["two-sided", "greater", "less"]
+# Maximum number of bits of the permutation sort keys holding the stratum and index, the rest being random
+MAX_KEY_BITS = 32
+
+# Per process state of the replicate batches, set by 'init_resampling_worker'
+_RESAMPLING_STATE = {}
+
+
+def _bootstrap_mean(values, rng, num_replicates):
+    idx = rng.integers(0, len(values), (num_replicates, len(values)))
+    return values[idx].mean(axis=1)
+
+
+def _bootstrap_median(values, rng, num_replicates):
+    idx = rng.integers(0, len(values), (num_replicates, len(values)))
+    return np.median(values[idx], axis=1)
+
+
+def _bootstrap_proportion(values, rng, num_replicates):
+    # The number of True values among n draws with replacement is Binomial(n, proportion of True values)
+    return rng.binomial(len(values), values.mean(), num_replicates) / len(values)
+
+
+def _sign_flips(values, rng, num_replicates):
+    # One random bit per sign, unpacked from random bytes
+    random_bytes = rng.integers(0, 256, (num_replicates, (len(values) + 7) // 8), dtype=np.uint8)
+    kept = np.unpackbits(random_bytes, axis=1, count=len(values)).astype(np.float64)
+    # Mean of the values with random signs, (sum of kept values - sum of flipped values) / n
+    return (2 * (kept @ values) - values.sum()) / len(values)
+
+
+def _stratified_permutations(values, rng, num_replicates):
+    """
+    Mean of the first group minus the mean of the second, with the group sizes of each stratum kept.
+    'values' holds the observations sorted by stratum, see 'stratified_permutation_test'.
+    """
+    # Each observation's sort key packs its stratum (high bits), random bits and its index (low bits), so one
+    # sort of the keys permutes the observations within every stratum at once, after which the positions of
+    # each stratum's first group hold a random subset of the stratum, of the group's size
+    keys = rng.bit_generator.random_raw((num_replicates, len(values)))
+    keys &= _RESAMPLING_STATE["random_bits"]
+    keys |= _RESAMPLING_STATE["key_base"]
+    keys.sort(axis=1)
+    group_positions = _RESAMPLING_STATE["group_positions"]
+    idx = keys[:, group_positions] & _RESAMPLING_STATE["index_mask"]
+    group_sum = values[idx.view(np.intp)].sum(axis=1)
+    num_group = len(group_positions)
+    return group_sum / num_group - (values.sum() - group_sum) / (len(values) - num_group)
+
+
+STATISTICS = {
+    "mean": np.mean,
+    "median": np.median,
+}
+KERNELS = {
+    "bootstrap_mean": _bootstrap_mean,
+    "bootstrap_median": _bootstrap_median,
+    "bootstrap_proportion": _bootstrap_proportion,
+    "sign_flips": _sign_flips,
+    "stratified_permutations": _stratified_permutations,
+}
+
+
+def init_resampling_worker(state):
+    """
+    Set up the state needed by 'run_batch' in the current (worker) process.
+    """
+    _RESAMPLING_STATE.clear()
+    _RESAMPLING_STATE.update(state)
+
+
+def run_batch(task):
+    """
+    Compute a batch of replicates of the current kernel.
+
+    Parameters
+    ----------
+    task: Tuple[int, np.random.SeedSequence]
+        The number of replicates in the batch and the batch's seed.
+
+    Returns
+    ----------
+    np.ndarray
+        The statistic of each replicate.
+    """
+    num_replicates, seed = task
+    kernel = KERNELS[_RESAMPLING_STATE["kernel"]]
+    return kernel(_RESAMPLING_STATE["values"], np.random.default_rng(seed), num_replicates)
+
+
+def run_replicates(kernel, values, replicates, seed, workers=1, **state):
+    """
+    Compute the replicates of a kernel in batches, in parallel when given more than one worker.
+
+    Parameters
+    ----------
+    kernel: str
+        The replicate kernel, see 'KERNELS'.
+
+    values: np.ndarray
+        The observations.
+
+    replicates: int
+        The number of replicates.
+
+    seed: int
+        The seed, from which the seed of each batch is spawned.
+
+    workers: int (Optional)
+        The number of worker processes.
+
+    Returns
+    ----------
+    np.ndarray
+        The statistic of each replicate, in the same order for any number of workers.
+    """
+    batch_size = max(1, BATCH_DRAWS // max(1, len(values)))
+    sizes = [min(batch_size, replicates - start) for start in range(0, replicates, batch_size)]
+    tasks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    state.update({"kernel": kernel, "values": np.ascontiguousarray(values, dtype=np.float64)})
+    if workers > 1 and len(tasks) > 1:
+        with Pool(min(workers, len(tasks)), initializer=init_resampling_worker, initargs=(state,)) as pool:
+            batches = pool.map(run_batch, tasks)
+    else:
+        init_resampling_worker(state)
+        batches = [run_batch(task) for task in tasks]
+    return np.concatenate(batches)
+
+
+def p_value(observed, replicates, alternative="two-sided"):
+    """
+    Permutation p-value of an observed statistic, counting the observed statistic as one of the replicates.
+
+    The two-sided p-value counts the replicates at least as far from the centre of the null distribution
+    (the mean of the replicates) as the observed statistic, as the null of a stratified permutation is
+    not centred at zero when the strata are unbalanced.
+    """
+    if alternative == "greater":
+        extreme = replicates >= observed
+    elif alternative == "less":
+        extreme = replicates <= observed
+    else:
+        centre = replicates.mean()
+        extreme = np.abs(replicates - centre) >= abs(observed - centre)
+    return (1 + int(extreme.sum())) / (1 + len(replicates))
+
+
+def bootstrap_ci(
+    values,
+    statistic="mean",
+    replicates=DEFAULT_REPLICATES,
+    confidence=DEFAULT_CONFIDENCE,
+    seed=0,
+    workers=1,
+):
+    """
+    Percentile bootstrap confidence interval of a statistic.
+
+    Parameters
+    ----------
+    values: array-like
+        The observations, eg) the normalized fitness of each recombinant. The mean of a boolean array
+        (eg. recombinants fitter than both parents) is the proportion of observations that are True,
+        whose replicates are drawn directly from its binomial distribution.
+
+    statistic: str (Optional)
+        The statistic, "mean" or "median".
+
+    replicates: int (Optional)
+        The number of bootstrap replicates.
+
+    confidence: float (Optional)
+        The confidence level of the interval.
+
+    seed: int (Optional)
+        The seed of the resampling.
+
+    workers: int (Optional)
+        The number of worker processes.
+
+    Returns
+    ----------
+    Dict
+        The statistic's "estimate" and the "lower" and "upper" bounds of its confidence interval.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError("Statistic must be one of: {}".format(list(STATISTICS)))
+    values = np.asarray(values)
+    kernel = "bootstrap_proportion" if values.dtype == bool and statistic == "mean" else "bootstrap_" + statistic
+    values = values.astype(np.float64)
+    stats = run_replicates(kernel, values, replicates, seed, workers)
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(stats, [alpha, 1 - alpha])
+    return {"estimate": float(STATISTICS[statistic](values)), "lower": float(lower), "upper": float(upper)}
+
+
+def paired_permutation_test(differences, replicates=DEFAULT_REPLICATES, alternative="two-sided", seed=0, workers=1):
+    """
+    Sign-flip permutation test of the mean of paired differences being zero, where under the null
+    hypothesis each difference is as likely to be positive as negative.
+
+    Parameters
+    ----------
+    differences: array-like
+        The paired differences, eg) each recombinant's log fitness minus the circulating median log
+        fitness of its month.
+
+    replicates: int (Optional)
+        The number of random sign flips.
+
+    alternative: str (Optional)
+        "two-sided", "greater" (mean difference above zero) or "less".
+
+    seed: int (Optional)
+        The seed of the resampling.
+
+    workers: int (Optional)
+        The number of worker processes.
+
+    Returns
+    ----------
+    Dict
+        The mean difference ("estimate") and its "p_value".
+    """
+    differences = np.asarray(differences, dtype=np.float64)
+    observed = differences.mean()
+    stats = run_replicates("sign_flips", differences, replicates, seed, workers)
+    return {"estimate": float(observed), "p_value": p_value(observed, stats, alternative)}
+
+
+def stratified_permutation_test(
+    values,
+    groups,
+    strata,
+    replicates=DEFAULT_REPLICATES,
+    alternative="two-sided",
+    seed=0,
+    workers=1,
+):
+    """
+    Permutation test of the difference in means of two groups, permuting the group labels within each
+    stratum, so that differences between strata (eg. the circulating fitness of each month) do not
+    confound the comparison.
+
+    Parameters
+    ----------
+    values: array-like
+        The observations.
+
+    groups: array-like
+        Whether each observation is in the first group (True) or second group (False).
+
+    strata: array-like
+        The stratum of each observation, eg) its month.
+
+    replicates: int (Optional)
+        The number of permutations.
+
+    alternative: str (Optional)
+        "two-sided", "greater" (first group's mean above the second's) or "less".
+
+    seed: int (Optional)
+        The seed of the resampling.
+
+    workers: int (Optional)
+        The number of worker processes.
+
+    Returns
+    ----------
+    Dict
+        The difference in means of the groups ("estimate") and its "p_value".
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups, dtype=bool)
+    _, strata_codes = np.unique(np.asarray(strata), return_inverse=True)
+    # Sort the observations by stratum, with each stratum's first group first
+    order = np.lexsort((~groups, strata_codes))
+    values, groups, strata_codes = values[order], groups[order], strata_codes[order]
+    if groups.all() or not groups.any():
+        raise ValueError("Both groups must have observations")
+    # Sort keys of the permutations, see '_stratified_permutations'
+    index_bits = max(1, (len(values) - 1).bit_length())
+    stratum_bits = max(1, int(strata_codes.max()).bit_length())
+    if index_bits + stratum_bits > MAX_KEY_BITS:
+        raise ValueError(f"Too many observations ({len(values)}) or strata to permute")
+    key_base = (strata_codes.astype(np.uint64) << np.uint64(64 - stratum_bits)) | np.arange(
+        len(values), dtype=np.uint64
+    )
+
+    observed = values[groups].mean() - values[~groups].mean()
+    stats = run_replicates(
+        "stratified_permutations",
+        values,
+        replicates,
+        seed,
+        workers,
+        key_base=key_base,
+        random_bits=np.uint64(((1 << (64 - stratum_bits)) - 1) ^ ((1 << index_bits) - 1)),
+        index_mask=np.uint64((1 << index_bits) - 1),
+        group_positions=np.flatnonzero(groups),
+    )
+    return {"estimate": float(observed), "p_value": p_value(observed, stats, alternative)}
+
+
+def recombinant_fitness_tests(recomb_data, norm_fitness, replicates=DEFAULT_REPLICATES, seed=0, workers=1):
+    """
+    Resampling tests of recombinant fitness against their parents and the circulating fitness of their month.
+
+    Parameters
+    ----------
+    recomb_data: DataFrame
+        The recombination stats of each recombinant joined with the monthly fitness stats,
+        see 'RecombAnalysis.recomb_data'.
+
+    norm_fitness: DataFrame
+        The min-max normalized fitness of each recombinant, see 'calc_norm_fitness'.
+
+    replicates: int (Optional)
+        The number of replicates of each test.
+
+    seed: int (Optional)
+        The seed of the resampling.
+
+    workers: int (Optional)
+        The number of worker processes.
+
+    Returns
+    ----------
+    DataFrame
+        The estimate, confidence interval ('Lower', 'Upper') and p-value of each test (null if not tested).
+    """
+    norm_by_max = recomb_data["RecombFitnessNormalizedByMaxParents"].to_numpy()
+    excess = (recomb_data["LnScore"] - recomb_data["LogMedian"]).to_numpy()
+    kwargs = {"replicates": replicates, "seed": seed, "workers": workers}
+    rows = []
+
+    def add(test, values, null=None):
+        row = {"Test": test}
+        row.update(bootstrap_ci(values, **kwargs))
+        row["p_value"] = None
+        if null is not None:
+            row["p_value"] = paired_permutation_test(np.asarray(values) - null, **kwargs)["p_value"]
+        rows.append(row)
+
+    # Recombinant fitness relative to the fitter parent, against neutral (1.0)
+    add("RecombFitnessNormalizedByMaxParents mean", norm_by_max, null=1.0)
+    add("NormFitness (min-max) mean", norm_fitness["NormFitness"].to_numpy())
+    add("Fraction fitter than both parents", norm_by_max > 1.0)
+    # Recombinant log fitness above the circulating median log fitness of its month
+    add("LnScore - circulating LogMedian mean", excess, null=0.0)
+    add("Fraction above circulating Percentile99", (recomb_data["Score"] > recomb_data["Percentile99"]).to_numpy())
+
+    # Recombinants against their parents, within each month
+    fitness = recomb_data.select("Score", "DonorFitness", "AcceptorFitness").to_numpy().ravel()
+    is_recombinant = np.tile([True, False, False], len(recomb_data))
+    months = np.repeat(recomb_data["Month"].to_numpy(), 3)
+    row = {"Test": "Recombinant - parent fitness mean, month-stratified", "lower": None, "upper": None}
+    row.update(
+        stratified_permutation_test(fitness, is_recombinant, months, **kwargs)
+    )
+    rows.append(row)
+
+    return pl.DataFrame(
+        rows,
+        schema={
+            "Test": pl.String,
+            "estimate": pl.Float64,
+            "lower": pl.Float64,
+            "upper": pl.Float64,
+            "p_value": pl.Float64,
+        },
+        orient="row",
+    ).rename({"estimate": "Estimate", "lower": "Lower", "upper": "Upper", "p_value": "PValue"})
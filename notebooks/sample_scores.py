@@ -0,0 +1,164 @@
+"""
+Table of the fitness score and inferred month of every sample in the sample mutations store.
+
+The table is written alongside the monthly fitness statistics, so when the MAT is updated only the added
+samples (and those whose haplotype changed, see the haplotype digests in 'mutation_store') need to be
+scored, and only the statistics of the months whose samples changed recomputed.
+The table records the PyR0 scores file and Chronumental file it was built from, and the statistics
+settings of the monthly fitness statistics written with it.
+
+The worker processes scoring shards of the store write their scores to Parquet parts (see
+'write_score_part'), which are streamed into the table in shard order, so the scores never pass
+through the main process.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SAMPLE_SCORES_SUFFIX = ".scores.parquet"
+
+SCHEMA = pa.schema(
+    [
+        ("sample", pa.string()),
+        ("fitness", pa.float64()),
+        ("month", pa.string()),
+        ("haplotype", pa.uint64()),
+    ]
+)
+
+
+def score_table(samples, fitness, months, haplotypes):
+    """
+    Build a table of the scores of a batch of samples, see 'SampleScoreWriter.add'.
+    """
+    return pa.Table.from_arrays(
+        [
+            pa.array(samples, type=pa.string()),
+            pa.array(np.asarray(fitness, dtype=np.float64)),
+            pa.array(months, type=pa.string()),
+            pa.array(np.asarray(haplotypes, dtype=np.uint64)),
+        ],
+        schema=SCHEMA,
+    )
+
+
+def score_part_path(parts_dir, name):
+    """
+    The path of a part of the sample scores table, eg) the part of a shard of the store.
+    """
+    return os.path.join(parts_dir, f"part-{name}.parquet")
+
+
+def write_score_part(path, samples, fitness, months, haplotypes):
+    """
+    Write the scores of a batch of samples to a part of the sample scores table, see
+    'SampleScoreWriter.add_part'.
+    """
+    tmp_path = path + ".tmp"
+    pq.write_table(score_table(samples, fitness, months, haplotypes), tmp_path)
+    os.replace(tmp_path, path)
+
+
+class SampleScoreWriter:
+    """
+    Streams sample fitness scores into the sample scores table.
+    """
+
+    def __init__(self, path, metadata):
+        """
+        Parameters
+        ----------
+        path: str
+            The path to write the table to.
+
+        metadata: Dict
+            The provenance of the scores, see 'load_sample_scores'.
+        """
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        # The parts written by the worker processes, see 'write_score_part'
+        self.parts_dir = path + ".parts"
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+        schema = SCHEMA.with_metadata({"provenance": json.dumps(metadata, sort_keys=True)})
+        self.writer = pq.ParquetWriter(self.tmp_path, schema, compression="zstd")
+
+    def add(self, samples, fitness, months, haplotypes):
+        """
+        Add the scores of a batch of samples.
+
+        Parameters
+        ----------
+        samples: List[str]
+            The sample names.
+
+        fitness: np.ndarray
+            The fitness of each sample.
+
+        months: List[str]
+            The inferred month of each sample.
+
+        haplotypes: np.ndarray
+            The haplotype digest of each sample, see 'SampleMutationBatch.haplotype_digests'.
+        """
+        self.writer.write_table(score_table(samples, fitness, months, haplotypes))
+
+    def add_part(self, path):
+        """
+        Stream the scores of a part (eg. written by 'write_score_part') into the table, and remove the part.
+        """
+        for batch in pq.ParquetFile(path).iter_batches():
+            self.writer.write_table(pa.Table.from_batches([batch]).cast(SCHEMA))
+        os.remove(path)
+
+    def write_frame(self, df):
+        """
+        Add the scores of a DataFrame with 'sample', 'fitness', 'month' and 'haplotype' columns.
+        """
+        self.writer.write_table(df.select(SCHEMA.names).to_arrow().cast(SCHEMA))
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.writer.close()
+            os.remove(self.tmp_path)
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+            return
+        self.close()
+
+
+def load_sample_scores(path):
+    """
+    Load the sample scores table, if it exists.
+
+    Parameters
+    ----------
+    path: str
+        The path to the sample scores table.
+
+    Returns
+    ----------
+    Tuple[LazyFrame, Dict] or None
+        The 'sample', 'fitness', 'month' and 'haplotype' digest of every scored sample (read lazily), and the
+        provenance the table was written with, or None if there is no table (or it was written without
+        haplotype digests).
+    """
+    if not os.path.exists(path):
+        return None
+    schema = pq.read_schema(path)
+    metadata = schema.metadata or {}
+    if b"provenance" not in metadata or "haplotype" not in schema.names:
+        return None
+    return pl.scan_parquet(path), json.loads(metadata[b"provenance"])
@@ -0,0 +1,176 @@
+"""
+Sparse matrix fitness scoring of samples under the additive PyR0 model.
+
+Every amino acid mutation is encoded as an integer column ID, so a batch of samples becomes a CSR
+sample x mutation matrix, and all of their log fitness scores come from a single sparse mat-vec
+product against the vector of PyR0 Δlog R scores. Each sample's Δlog R scores are added up one at a
+time, in the order of its amino acid mutations, so the scores are identical to scoring each sample on
+its own.
+"""
+
+import math
+import numpy as np
+
+from file_stamps import file_fingerprint
+
+# Version of the scoring arithmetic, bumped whenever scores computed by earlier versions can differ
+SCORING_VERSION = 3
+
+
+def scores_fingerprint(mutations_filename):
+    """
+    Fingerprint of the PyR0 scores file and scoring arithmetic that persisted fitness scores were
+    computed with.
+
+    Parameters
+    ----------
+    mutations_filename: str
+        The path to the PyR0 mutations file.
+
+    Returns
+    ----------
+    str
+        The fingerprint.
+    """
+    return f"{file_fingerprint(mutations_filename)}-v{SCORING_VERSION}"
+
+
+def get_fitness_scores(mutations_filename):
+    """
+    Load the Δlog R score of every amino acid mutation ranked in the PyR0 'mutations.tsv' file.
+
+    Parameters
+    ----------
+    mutations_filename: str
+        The path to the PyR0 mutations file.
+
+    Returns
+    ----------
+    Dict[str, float]
+        Dictionary mapping each amino acid mutation, eg) "S:D614G", to its Δlog R score.
+    """
+    r_ra = {}
+    fp = open(mutations_filename, "r")
+    # Skip over file header
+    next(fp)
+    for line in fp:
+        splitline = line.split("\t")
+        rank = int(splitline[0])
+        strain = splitline[1]
+        delta_log_R = round(float(splitline[4]), 10)
+        r_ra[strain] = delta_log_R
+    fp.close()
+    return r_ra
+
+
+class SparseMutationMatrix:
+    """
+    CSR sample x amino acid mutation matrix, where every non-zero entry is 1.
+    """
+
+    def __init__(self, indptr, indices, num_columns):
+        # Row i's column indices are indices[indptr[i]:indptr[i + 1]]
+        self.indptr = indptr
+        self.indices = indices
+        self.shape = (len(indptr) - 1, num_columns)
+
+    def row_counts(self):
+        """
+        Get the number of non-zero entries (amino acid mutations) in each row (sample).
+        """
+        return np.diff(self.indptr)
+
+    def dot(self, vector):
+        """
+        Compute the matrix-vector product with the given column vector.
+
+        Entries are accumulated in the order they are stored within each row, so the sums are
+        identical to adding up each sample's scores one at a time.
+        """
+        rows = np.repeat(np.arange(self.shape[0]), self.row_counts())
+        return np.bincount(rows, weights=vector[self.indices], minlength=self.shape[0])
+
+
+class FitnessScorer:
+    """
+    Scores batches of translated samples, see 'AATranslator.translate_batch'.
+    """
+
+    def __init__(self, translator, mutation_fitness_scores):
+        """
+        Parameters
+        ----------
+        translator: AATranslator
+            The translator used to produce the amino acid mutations being scored.
+
+        mutation_fitness_scores: Dict[str, float]
+            The PyR0 amino acid mutation Δlog R scores, see 'get_fitness_scores'.
+        """
+        self.translator = translator
+        # Amino acid mutation key -> column ID, with the PyR0 ranked mutations first
+        self.column_ids = {}
+        scores = []
+        for mutation, score in mutation_fitness_scores.items():
+            key = translator.parse_mutation_key(mutation)
+            # Skip mutations the translator can never produce, eg) deletions
+            if key is None:
+                continue
+            self.column_ids[key] = len(scores)
+            scores.append(score)
+        self.num_ranked = len(scores)
+        self.scores = np.array(scores, dtype=np.float64)
+
+    def matrix(self, aa_mutations, num_samples):
+        """
+        Build the CSR sample x mutation matrix of a batch of translated samples.
+
+        Mutations unranked by PyR0 are given new column IDs, with a score of zero.
+
+        Parameters
+        ----------
+        aa_mutations: AAMutations
+            The amino acid mutations of each sample in the batch.
+
+        num_samples: int
+            The number of samples in the batch.
+
+        Returns
+        ----------
+        SparseMutationMatrix
+            The sample x mutation matrix.
+        """
+        keys, inverse = np.unique(self.translator.mutation_keys(aa_mutations), return_inverse=True)
+        unique_ids = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys.tolist()):
+            column_id = self.column_ids.get(key)
+            if column_id is None:
+                column_id = self.column_ids[key] = len(self.column_ids)
+            unique_ids[i] = column_id
+        indptr = np.searchsorted(aa_mutations.samples, np.arange(num_samples + 1))
+        return SparseMutationMatrix(indptr, unique_ids[inverse.ravel()], len(self.column_ids))
+
+    def score(self, aa_mutations, num_samples):
+        """
+        Score every sample in a batch of translated samples.
+
+        Parameters
+        ----------
+        aa_mutations: AAMutations
+            The amino acid mutations of each sample in the batch.
+
+        num_samples: int
+            The number of samples in the batch.
+
+        Returns
+        ----------
+        Tuple[np.ndarray, np.ndarray]
+            The fitness (exp of the summed Δlog R scores) and number of amino acid mutations of each sample.
+        """
+        matrix = self.matrix(aa_mutations, num_samples)
+        vector = np.zeros(matrix.shape[1], dtype=np.float64)
+        vector[: self.num_ranked] = self.scores
+        log_fitness = matrix.dot(vector)
+        # NOTE: math.exp (rather than np.exp, whose vectorized kernels can differ in the last bit) keeps
+        # scores identical to the scalar per-sample implementation
+        fitness = np.fromiter(map(math.exp, log_fitness.tolist()), dtype=np.float64, count=len(log_fitness))
+        return fitness, matrix.row_counts()
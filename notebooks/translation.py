@@ -0,0 +1,314 @@
+"""
+Vectorized translation of nucleotide mutations into amino acid mutations.
+
+Produces the same amino acid mutations as 'nuc_mutations_to_aa_mutations_modified', but translates
+whole batches of samples at once using lookup tables precomputed for every reference position.
+"""
+
+import re
+import numpy as np
+
+# NOTE: Unmodified versions of original pyrocov gene coordinates and codon table, imported
+from pyrocov.sarscov2 import GENE_TO_POSITION, DNA_TO_AA
+
+from nucleotides import NUCLEOTIDES, NUM_NT_CODES, UNKNOWN_NT, encode_nucleotides
+
+STOP = "STOP"
+# Amino acid mutation string, eg) "S:D614G" or "ORF8:Q27STOP"
+_AA_MUTATION_RE = re.compile(r"^([^:]+):(STOP|[A-Z])(\d+)(STOP|[A-Z])$")
+
+
+def parse_nt_mutations(ms):
+    """
+    Parse a list of nucleotide mutations, eg) "A1234G", into position and alternate allele arrays.
+
+    Parameters
+    ----------
+    ms: List[str]
+        The nucleotide mutations to parse. Like 'nuc_mutations_to_aa_mutations_modified',
+        pyrocov Mutation objects (with 'position' and 'mut' attributes) are also accepted.
+
+    Returns
+    ----------
+    Tuple[np.ndarray, np.ndarray]
+        The 1-based positions (int64) and alternate allele codes (uint8) of each mutation.
+    """
+    positions = np.empty(len(ms), dtype=np.int64)
+    alts = []
+    for i, m in enumerate(ms):
+        if isinstance(m, str):
+            positions[i] = int(m[1:-1])
+            alts.append(m[-1])
+        else:
+            positions[i] = m.position
+            alts.append(m.mut)
+    return positions, encode_nucleotides(alts)
+
+
+class AAMutations:
+    """
+    Columnar batch of amino acid mutations produced by 'AATranslator.translate_batch'.
+
+    Each attribute is an array with one entry per amino acid mutation, ordered by sample and then
+    in the order 'nuc_mutations_to_aa_mutations_modified' would report them.
+    """
+
+    def __init__(self, samples, genes, positions, ref_aas, alt_aas):
+        self.samples = samples
+        self.genes = genes
+        # 0-based amino acid position within the gene
+        self.positions = positions
+        self.ref_aas = ref_aas
+        self.alt_aas = alt_aas
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class AATranslator:
+    """
+    Translates nucleotide mutations against the reference sequence into amino acid mutations,
+    using precomputed position -> (gene, codon index, codon offset) lookup tables.
+    """
+
+    def __init__(self, refseq):
+        self.refseq = refseq
+        self.ref_codes = encode_nucleotides(refseq)
+        self.gene_names = list(GENE_TO_POSITION.keys())
+        self.gene_starts = np.array(
+            [start for start, end in GENE_TO_POSITION.values()], dtype=np.int64
+        )
+        # Amino acid alphabet, stop codons are reported as 'STOP'
+        self.amino_acids = sorted({STOP if aa is None else aa for aa in DNA_TO_AA.values()})
+        aa_index = {aa: i for i, aa in enumerate(self.amino_acids)}
+        self.max_gene_length = max(
+            (end - start) // 3 + 1 for start, end in GENE_TO_POSITION.values()
+        )
+
+        # Codon table over encoded codons, -1 for codons that cannot be translated
+        self.codon_table = np.full(NUM_NT_CODES**3, -1, dtype=np.int16)
+        for codon, aa in DNA_TO_AA.items():
+            codes = encode_nucleotides(codon)
+            if UNKNOWN_NT in codes:
+                continue
+            code = (int(codes[0]) * NUM_NT_CODES + int(codes[1])) * NUM_NT_CODES + int(codes[2])
+            self.codon_table[code] = aa_index[STOP if aa is None else aa]
+
+        # Position lookup tables (1-based, index 0 unused). A position can fall within more than
+        # one (overlapping) gene, so each table has one column per overlapping gene, padded with -1.
+        num_positions = len(refseq) + 1
+        overlaps = np.zeros(num_positions, dtype=np.int64)
+        for start, end in GENE_TO_POSITION.values():
+            overlaps[start : end + 1] += 1
+        width = max(int(overlaps.max()), 1)
+        self.position_genes = np.full((num_positions, width), -1, dtype=np.int16)
+        self.position_codons = np.full((num_positions, width), -1, dtype=np.int32)
+        self.position_offsets = np.full((num_positions, width), -1, dtype=np.int8)
+        slots = np.zeros(num_positions, dtype=np.int64)
+        for gene, (start, end) in enumerate(GENE_TO_POSITION.values()):
+            positions = np.arange(start, end + 1)
+            slot = slots[positions]
+            self.position_genes[positions, slot] = gene
+            self.position_codons[positions, slot] = (positions - start) // 3
+            self.position_offsets[positions, slot] = (positions - start) % 3
+            slots[positions] += 1
+
+    def translate_batch(self, samples, positions, alts):
+        """
+        Translate a batch of nucleotide mutations, given as parallel arrays of
+        (sample, position, alt) triples, into amino acid mutations.
+
+        Parameters
+        ----------
+        samples: np.ndarray
+            The (integer) sample index of each nucleotide mutation.
+
+        positions: np.ndarray
+            The 1-based reference position of each nucleotide mutation.
+
+        alts: np.ndarray
+            The alternate allele code of each nucleotide mutation (see 'encode_nucleotides').
+
+        Returns
+        ----------
+        AAMutations
+            The non-synonymous amino acid mutations of every sample in the batch.
+        """
+        samples = np.asarray(samples, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        alts = np.asarray(alts, dtype=np.uint8)
+
+        # Expand each nucleotide mutation into one hit per gene it falls within, keeping the
+        # (mutation, gene) order used by 'nuc_mutations_to_aa_mutations_modified'
+        genes = self.position_genes[positions]
+        hits = np.flatnonzero(genes.ravel() >= 0)
+        mutation_idx, slot = np.divmod(hits, genes.shape[1])
+        hit_positions = positions[mutation_idx]
+        hit_samples = samples[mutation_idx]
+        hit_genes = genes[mutation_idx, slot].astype(np.int64)
+        hit_codons = self.position_codons[hit_positions, slot].astype(np.int64)
+        hit_offsets = self.position_offsets[hit_positions, slot].astype(np.int64)
+        hit_alts = alts[mutation_idx]
+
+        # Group hits by (sample, gene, codon), ordered by first occurrence within each sample
+        num_genes = len(self.gene_names)
+        keys = (hit_samples * num_genes + hit_genes) * self.max_gene_length + hit_codons
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.lexsort((first, hit_samples[first]))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        group = rank[inverse.ravel()]
+        first = first[order]
+
+        group_genes = hit_genes[first]
+        group_codons = hit_codons[first]
+        codon_starts = self.gene_starts[group_genes] - 1 + group_codons * 3
+        ref_codons = self.ref_codes[codon_starts[:, None] + np.arange(3)]
+
+        # Apply mutations to each codon, where a later mutation at the same codon offset wins
+        alt_codons = ref_codons.copy()
+        writes = group * 3 + hit_offsets
+        unique_writes, last = np.unique(writes[::-1], return_index=True)
+        alt_codons.ravel()[unique_writes] = hit_alts[::-1][last]
+
+        ref_aas = self._translate_codons(ref_codons)
+        alt_aas = self._translate_codons(alt_codons)
+        # Ignore synonymous substitutions
+        keep = ref_aas != alt_aas
+        return AAMutations(
+            hit_samples[first][keep],
+            group_genes[keep],
+            group_codons[keep],
+            ref_aas[keep],
+            alt_aas[keep],
+        )
+
+    def _translate_codons(self, codons):
+        """
+        Translate an (N x 3) array of encoded codons into amino acid codes.
+        """
+        codes = (codons[:, 0].astype(np.int64) * NUM_NT_CODES + codons[:, 1]) * NUM_NT_CODES
+        codes += codons[:, 2]
+        aas = self.codon_table[codes]
+        if (aas < 0).any():
+            bad = codons[np.flatnonzero(aas < 0)[0]]
+            raise KeyError("".join((NUCLEOTIDES + "N")[c] for c in bad))
+        return aas
+
+    def format_mutations(self, aa_mutations):
+        """
+        Format a batch of amino acid mutations as strings, eg) "S:D614G".
+
+        Parameters
+        ----------
+        aa_mutations: AAMutations
+            The batch of amino acid mutations to format.
+
+        Returns
+        ----------
+        List[str]
+            The formatted amino acid mutations (1-based amino acid positions).
+        """
+        return [
+            f"{self.gene_names[gene]}:{self.amino_acids[ref]}{position + 1}{self.amino_acids[alt]}"
+            for gene, position, ref, alt in zip(
+                aa_mutations.genes.tolist(),
+                aa_mutations.positions.tolist(),
+                aa_mutations.ref_aas.tolist(),
+                aa_mutations.alt_aas.tolist(),
+            )
+        ]
+
+    def mutation_keys(self, aa_mutations):
+        """
+        Encode each amino acid mutation in a batch as a single integer key.
+
+        Parameters
+        ----------
+        aa_mutations: AAMutations
+            The batch of amino acid mutations to encode.
+
+        Returns
+        ----------
+        np.ndarray
+            The int64 key of each amino acid mutation.
+        """
+        num_aas = len(self.amino_acids)
+        keys = aa_mutations.genes.astype(np.int64) * self.max_gene_length + aa_mutations.positions
+        keys = keys * num_aas + aa_mutations.ref_aas
+        return keys * num_aas + aa_mutations.alt_aas
+
+    def parse_mutation_key(self, mutation):
+        """
+        Encode an amino acid mutation string, eg) "S:D614G", with the same integer key as 'mutation_keys'.
+
+        Parameters
+        ----------
+        mutation: str
+            The amino acid mutation.
+
+        Returns
+        ----------
+        int or None
+            The key of the mutation, or None if the translator could never produce this exact string.
+        """
+        match = _AA_MUTATION_RE.match(mutation)
+        if match is None:
+            return None
+        gene, ref, position, alt = match.groups()
+        if gene not in self.gene_names or ref not in self.amino_acids or alt not in self.amino_acids:
+            return None
+        position = int(position) - 1
+        if not 0 <= position < self.max_gene_length:
+            return None
+        aa_mutations = AAMutations(
+            np.zeros(1, dtype=np.int64),
+            np.array([self.gene_names.index(gene)]),
+            np.array([position]),
+            np.array([self.amino_acids.index(ref)]),
+            np.array([self.amino_acids.index(alt)]),
+        )
+        # Only exact string matches count, eg) "S:D0614G" is not the same mutation as "S:D614G"
+        if self.format_mutations(aa_mutations)[0] != mutation:
+            return None
+        return int(self.mutation_keys(aa_mutations)[0])
+
+    def group_by_sample(self, aa_mutations, num_samples):
+        """
+        Format a batch of amino acid mutations as one list of mutation strings per sample.
+
+        Parameters
+        ----------
+        aa_mutations: AAMutations
+            The batch of amino acid mutations to format.
+
+        num_samples: int
+            The number of samples in the batch.
+
+        Returns
+        ----------
+        List[List[str]]
+            The amino acid mutations of each sample, indexed by sample.
+        """
+        formatted = self.format_mutations(aa_mutations)
+        bounds = np.searchsorted(aa_mutations.samples, np.arange(num_samples + 1))
+        return [formatted[bounds[i] : bounds[i + 1]] for i in range(num_samples)]
+
+    def translate(self, ms):
+        """
+        Translate the nucleotide mutations of a single sample, equivalent to
+        'nuc_mutations_to_aa_mutations_modified(refseq, ms)'.
+
+        Parameters
+        ----------
+        ms: List[str]
+            The nucleotide mutations of the sample, eg) ["A1234G", "C5678T"].
+
+        Returns
+        ----------
+        List[str]
+            The non-synonymous amino acid mutations of the sample.
+        """
+        positions, alts = parse_nt_mutations(ms)
+        samples = np.zeros(len(positions), dtype=np.int64)
+        return self.format_mutations(self.translate_batch(samples, positions, alts))
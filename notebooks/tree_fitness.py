@@ -0,0 +1,341 @@
+"""
+Script to compute the PyR0 fitness of every node (internal node and sample) in the MAT in a single
+depth-first pass over the node mutations table (see 'node_mutations.py').
+
+Under the additive PyR0 model, a node's log fitness is its parent's log fitness plus the change in
+Δlog R of the codons its branch mutations fall in. Each codon is scored in the context of the node's
+full haplotype, so multiple hits in the same codon are translated together, as in 'AATranslator'.
+The Δlog R scores are accumulated in exact fixed point (see 'FixedPointScores'), so a node's score does
+not depend on the path it was reached by. Scoring a haplotype directly (see 'scoring.FitnessScorer') adds
+up its Δlog R scores one at a time instead, so the two can differ by a few ulps. 'fitness.py' and
+'fitness_stats.py' only read their scores from the node fitness table when passed '--node-fitness'.
+"""
+
+import json
+import math
+import os
+import numpy as np
+import polars as pl
+import pyarrow as pa
+from third_party.nuc_mutations_to_aa_mutations_modified import (
+    load_reference_sequence_modified,
+)
+from translation import AATranslator
+from nucleotides import NUCLEOTIDES, NUM_NT_CODES, encode_nucleotides
+from scoring import FitnessScorer, get_fitness_scores, scores_fingerprint
+from node_mutations import load_node_mutations
+from month_index import sorted_positions
+from file_stamps import file_fingerprint
+from util import Config, download_data_files
+
+CONFIG = "config.yaml"
+
+
+class FixedPointScores:
+    """
+    Exact fixed point representation of a vector of Δlog R scores.
+
+    Every score is held as an integer numerator over a common power of two denominator, so sums of scores
+    are exact, whatever order the scores are added and removed in.
+    """
+
+    def __init__(self, scores):
+        """
+        Parameters
+        ----------
+        scores: np.ndarray
+            The (float64) scores.
+        """
+        ratios = [float(score).as_integer_ratio() for score in scores]
+        # Every float's denominator is a power of two
+        self.fraction_bits = max((d.bit_length() - 1 for _, d in ratios), default=0)
+        self.numerators = [n << (self.fraction_bits - d.bit_length() + 1) for n, d in ratios]
+
+    def to_float(self, numerator):
+        """
+        Round an (exact) sum of score numerators to the nearest float.
+        """
+        return numerator / (1 << self.fraction_bits)
+
+
+def score_tree(node_mutations, scorer):
+    """
+    Compute the log fitness of every node in the MAT, accumulating the Δlog R of each branch's
+    amino acid changes down the tree.
+
+    Parameters
+    ----------
+    node_mutations: NodeMutations
+        The nodes of the MAT in preorder, and their branch mutations.
+
+    scorer: FitnessScorer
+        The PyR0 fitness scorer, with the translator built from the reference sequence.
+
+    Returns
+    ----------
+    Tuple[List[float], List[int], List[int]]
+        The log fitness, number of nucleotide mutations and number of amino acid mutations of each node.
+    """
+    translator = scorer.translator
+    fixed_point = FixedPointScores(scorer.scores)
+    # Amino acid mutation key -> fixed point Δlog R score, unranked mutations score zero
+    numerators = {
+        key: fixed_point.numerators[column]
+        for key, column in scorer.column_ids.items()
+        if column < scorer.num_ranked
+    }
+    num_aas = len(translator.amino_acids)
+    codon_table = translator.codon_table.tolist()
+    gene_starts = translator.gene_starts.tolist()
+    ref = translator.ref_codes.tolist()
+    # Nucleotide codes of the current node's haplotype (0-based)
+    state = list(ref)
+
+    hits = {}
+
+    def codon_hits(position):
+        # The (gene, codon index) of every codon the position falls within
+        position_hits = hits.get(position)
+        if position_hits is None:
+            position_hits = [
+                (gene, codon)
+                for gene, codon in zip(
+                    translator.position_genes[position].tolist(),
+                    translator.position_codons[position].tolist(),
+                )
+                if gene >= 0
+            ]
+            hits[position] = position_hits
+        return position_hits
+
+    def codon_score(gene, codon):
+        # The Δlog R numerator and number of amino acid mutations of the codon in the current haplotype
+        start = gene_starts[gene] - 1 + codon * 3
+        ref_aa = codon_table[(ref[start] * NUM_NT_CODES + ref[start + 1]) * NUM_NT_CODES + ref[start + 2]]
+        alt_aa = codon_table[
+            (state[start] * NUM_NT_CODES + state[start + 1]) * NUM_NT_CODES + state[start + 2]
+        ]
+        if ref_aa < 0 or alt_aa < 0:
+            bad = ref if ref_aa < 0 else state
+            raise KeyError("".join((NUCLEOTIDES + "N")[c] for c in bad[start : start + 3]))
+        if ref_aa == alt_aa:
+            return 0, 0
+        key = ((gene * translator.max_gene_length + codon) * num_aas + ref_aa) * num_aas + alt_aa
+        return numerators.get(key, 0), 1
+
+    parents = node_mutations.parents.tolist()
+    offsets = node_mutations.offsets.tolist()
+    positions = node_mutations.positions.tolist()
+    alts = encode_nucleotides(node_mutations.alts.tobytes().decode("ascii")).tolist()
+
+    num_nodes = len(node_mutations)
+    log_fitness = [0.0] * num_nodes
+    num_nt = [0] * num_nodes
+    num_aa = [0] * num_nodes
+    # (node index, undo list, log fitness numerator, number of nt and aa mutations) of each node on
+    # the path from the root to the current node
+    path = []
+    for i in range(num_nodes):
+        parent = parents[i]
+        # Undo the branch mutations of the nodes of the previous subtree
+        while path and path[-1][0] != parent:
+            for position, previous in reversed(path.pop()[1]):
+                state[position - 1] = previous
+        if parent >= 0 and not path:
+            raise ValueError(f"Node table is not in preorder, parent of node '{node_mutations.nodes[i]}' not found")
+        numerator, nt, aa = path[-1][2:] if path else (0, 0, 0)
+
+        undo = []
+        start, end = offsets[i], offsets[i + 1]
+        if start < end:
+            codons = set()
+            for j in range(start, end):
+                codons.update(codon_hits(positions[j]))
+            for gene, codon in codons:
+                score, count = codon_score(gene, codon)
+                numerator -= score
+                aa -= count
+            for j in range(start, end):
+                position = positions[j]
+                previous = state[position - 1]
+                undo.append((position, previous))
+                state[position - 1] = alts[j]
+                nt += (alts[j] != ref[position - 1]) - (previous != ref[position - 1])
+            for gene, codon in codons:
+                score, count = codon_score(gene, codon)
+                numerator += score
+                aa += count
+
+        log_fitness[i] = fixed_point.to_float(numerator)
+        num_nt[i] = nt
+        num_aa[i] = aa
+        path.append((i, undo, numerator, nt, aa))
+    return log_fitness, num_nt, num_aa
+
+
+def write_node_fitness(path, node_mutations, log_fitness, num_nt, num_aa, provenance):
+    """
+    Write the node fitness table, as an uncompressed Arrow (Feather) file sorted by node name.
+
+    Parameters
+    ----------
+    path: str
+        The path to write the table to.
+
+    node_mutations: NodeMutations
+        The nodes of the MAT.
+
+    log_fitness: List[float]
+        The log fitness of each node.
+
+    num_nt: List[int]
+        The number of nucleotide mutations of each node.
+
+    num_aa: List[int]
+        The number of amino acid mutations of each node.
+
+    provenance: Dict
+        The PyR0 scores and node mutations table the fitness was computed from.
+    """
+    df = pl.DataFrame(
+        {
+            "node": node_mutations.nodes,
+            "fitness": list(map(math.exp, log_fitness)),
+            "log_fitness": log_fitness,
+            "num_nt": num_nt,
+            "num_aa": num_aa,
+            "is_leaf": node_mutations.is_leaf,
+        },
+        schema_overrides={"num_nt": pl.Int32, "num_aa": pl.Int32},
+    ).sort("node")
+    if df["node"].is_duplicated().any():
+        raise ValueError("Repeated node ids in the node mutations table")
+    table = df.to_arrow()
+    table = table.set_column(0, "node", table.column("node").cast(pa.large_string()))
+    table = table.replace_schema_metadata({"provenance": json.dumps(provenance, sort_keys=True)})
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+class NodeFitness:
+    """
+    Read-only table of the fitness of every node in the MAT, see 'write_node_fitness'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        self.table = pa.ipc.open_file(pa.memory_map(self.path, "r")).read_all()
+        self.provenance = json.loads(self.table.schema.metadata[b"provenance"])
+        self.nodes = self.table.column("node").combine_chunks()
+
+    # Reopen the memory map rather than copying the table into worker processes
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return sorted_positions(self.nodes, [node])[0] >= 0
+
+    def lookup(self, nodes, column="fitness"):
+        """
+        Batch look up a column of the node fitness table for the given nodes.
+
+        Parameters
+        ----------
+        nodes: Iterable[str]
+            The node names to look up.
+
+        column: str (Optional)
+            The column to look up, eg) "fitness", "log_fitness" or "num_aa".
+
+        Returns
+        ----------
+        np.ndarray
+            The value of the column for each node.
+        """
+        nodes = list(nodes)
+        rows = sorted_positions(self.nodes, nodes)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing) > 0:
+            raise KeyError(nodes[missing[0]])
+        return self.table.column(column).to_numpy()[rows]
+
+
+def load_node_fitness(path, pyro_scores, node_mutations_path):
+    """
+    Load the node fitness table, checking it was computed from the given PyR0 scores and from the current
+    node mutations table (ie. the current MAT).
+
+    Parameters
+    ----------
+    path: str
+        The path to the node fitness table.
+
+    pyro_scores: str
+        The fingerprint of the PyR0 scores file, see 'scoring.scores_fingerprint'.
+
+    node_mutations_path: str
+        The path to the node mutations table of the current MAT.
+
+    Returns
+    ----------
+    NodeFitness
+        The node fitness table.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Node fitness file not found, run 'notebooks/tree_fitness.py': '{path}'")
+    node_fitness = NodeFitness(path)
+    if node_fitness.provenance["pyro_scores"] != pyro_scores:
+        raise ValueError(
+            f"Node fitness file '{path}' was computed from a different PyR0 scores file, rerun 'notebooks/tree_fitness.py'"
+        )
+    if not os.path.exists(node_mutations_path) or node_fitness.provenance.get(
+        "node_mutations"
+    ) != file_fingerprint(node_mutations_path):
+        raise ValueError(
+            f"Node fitness file '{path}' was computed from a different MAT than '{node_mutations_path}', rerun 'notebooks/tree_fitness.py'"
+        )
+    print("Loaded node fitness table from: ", path)
+    return node_fitness
+
+
+def main():
+    config = Config(CONFIG)
+    data_dir = config.DATA_DIR
+    # Ensure data directory is found
+    if not os.path.isdir(data_dir):
+        raise FileNotFoundError(f"Data Directory not found: '{data_dir}'")
+
+    download_data_files(config.DATA_DIR)
+    # Get amino acid mutation fitness scores from PyR0
+    mutation_fitness_scores = get_fitness_scores(config.PYRO_MUTATIONS_FILE)
+    refseq = load_reference_sequence_modified(data_dir, "reference.fasta")
+    scorer = FitnessScorer(AATranslator(refseq), mutation_fitness_scores)
+
+    print("Loading node mutations table: ", config.node_mutations_path)
+    node_mutations = load_node_mutations(config.node_mutations_path)
+    print(f"Scoring {len(node_mutations)} nodes.")
+    log_fitness, num_nt, num_aa = score_tree(node_mutations, scorer)
+
+    provenance = {
+        "pyro_scores": scores_fingerprint(config.PYRO_MUTATIONS_FILE),
+        "node_mutations": file_fingerprint(config.node_mutations_path),
+    }
+    write_node_fitness(config.node_fitness_path, node_mutations, log_fitness, num_nt, num_aa, provenance)
+    print("Node fitness file written to: ", config.node_fitness_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Columnar ingestion of the RIVET recombinant trios VCF.
+
+The haploid genotype matrix is read once in chunks of records, keeping only the non-reference genotypes
+as integer (sample, position, ref, alt) arrays. The arrays are cached in a binary sidecar file next to
+the VCF, which is reused while the VCF's mtime and size are unchanged, so the fitness and merge stages
+share a single parse. Mutation strings, eg) "A1234G", are only built on demand.
+"""
+
+import os
+import numpy as np
+from cyvcf2 import VCF
+
+from file_stamps import file_stamp
+from profiling import count, profiled
+
+TRIO_MUTATIONS_SUFFIX = ".mutations.npz"
+# Number of VCF records whose genotypes are buffered before extracting their mutations
+CHUNK_RECORDS = 1024
+# Allele character reported for missing genotypes, as in cyvcf2's 'gt_bases'
+MISSING_ALLELE = "."
+
+
+class TrioMutations:
+    """
+    The nucleotide mutations of every sample (trio node) in the VCF, ordered by sample and then
+    by VCF record.
+    """
+
+    def __init__(self, samples, sample_idx, positions, refs, alts):
+        """
+        Parameters
+        ----------
+        samples: List[str]
+            The sample names, in VCF column order.
+
+        sample_idx: np.ndarray
+            The index (into 'samples') of the sample of each mutation.
+
+        positions: np.ndarray
+            The 1-based position of each mutation.
+
+        refs: np.ndarray
+            The reference allele of each mutation, as uint8 ASCII codes.
+
+        alts: np.ndarray
+            The alternate allele of each mutation, as uint8 ASCII codes.
+        """
+        self.samples = samples
+        self.sample_idx = sample_idx
+        self.positions = positions
+        self.refs = refs
+        self.alts = alts
+
+    def __len__(self):
+        return len(self.samples)
+
+    def num_mutations(self):
+        """
+        Get the number of nucleotide mutations of each sample.
+        """
+        return np.bincount(self.sample_idx, minlength=len(self.samples))
+
+    def alt_alleles(self):
+        """
+        Get the alternate allele of each mutation as a string of single characters.
+        """
+        return self.alts.tobytes().decode("ascii")
+
+    def mutation_ids(self):
+        """
+        Get an integer ID for each mutation, identical for the same (position, ref, alt) in any sample.
+        """
+        return (self.positions.astype(np.int64) << 16) | (self.refs.astype(np.int64) << 8) | self.alts
+
+    def mutation_strings(self):
+        """
+        Format every mutation as a string, eg) "A1234G".
+        """
+        refs = self.refs.tobytes().decode("ascii")
+        alts = self.alt_alleles()
+        return [ref + str(pos) + alt for ref, pos, alt in zip(refs, self.positions.tolist(), alts)]
+
+    def to_dict(self):
+        """
+        Build the dictionary of each sample to its list of nucleotide mutations (in VCF record order).
+
+        Returns
+        ----------
+        Dict[str, List[str]]
+            The dictionary of trio node ids to their nucleotide mutations.
+        """
+        mutations = self.mutation_strings()
+        bounds = np.concatenate([[0], np.cumsum(self.num_mutations())]).tolist()
+        return {
+            sample: mutations[bounds[i] : bounds[i + 1]] for i, sample in enumerate(self.samples)
+        }
+
+
+@profiled(unit="records")
+def read_trio_mutations(vcf_filename):
+    """
+    Parse the nucleotide mutations of every sample in a haploid VCF file.
+
+    Parameters
+    ----------
+    vcf_filename: str
+        The VCF file to parse.
+
+    Returns
+    ----------
+    TrioMutations
+        The nucleotide mutations of every sample in the VCF.
+    """
+    print("Parsing VCF file: {}".format(vcf_filename))
+    vcf_reader = VCF(vcf_filename)
+    samples = list(vcf_reader.samples)
+
+    parts = []
+    # Genotype type and allele character codes of each sample in the buffered records
+    gt_types = np.empty((CHUNK_RECORDS, len(samples)), dtype=np.int8)
+    gt_alleles = np.empty((CHUNK_RECORDS, len(samples)), dtype=np.uint8)
+    positions = np.empty(CHUNK_RECORDS, dtype=np.int32)
+    refs = np.empty(CHUNK_RECORDS, dtype=np.uint8)
+
+    def flush(num_records):
+        count("records", num_records)
+        records, sample_idx = np.nonzero(gt_types[:num_records])
+        parts.append(
+            (
+                sample_idx.astype(np.int32),
+                positions[records],
+                refs[records],
+                gt_alleles[records, sample_idx],
+            )
+        )
+
+    i = 0
+    for record in vcf_reader:
+        alleles = [record.REF] + record.ALT + [MISSING_ALLELE]
+        if any(len(allele) != 1 for allele in alleles):
+            raise ValueError(f"Expected single nucleotide alleles at position {record.POS}: {alleles}")
+        genotypes = record.genotype.array()
+        if genotypes.shape[1] != 2:
+            raise ValueError(f"Expected haploid genotypes at position {record.POS}")
+        allele_codes = np.frombuffer("".join(alleles).encode("ascii"), dtype=np.uint8)
+
+        gt_types[i] = record.gt_types
+        # Missing genotypes (-1) index the trailing missing allele
+        gt_alleles[i] = allele_codes[genotypes[:, 0]]
+        positions[i] = record.POS
+        refs[i] = allele_codes[0]
+        i += 1
+        if i == CHUNK_RECORDS:
+            flush(i)
+            i = 0
+    flush(i)
+
+    sample_idx, positions, refs, alts = (np.concatenate(column) for column in zip(*parts))
+    # Group the mutations by sample, keeping each sample's mutations in VCF record order
+    order = np.argsort(sample_idx, kind="stable")
+    return TrioMutations(samples, sample_idx[order], positions[order], refs[order], alts[order])
+
+
+def save_trio_mutations(trio_mutations, path, stamp):
+    """
+    Write the parsed trio mutations to a binary (NumPy .npz) sidecar file.
+
+    Parameters
+    ----------
+    trio_mutations: TrioMutations
+        The parsed trio mutations.
+
+    path: str
+        The path to write the sidecar file to.
+
+    stamp: Dict[str, int]
+        The invalidation stamp of the VCF, see 'file_stamps.file_stamp'.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            samples=np.array(trio_mutations.samples, dtype=str),
+            sample_idx=trio_mutations.sample_idx,
+            positions=trio_mutations.positions,
+            refs=trio_mutations.refs,
+            alts=trio_mutations.alts,
+            stamp=np.array([stamp["mtime_ns"], stamp["size"]], dtype=np.int64),
+        )
+    os.replace(tmp_path, path)
+
+
+@profiled(unit="nodes")
+def load_trio_mutations(vcf_filename):
+    """
+    Load the nucleotide mutations of every sample in the RIVET trios VCF, from its sidecar cache
+    if the VCF is unchanged since it was written, otherwise parsing the VCF and (re)writing the cache.
+
+    Parameters
+    ----------
+    vcf_filename: str
+        The RIVET recombinant trios VCF file.
+
+    Returns
+    ----------
+    TrioMutations
+        The nucleotide mutations of every sample in the VCF.
+    """
+    path = vcf_filename + TRIO_MUTATIONS_SUFFIX
+    stamp = file_stamp(vcf_filename)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if data["stamp"].tolist() == [stamp["mtime_ns"], stamp["size"]]:
+                print("Loaded parsed VCF mutations from: ", path)
+                trio_mutations = TrioMutations(
+                    data["samples"].tolist(),
+                    data["sample_idx"],
+                    data["positions"],
+                    data["refs"],
+                    data["alts"],
+                )
+                count("nodes", len(trio_mutations))
+                return trio_mutations
+        print("VCF file changed, re-parsing: ", vcf_filename)
+    trio_mutations = read_trio_mutations(vcf_filename)
+    save_trio_mutations(trio_mutations, path, stamp)
+    count("nodes", len(trio_mutations))
+    return trio_mutations
@@ -18,6 +18,16 @@ from cyvcf2 import VCF
 import numpy as np
 import math
 
+from mat_extract import load_extraction_cache
+from month_index import load_month_index
+from profiling import count, profiled
+from trio_vcf import load_trio_mutations
+from weighted_stats import (
+    SUBSTITUTION_SCORE_COL,
+    substitution_weights,
+    exact_mean_stddev,
+)
+
 
 RIVET_CONFIG = {
     "RECOMB_NODE_ID_COL": "Recombinant Node ID",
@@ -63,6 +73,12 @@ MONTHS = get_months()
 class Config:
     RECOMB_TRIOS_FITNESS_FILE = "rivet_trios_fitness_data.csv"
     PANGO_RECOMBS_FILE = "pango_recombs_data.csv"
+    # Nucleotide mutations of every sample in the MAT, see 'mutation_store.py'
+    SAMPLE_MUTATIONS_FILE = "all_sample_mutations.parquet"
+    # Branch mutations of every node in the MAT, see 'node_mutations.py'
+    NODE_MUTATIONS_FILE = "node_mutations.parquet"
+    # Fitness of every node in the MAT, see 'tree_fitness.py'
+    NODE_FITNESS_FILE = "node_fitness.feather"
 
     def __init__(self, config_filename):
         config = load_config(config_filename)
@@ -98,6 +114,9 @@ class Config:
         self.MAT = os.path.join(data_dir, config["MAT"])
         self.METADATA = os.path.join(data_dir, config["METADATA"])
         self.PANGO_RECOMBS_FILE = os.path.join(data_dir, Config.PANGO_RECOMBS_FILE)
+        self.sample_mutations_path = os.path.join(data_dir, Config.SAMPLE_MUTATIONS_FILE)
+        self.node_mutations_path = os.path.join(data_dir, Config.NODE_MUTATIONS_FILE)
+        self.node_fitness_path = os.path.join(data_dir, Config.NODE_FITNESS_FILE)
 
         self.DATA_DIR = data_dir
         # TODO: Old, can remove
@@ -134,6 +153,7 @@ def download(url, local_filepath):
         exit(1)
 
 
+@profiled(unit="files")
 def download_data_files(data_dir, override=False):
     """
     Download all the necessary data files for the analysis.
@@ -158,35 +178,7 @@ def download_data_files(data_dir, override=False):
         path = "{}/{}".format(data_dir, name)
         if not override and not os.path.exists(path):
             download(URLS[k], path)
-
-
-def get_nt_mutations(vcf_filename):
-    """
-    TODO:
-    """
-    print("Parsing VCF file: {}".format(vcf_filename))
-    vcf_reader = VCF(vcf_filename)
-
-    samples = vcf_reader.samples
-    positions = []
-    ref_positions = {}
-    nodes_ids = {_id: [] for _id in samples}
-
-    for record in vcf_reader:
-        # Report the position
-        positions.append(str(record.POS))
-        alleles_indexes = np.nonzero(record.gt_types)
-        genotype_array = record.gt_bases
-        for i in np.nditer(alleles_indexes):
-            sample_name = samples[i]
-            ref = str(record.REF)
-            assert len(ref) == 1
-            pos = str(record.POS)
-            alt = genotype_array[i]
-            assert len(alt) == 1
-            new_nt_string = ref + pos + alt
-            nodes_ids[sample_name].append(new_nt_string)
-    return nodes_ids
+            count("files")
 
 
 def subprocess_runner(command):
@@ -217,7 +209,8 @@ def subprocess_runner(command):
 
 def matUtils_extract_newick(mat, data_dir):
     """
-    Run a matUtils extract command to extract the MAT as a Newick Tree file (.nwk).
+    Run a matUtils extract command to extract the MAT as a Newick Tree file (.nwk), unless the Newick
+    tree of the same MAT is already in the matUtils extraction cache, see 'mat_extract.py'.
 
     Parameters
     ----------
@@ -232,20 +225,7 @@ def matUtils_extract_newick(mat, data_dir):
     str
         The path to the extracted Newick Tree file.
     """
-    root, extension = os.path.splitext(mat)
-    newick_tree_path = "{}/{}".format(data_dir, root + ".nwk")
-    cmd = [
-        "matUtils",
-        "extract",
-        "-i",
-        "{}".format(mat),
-        "-t",
-        "{}".format(newick_tree_path),
-        "-d",
-        "{}".format(data_dir),
-    ]
-    result = subprocess_runner(cmd)
-    return newick_tree_path
+    return load_extraction_cache(mat, data_dir).extract(newick=True)
 
 
 def check_files_exist(file_list):
@@ -278,7 +258,7 @@ def get_epidemiological_df(df):
 
 
 def load_recombinant_data(
-    passing_rows,
+    recombs,
     metadata=[
         "Recombinant Node ID",
         "Recombinant Lineage",
@@ -292,8 +272,7 @@ def load_recombinant_data(
     """
     TODO:
     """
-    df = pl.DataFrame(passing_rows)
-    metadata = df.select(metadata)
+    metadata = recombs.select(metadata)
     return metadata
 
 
@@ -324,6 +303,75 @@ def calculate_parental_divergence(donor_nt_mutations, acceptor_nt_mutatons):
     return len(set(donor_nt_mutations).symmetric_difference(set(acceptor_nt_mutatons)))
 
 
+def build_node_mutation_index(trio_mutations):
+    """
+    Build an index of the distinct nucleotide mutations of each trio node.
+
+    Parameters
+    ----------
+    trio_mutations: TrioMutations
+        The nucleotide mutations of every trio node, see 'trio_vcf.load_trio_mutations'.
+
+    Returns
+    ----------
+    DataFrame
+        A DataFrame with one row per distinct (Node, Mutation) pair, with integer mutation ids.
+    """
+    return pl.DataFrame(
+        {
+            "Node": pl.Series(trio_mutations.samples, dtype=pl.String).gather(
+                trio_mutations.sample_idx
+            ),
+            "Mutation": trio_mutations.mutation_ids(),
+        }
+    ).unique()
+
+
+def parental_divergence_by_pair(pairs, node_mutation_index):
+    """
+    Compute the parental divergence (Hamming distance, the size of the symmetric difference of their
+    nucleotide mutation sets) of each donor/acceptor pair, see 'calculate_parental_divergence'.
+
+    Parameters
+    ----------
+    pairs: LazyFrame
+        The donor/acceptor pairs, with 'DonorID' and 'AcceptorID' columns.
+
+    node_mutation_index: DataFrame
+        The distinct nucleotide mutations of each trio node, see 'build_node_mutation_index'. Every
+        parent must be a trio node, those missing from the index have no mutations.
+
+    Returns
+    ----------
+    LazyFrame
+        The distinct pairs with their 'ParentsHD' column.
+    """
+    index = node_mutation_index.lazy()
+    counts = index.group_by("Node").agg(pl.len().alias("NumMutations"))
+    pairs = pairs.select("DonorID", "AcceptorID").unique()
+    shared = (
+        pairs.join(index.rename({"Node": "DonorID"}), on="DonorID")
+        .join(index.rename({"Node": "AcceptorID"}), on=["AcceptorID", "Mutation"])
+        .group_by("DonorID", "AcceptorID")
+        .agg(pl.len().alias("Shared"))
+    )
+    return (
+        pairs.join(counts.rename({"Node": "DonorID", "NumMutations": "DonorNum"}), on="DonorID", how="left")
+        .join(counts.rename({"Node": "AcceptorID", "NumMutations": "AcceptorNum"}), on="AcceptorID", how="left")
+        .join(shared, on=["DonorID", "AcceptorID"], how="left")
+        .select(
+            "DonorID",
+            "AcceptorID",
+            (
+                pl.col("DonorNum").fill_null(0)
+                + pl.col("AcceptorNum").fill_null(0)
+                - 2 * pl.col("Shared").fill_null(0)
+            ).alias("ParentsHD"),
+        )
+    )
+
+
+@profiled(unit="rows")
 def merge_datafiles_helper(
     recomb_metadata,
     sample_months,
@@ -331,13 +379,15 @@ def merge_datafiles_helper(
     genetic_diversity_by_month_df,
     case_counts_dict,
     recombs_per_month_dict,
-    trios_nt_mutations_dict,
+    trio_mutations,
     outfile,
 ):
     """
     TODO
+
+    Joins the recombinant metadata with the trio fitness, epidemiological and parental divergence data
+    as a single lazy Polars query, writing one row per recombinant (in 'recomb_metadata' order).
     """
-    fp_out = open(outfile, "w")
     COLUMNS = [
         "Month",
         "Node",
@@ -359,68 +409,90 @@ def merge_datafiles_helper(
         "RecombFitnessNormalizedByMaxParents",
         "ParentsHD",
     ]
-    HEADER = ",".join(COLUMNS)
-    fp_out.write(HEADER + "\n")
-    for i, row in enumerate(recomb_metadata.iter_rows(named=True)):
-        # Get information about recombinant and its fitness
-        recomb_node = row["Recombinant Node ID"]
-        month = sample_months[recomb_node]
-        strain = row["Recombinant Lineage"]
-        recomb_node_selection = recomb_trios_fitness_df.filter(
-            pl.col("Node") == recomb_node
+    # Look up the inferred emergence month of each recombinant node
+    recomb_nodes = recomb_metadata["Recombinant Node ID"].to_list()
+    recombs = recomb_metadata.lazy().select(
+        pl.int_range(pl.len()).alias("Row"),
+        pl.Series("Month", sample_months.lookup(recomb_nodes), dtype=pl.String),
+        pl.col("Recombinant Node ID").alias("Node"),
+        pl.col("Recombinant Lineage").alias("Strain"),
+        pl.col("Recomb Number Samples").alias("UShERClusterSize"),
+        pl.col("Donor Lineage").alias("DonorStrain"),
+        pl.col("Donor Node ID").alias("DonorID"),
+        pl.col("Acceptor Lineage").alias("AcceptorStrain"),
+        pl.col("Acceptor Node ID").alias("AcceptorID"),
+    )
+
+    fitness = recomb_trios_fitness_df.lazy()
+    diversity = genetic_diversity_by_month_df.lazy().select(
+        "Month", pl.col("Diversity").alias("DiversityScore")
+    )
+    cases = pl.LazyFrame(
+        {
+            "Month": list(case_counts_dict.keys()),
+            "Infections": [int(count) for count in case_counts_dict.values()],
+        },
+        schema={"Month": pl.String, "Infections": pl.Int64},
+    )
+    recombs_per_month = pl.LazyFrame(
+        {
+            "Month": list(recombs_per_month_dict.keys()),
+            "NumRecombsDetectedByMonth": list(recombs_per_month_dict.values()),
+        },
+        schema={"Month": pl.String, "NumRecombsDetectedByMonth": pl.Int64},
+    )
+    # Every parent must be a trio node, parents missing from the trios VCF have no known mutations
+    parents = pl.concat(
+        [recomb_metadata["Donor Node ID"].alias("Node"), recomb_metadata["Acceptor Node ID"].alias("Node")]
+    )
+    missing_parents = parents.filter(~parents.is_in(pl.Series(trio_mutations.samples, dtype=pl.String)))
+    if len(missing_parents) > 0:
+        raise KeyError(missing_parents[0])
+    parental_divergence = parental_divergence_by_pair(
+        recombs, build_node_mutation_index(trio_mutations)
+    )
+
+    merged = (
+        recombs.join(
+            fitness.select("Node", "Score", "NumNT", "NumAA", pl.col("LogScore").alias("LnScore")),
+            on="Node",
+            how="left",
+            validate="m:1",
         )
-        num_nt = recomb_node_selection["NumNT"].item()
-        num_aa = recomb_node_selection["NumAA"].item()
-        score = recomb_node_selection["Score"].item()
-        ln_score = recomb_node_selection["LogScore"].item()
-        recomb_cluster_size = row["Recomb Number Samples"]
-
-        # Get epidemiological variables
-        diversity_score = genetic_diversity_by_month_df.filter(
-            pl.col("Month") == month
-        )["Diversity"].item()
-        num_cases = case_counts_dict[month]
-        num_recombs_this_month = recombs_per_month_dict[month]
-
-        # Get donor/acceptor information and fitness
-        donor_id = row["Donor Node ID"]
-        acceptor_id = row["Acceptor Node ID"]
-        donor_strain = row["Donor Lineage"]
-        acceptor_strain = row["Acceptor Lineage"]
-        donor_fitness = recomb_trios_fitness_df.filter(pl.col("Node") == donor_id)[
-            "Score"
-        ].item()
-        acceptor_fitness = recomb_trios_fitness_df.filter(
-            pl.col("Node") == acceptor_id
-        )["Score"].item()
-
-        recomb_fitness_norm_by_max = score / max(donor_fitness, acceptor_fitness)
-        parental_divergence = calculate_parental_divergence(
-            trios_nt_mutations_dict[donor_id], trios_nt_mutations_dict[acceptor_id]
+        .join(
+            fitness.select(pl.col("Node").alias("DonorID"), pl.col("Score").alias("DonorFitness")),
+            on="DonorID",
+            how="left",
+            validate="m:1",
         )
+        .join(
+            fitness.select(pl.col("Node").alias("AcceptorID"), pl.col("Score").alias("AcceptorFitness")),
+            on="AcceptorID",
+            how="left",
+            validate="m:1",
+        )
+        .join(diversity, on="Month", how="left", validate="m:1")
+        .join(cases, on="Month", how="left", validate="m:1")
+        .join(recombs_per_month, on="Month", how="left", validate="m:1")
+        .join(parental_divergence, on=["DonorID", "AcceptorID"], how="left")
+        .with_columns(
+            (
+                pl.col("Score") / pl.max_horizontal("DonorFitness", "AcceptorFitness")
+            ).alias("RecombFitnessNormalizedByMaxParents")
+        )
+        .sort("Row")
+        .select(COLUMNS)
+        .collect()
+    )
 
-        ROW = [
-            month,
-            recomb_node,
-            strain,
-            str(score),
-            str(num_nt),
-            str(num_aa),
-            str(diversity_score),
-            str(num_cases),
-            str(num_recombs_this_month),
-            str(recomb_cluster_size),
-            str(ln_score),
-            donor_strain,
-            donor_id,
-            str(donor_fitness),
-            acceptor_strain,
-            acceptor_id,
-            str(acceptor_fitness),
-            str(recomb_fitness_norm_by_max),
-            str(parental_divergence),
-        ]
-        fp_out.write(",".join(ROW) + "\n")
+    # Every recombinant must have its trio fitness and the epidemiological data for its month
+    missing = merged.filter(pl.any_horizontal(pl.all().is_null()))
+    if len(missing) > 0:
+        raise ValueError(
+            f"Missing trio fitness or monthly data for recombinant nodes: {missing['Node'].to_list()}"
+        )
+    merged.write_csv(outfile)
+    count("rows", len(merged))
 
 
 def merge_datafiles(config):
@@ -441,11 +513,10 @@ def merge_datafiles(config):
     sample_months = get_chronumental_dates(config.CHRONUMENTAL_FILE)
 
     # Get recombinant nodes from RIVET files
-    recomb_nodes, passing_rows = get_recombinant_nodes(
-        config.RIVET_RESULTS_FILE, sample_months
-    )
+    recombs = get_recombinant_nodes(config.RIVET_RESULTS_FILE, sample_months)
+    recomb_nodes = recombs[RIVET_CONFIG["RECOMB_NODE_ID_COL"]].to_list()
 
-    recomb_metadata = load_recombinant_data(passing_rows)
+    recomb_metadata = load_recombinant_data(recombs)
 
     # Calculate the number of recombinants that emerged each month
     recombs_per_month_dict = num_recombs_per_month(recomb_nodes, sample_months)
@@ -454,7 +525,7 @@ def merge_datafiles(config):
     # Load recombinant trios fitness file
     recomb_trios_fitness_df = get_recombinant_trios_fitness(config.fitness_results_path)
 
-    trios_nt_mutations_dict = get_nt_mutations(config.RIVET_VCF_FILE)
+    trio_mutations = load_trio_mutations(config.RIVET_VCF_FILE)
 
     outfile = config.RECOMBINATION_STATS_FILE
     # Format and merge all results together
@@ -465,7 +536,7 @@ def merge_datafiles(config):
         genetic_diversity_by_month,
         case_counts,
         recombs_per_month_dict,
-        trios_nt_mutations_dict,
+        trio_mutations,
         outfile,
     )
     print("Recombination data written to: {}".format(outfile))
@@ -507,7 +578,7 @@ def run_fitness(data_dir, fitness_outfile):
     exit()
 
 
-def run_chronumental(mat, metadata, data_dir):
+def run_chronumental(mat, metadata, data_dir, dates_out=None):
     """
     Runs the Chronumental command that infers emergence dates for all samples/nodes in the MAT.
 
@@ -522,6 +593,8 @@ def run_chronumental(mat, metadata, data_dir):
     data_dir: str
         The path to the data directory.
 
+    dates_out: str (Optional)
+        The path to write the Chronumental dates file to, defaults to a name derived from the MAT.
     """
     # Check that MAT and metadat file exist in data dir
     if not os.path.exists(mat):
@@ -536,6 +609,8 @@ def run_chronumental(mat, metadata, data_dir):
     # Get file paths required for Chronumental
     root, extension = os.path.splitext(mat)
     chron_output = os.path.join(data_dir, "chronumental_dates_{}.tsv".format(root))
+    if dates_out is not None:
+        chron_output = dates_out
 
     # Extract a Newick Tree file from the MAT first
     newick_tree_path = matUtils_extract_newick(mat, data_dir)
@@ -634,77 +709,67 @@ def load_df(filename, delim=","):
     return pl.read_csv(filename, separator=delim)
 
 
-# TODO: Edit docs slightly to show that metadata df was returned...
-def get_passing_recombs(df):
+def scan_rivet_results(rivet_results_filename):
     """
-    Get the set of recombinant node ids inferred by RIVET with the 'PASS' QC flag.
+    Lazily scan the RIVET results file (TSV).
 
     Parameters
     ----------
-    df: Polars DataFrame
-        The DataFrame object loaded from the RIVET results file.
+    rivet_results_filename: str
+        The RIVET results file (.txt).
 
     Returns
     ----------
-    Set(str)
-        The set of RIVET-inferred recombinant lineage node ids with the 'PASS' QC flag.
+    LazyFrame
+        The lazily scanned RIVET results.
     """
-    # Save the passing rows
-    passing_rows = []
-    nodes = set()
-    for i, row in enumerate(df.iter_rows(named=True)):
-        qc_flags = set(row[RIVET_CONFIG["QC_FLAG_COL"]].split(","))
-        recomb_node = row[RIVET_CONFIG["RECOMB_NODE_ID_COL"]]
-        # Remove any empty strings in list
-        if "" in qc_flags:
-            qc_flags.remove("")
-        # Collect all passing recombinant nodes
-        if RIVET_CONFIG["PASS_FLAG"] in qc_flags:
-            nodes.add(recomb_node)
-            passing_rows.append(row)
-    return nodes, passing_rows
+    return pl.scan_csv(rivet_results_filename, separator="\t")
 
 
-# TODO: Edit docs slightly to account for passing_rows
-def add_indel_flagged_recombs(df, passing_nodes, passing_rows):
+def filter_included_recombinants(rivet_results):
     """
-    Add the RIVET-inferred recombinant nodes with the 'Too_many_mutations_near_INDELs' QC flag,
-    to the set of 'PASS' nodes.
-
-    The function does not return a value, but adds elements to the 'passing_nodes' set.
+    Filter the RIVET results to the recombinants included in this analysis: those with the 'PASS' QC flag,
+    followed by those with only the 'Too_many_mutations_near_INDELs' QC flag (each in file order).
 
     Parameters
     ----------
-    df: Polars DataFrame
-        The DataFrame object loaded from the RIVET results file.
+    rivet_results: LazyFrame
+        The RIVET results, see 'scan_rivet_results'.
 
-    passing_nodes: Set(str)
-        The set of RIVET recombinant node ids with the 'PASS' QC flag.
-
-    """
-    for i, row in enumerate(df.iter_rows(named=True)):
-        qc_flags = set(row[RIVET_CONFIG["QC_FLAG_COL"]].split(","))
-        recomb_node = row[RIVET_CONFIG["RECOMB_NODE_ID_COL"]]
-        # Remove any empty strings in list
-        if "" in qc_flags:
-            qc_flags.remove("")
-
-        # Add all recombinant nodes with 'Too_many_mutations_near_INDELs' QC flag only
-        if (
-            len(qc_flags) == 1
-            and RIVET_CONFIG["INDEL_FLAG"] in qc_flags
-            and recomb_node not in passing_nodes
-        ):
-            passing_nodes.add(recomb_node)
-            passing_rows.append(row)
-    assert len(passing_rows) == len(passing_nodes)
-    assert set([row["Recombinant Node ID"] for row in passing_rows]) == passing_nodes
+    Returns
+    ----------
+    LazyFrame
+        The RIVET results rows of the included recombinants, with one row per recombinant node id.
+    """
+    node_col = RIVET_CONFIG["RECOMB_NODE_ID_COL"]
+    # Split the QC flags into a set, ignoring any empty strings
+    qc_flags = (
+        pl.col(RIVET_CONFIG["QC_FLAG_COL"])
+        .fill_null("")
+        .str.split(",")
+        .list.eval(pl.element().filter(pl.element() != ""))
+        .list.unique()
+    )
+    is_pass = qc_flags.list.contains(RIVET_CONFIG["PASS_FLAG"])
+    is_indel_only = (qc_flags.list.len() == 1) & qc_flags.list.contains(RIVET_CONFIG["INDEL_FLAG"])
+    return (
+        rivet_results.with_row_index("_Row")
+        .with_columns(is_pass.alias("_Pass"), is_indel_only.alias("_IndelOnly"))
+        .filter(pl.col("_Pass") | pl.col("_IndelOnly"))
+        # Recombinant nodes may only pass once, but 'INDEL'-only rows of a node are only added once
+        # and never for an already passing node
+        .with_columns(
+            (pl.col("_Pass") & pl.col(node_col).is_duplicated().over("_Pass")).alias("_RepeatedPass")
+        )
+        .sort(pl.col("_Pass").not_(), "_Row")
+        .unique(subset=[node_col], keep="first", maintain_order=True)
+    )
 
 
 def get_included_recombinants(rivet_results_filename):
     """
-    Collect all the RIVET-inferred recombinant node ids to be included in this analysis,
-    including those with 'PASS' or 'Too_many_mutations_near_INDELs' QC flags.
+    Collect all the RIVET-inferred recombinants to be included in this analysis,
+    including those with 'PASS' or only the 'Too_many_mutations_near_INDELs' QC flags.
 
     Parameters
     ----------
@@ -713,22 +778,24 @@ def get_included_recombinants(rivet_results_filename):
 
     Returns
     ----------
-    Set(str)
-        The set of RIVET-inferred recombinant lineage node ids to include in the analysis.
+    DataFrame
+        The RIVET results rows of the recombinant lineages to include in the analysis.
     """
-    df = load_df(rivet_results_filename, delim="\t")
-    unique_nodes = df[RIVET_CONFIG["RECOMB_NODE_ID_COL"]].unique()
-    passing_nodes, passing_rows = get_passing_recombs(df)
-    add_indel_flagged_recombs(df, passing_nodes, passing_rows)
-    return passing_nodes, passing_rows
+    df = filter_included_recombinants(scan_rivet_results(rivet_results_filename)).collect()
+    if df["_RepeatedPass"].any():
+        raise ValueError(
+            f"Repeated recombinant node ids with 'PASS' QC flag in RIVET results: '{rivet_results_filename}'"
+        )
+    return df.drop("_Row", "_Pass", "_IndelOnly", "_RepeatedPass")
 
 
+@profiled(unit="samples")
 def get_chronumental_dates(chronumental_filename):
     """
-    Load the Chronumental results file (TSV) and build a dictionary mapping the sample names to
-    their inferred emergence month.
-    Since the dictionary takes awhile to build, cache it on disk as a pickled object after first
-    building it, and reload the dictionary object on subsequent calls.
+    Load the index mapping the sample names in the Chronumental results file (TSV) to their inferred
+    emergence month.
+    Since the index takes awhile to build, it is stored on disk next to the Chronumental file after first
+    building it (see 'month_index.py'), and memory-mapped on subsequent calls while the file is unchanged.
 
     Parameters
     ----------
@@ -737,88 +804,45 @@ def get_chronumental_dates(chronumental_filename):
 
     Returns
     ----------
-    Dict
-        The dictionary of samples (tips and internal node ids) to their inferred months.
-    """
-    CACHE_PATH = chronumental_filename + ".pkl"
-    # Check if chronumental dates object cached
-    if os.path.exists(CACHE_PATH):
-        print("Loading Chronumental object from disk cache: ", CACHE_PATH)
-        with open(CACHE_PATH, "rb") as f:
-            sample_months_object = pickle.load(f)
-        print("Chronumental dates loaded.")
-        return sample_months_object
-
-    print("Loading Chronumental dates file. This could take a couple minutes.")
-    df = load_df(chronumental_filename, delim="\t")
-    SAMPLE_COL = "strain"
-    DATE_COL = "predicted_date"
-    sample_months = dict()
-    for row in df.iter_rows(named=True):
-        sample = row[SAMPLE_COL]
-        date = row[DATE_COL]
-        formatted_date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S.%f")
-        month = date_to_month(formatted_date)
-
-        # Ensure that month string properly formatted
-        if len(month) != 7:
-            print(formatted_date)
-            print(f"{formatted_date.month:02d}")
-            print(month)
-            exit(1)
-
-        if sample not in sample_months.keys():
-            sample_months[sample] = month
-        else:
-            print("Error, repeated sample!")
-            exit(1)
-
-    # Save chronumental lookup table on disk as pickled python dict
-    print("Saving chronumental dates map on disk: ", chronumental_filename + ".pkl")
-    with open(chronumental_filename + ".pkl", "wb") as file:
-        pickle.dump(sample_months, file)
-
+    MonthIndex
+        The dict-like index of samples (tips and internal node ids) to their inferred months.
+    """
+    sample_months = load_month_index(chronumental_filename)
+    count("samples", len(sample_months))
     return sample_months
 
 
-# TODO: Edit signature, nodes_to_consider not needed anymore...
-def filter_recombs_to_date_range(nodes_to_consider, passing_rows, sample_months):
+def filter_recombs_to_date_range(recombs, sample_months):
     """
-    Take the list of filtered RIVET-inferred recombinant nodes by QC flags, and produce a further filtered
-    list of recombinant node ids within the desired date range, specified in the 'MONTHS' list.
+    Join the inferred emergence month of each of the RIVET-inferred recombinants filtered by QC flags,
+    and further filter them to those within the desired date range, specified in the 'MONTHS' list.
 
     Parameters
     ----------
-    nodes_to_consider: Set(str)
-        The set of RIVET-inferred recombinant nodes with either the 'PASS' or only the 'Too_many_mutations_near_INDELs'
-        QC flag.
+    recombs: DataFrame
+        The RIVET results rows of the recombinants with either the 'PASS' or only the
+        'Too_many_mutations_near_INDELs' QC flag, see 'get_included_recombinants'.
 
-    sample_months: Dict[str, str]
-        The dictionary of samples (tips and internal node ids) to their inferred months.
+    sample_months: MonthIndex
+        The index of samples (tips and internal node ids) to their inferred months.
 
     Returns
     ----------
-    List[str]
-        The list of RIVET-inferred recombinant nodes, with either the 'PASS' or only the 'Too_many_mutations_near_INDELs'
-        QC flag and within the months in the 'MONTHS' list.
+    DataFrame
+        The rows of the recombinants within the months in the 'MONTHS' list, with their 'Month'.
     """
-    nodes = []
-    i = 0
-    rows_to_remove = []
-    for row in passing_rows:
-        node = row["Recombinant Node ID"]
-        month = sample_months[node]
-        if month not in MONTHS:
-            rows_to_remove.append(i)
-            i += 1
-            continue
-        nodes.append(node)
-        i += 1
-
-    # Remove rows outside of date range
-    for idx in sorted(rows_to_remove, reverse=True):
-        passing_rows.pop(idx)
-    return nodes
+    node_col = RIVET_CONFIG["RECOMB_NODE_ID_COL"]
+    nodes = recombs[node_col].to_list()
+    months = pl.LazyFrame(
+        {node_col: nodes, "Month": sample_months.lookup(nodes)},
+        schema={node_col: pl.String, "Month": pl.String},
+    )
+    return (
+        recombs.lazy()
+        .join(months, on=node_col, how="left", validate="1:1", maintain_order="left")
+        .filter(pl.col("Month").is_in(MONTHS))
+        .collect()
+    )
 
 
 def get_mutation_rankings(filename):
@@ -950,8 +974,8 @@ def num_recombs_per_month(final_recomb_nodes, sample_months):
     final_recomb_nodes: List[str]
         The list of RIVET-inferred recombinant node ids considered in this analysis.
 
-    sample_months: Dict[str, str]
-        The dictionary of samples (tips and internal node ids) to their inferred months.
+    sample_months: MonthIndex
+        The index of samples (tips and internal node ids) to their inferred months.
 
     merged_df: DataFrame
         A DataFrame object containing the standing genetic diversity and case count data.
@@ -965,7 +989,7 @@ def num_recombs_per_month(final_recomb_nodes, sample_months):
     # TODO: ^EDIT THE ABOVE DOCS
     recombs_per_month = dict()
     for node in final_recomb_nodes:
-        if node not in sample_months.keys():
+        if node not in sample_months:
             print("Chronumental date for node not found!")
             exit(1)
         month = sample_months[node]
@@ -989,53 +1013,139 @@ def num_recombs_per_month(final_recomb_nodes, sample_months):
     """
 
 
+# Fitness columns of each recombinant in the recombination stats file (see 'merge_datafiles_helper')
+RECOMB_SCORE_COL = "Score"
+DONOR_SCORE_COL = "DonorFitness"
+ACCEPTOR_SCORE_COL = "AcceptorFitness"
+
+
+def max_parent_fitness():
+    """
+    Expression of the fitness of each recombinant's fitter parent.
+    """
+    return pl.max_horizontal(DONOR_SCORE_COL, ACCEPTOR_SCORE_COL)
+
+
+def min_parent_fitness():
+    """
+    Expression of the fitness of each recombinant's less fit parent.
+    """
+    return pl.min_horizontal(DONOR_SCORE_COL, ACCEPTOR_SCORE_COL)
+
+
+def mean_parent_fitness():
+    """
+    Expression of the average fitness of each recombinant's parents.
+    """
+    return pl.mean_horizontal(DONOR_SCORE_COL, ACCEPTOR_SCORE_COL)
+
+
+def circulating_median_fitness():
+    """
+    Expression of the median fitness of the samples circulating in each recombinant's month, once the
+    recombinant data is joined with the monthly fitness stats (see 'RecombAnalysis.recomb_data').
+    """
+    return pl.col("Median")
+
+
+def fitness_normalized_by(reference):
+    """
+    Expression of each recombinant's fitness relative to a reference fitness, eg)
+    'fitness_normalized_by(max_parent_fitness())' is the 'RecombFitnessNormalizedByMaxParents' column.
+
+    Parameters
+    ----------
+    reference: pl.Expr
+        The fitness to normalize by, eg) 'min_parent_fitness()' or 'circulating_median_fitness()'.
+
+    Returns
+    ----------
+    pl.Expr
+        The recombinant's fitness divided by the reference fitness.
+    """
+    return pl.col(RECOMB_SCORE_COL) / reference
+
+
+def min_max_norm_fitness():
+    """
+    Expression of the min-max normalization of each recombinant's fitness between the fitness of its
+    parents: 0 at the less fit parent and 1 at the fitter parent, or 0.5 when both parents are equally fit.
+    """
+    max_x = max_parent_fitness()
+    min_x = min_parent_fitness()
+    return (
+        pl.when(max_x == min_x)
+        .then(pl.lit(0.5))
+        .otherwise((pl.col(RECOMB_SCORE_COL) - min_x) / (max_x - min_x))
+        .cast(pl.Float64)
+    )
+
+
+def mean_stddev(df, expr):
+    """
+    Get the mean and (sample) standard deviation of an expression over all the rows of a DataFrame.
+
+    Parameters
+    ----------
+    df: DataFrame or LazyFrame
+        The rows to compute the statistics over.
+
+    expr: pl.Expr
+        The values to compute the statistics of, eg) 'fitness_normalized_by(min_parent_fitness())'.
+
+    Returns
+    ----------
+    Dict[str, float]
+        The "mean" and "stddev" of the values.
+    """
+    stats = df.lazy().select(expr.mean().alias("mean"), expr.std().alias("stddev")).collect()
+    return stats.row(0, named=True)
+
+
 def get_recombination_min_fitness_stats(df):
     """
-    TODO: docs
+    Get the mean and standard deviation of recombinant fitness normalized by the fitness of the less
+    fit parent. The statistics are summed exactly (see 'weighted_stats.exact_mean_stddev'), identical to
+    'statistics.mean' and 'statistics.stdev' of the normalized fitness.
     TODO: Add a column in the results file for RecombFitnessNormalizedByMinParents
     """
-    RECOMB_SCORE_COL = "Score"
-    DONOR_SCORE_COL = "DonorFitness"
-    ACCEPTOR_SCORE_COL = "AcceptorFitness"
-    min_normalized_scores = []
-    for row in df.iter_rows(named=True):
-        recomb_score = row[RECOMB_SCORE_COL]
-        donor_score = row[DONOR_SCORE_COL]
-        acceptor_score = row[ACCEPTOR_SCORE_COL]
-        min_parental_score = min(donor_score, acceptor_score)
-        min_normalized_scores.append(recomb_score / min_parental_score)
-    assert len(min_normalized_scores) == len(df)
-    mean_fitness = statistics.mean(min_normalized_scores)
-    std_dev_fitness = statistics.stdev(min_normalized_scores)
-    return {"mean": mean_fitness, "stddev": std_dev_fitness}
+    normalized = df.lazy().select(fitness_normalized_by(min_parent_fitness())).collect().to_series()
+    mean, stddev = exact_mean_stddev(normalized, np.ones(len(normalized), dtype=np.int64))
+    return {"mean": mean, "stddev": stddev}
 
 
 def get_recombination_fitness_stats(df):
     """
-    TODO: docs
+    Get the mean and standard deviation of recombinant fitness normalized by the fitness of the
+    fitter parent.
     """
-    mean_fitness = df.select(
-        pl.col("RecombFitnessNormalizedByMaxParents").mean()
-    ).item()
-    std_dev_fitness = df.select(
-        pl.col("RecombFitnessNormalizedByMaxParents").std()
-    ).item()
-    return {"mean": mean_fitness, "stddev": std_dev_fitness}
+    return mean_stddev(df, pl.col("RecombFitnessNormalizedByMaxParents"))
 
 
-def get_substitution_stats(filename):
+def get_substitution_stats(filename, legacy_extra_copy=False):
     """
-    TODO
+    Get the mean and standard deviation of the fitness of the substitutions found in the MAT, weighting
+    each substitution's PyR0 score by its number of occurrences. The statistics are summed exactly (see
+    'weighted_stats.exact_mean_stddev'), equal to those of each score repeated once per occurrence.
+
+    Parameters
+    ----------
+    filename: str
+        The substitution scores file (CSV), with the 'PyRoScore' and 'Occurrence' of each substitution.
+
+    legacy_extra_copy: bool (Optional)
+        Count every substitution once more than its occurrences, reproducing the manuscript's statistics.
+
+    Returns
+    ----------
+    Dict[str, float]
+        The "mean" and "stddev" of the substitution fitness scores.
     """
     df = pl.read_csv(filename)
-    scores = []
-    for row in df.iter_rows(named=True):
-        occ = row["Occurrence"]
-        score = row["PyRoScore"]
-        for i in range(0, occ):
-            scores.append(score)
-        scores.append(score)
-    return {"mean": statistics.mean(scores), "stddev": statistics.stdev(scores)}
+    scores = df[SUBSTITUTION_SCORE_COL]
+    weights = substitution_weights(df, legacy_extra_copy)
+    mean, stddev = exact_mean_stddev(scores, weights)
+    return {"mean": mean, "stddev": stddev}
 
 
 def get_monthly_fitness_stats(stats_filename):
@@ -1048,43 +1158,27 @@ def get_monthly_fitness_stats(stats_filename):
 
 def calc_norm_fitness(recomb_data_df, csv_outfile=None):
     """
-    TODO:
-    """
+    Min-max normalize the fitness of each recombinant between the fitness of its parents,
+    see 'min_max_norm_fitness'.
 
-    def min_max_norm(score, max_x, min_x):
-        """
-        TODO:
-        """
-        if max_x == min_x:
-            # In cases where the max(parents) = min(parents)
-            return 0.5
-        norm = (score - min_x) / (max_x - min_x)
-        return norm
+    Parameters
+    ----------
+    recomb_data_df: DataFrame
+        The recombination stats of each recombinant, see 'merge_datafiles_helper'.
 
-    df = pl.DataFrame(
-        {
-            "RecombID": pl.Series([], dtype=pl.String),
-            "NormFitness": pl.Series([], dtype=pl.Float64),
-            "Date": pl.Series([], dtype=pl.String),
-        }
-    )
-    for row in recomb_data_df.iter_rows(named=True):
-        month = row["Month"]
-        recomb_id = row["Node"]
-        recomb_fitness = row["Score"]
-        donor_fitness = row["DonorFitness"]
-        acceptor_fitness = row["AcceptorFitness"]
-        min_max_fitness = min_max_norm(
-            recomb_fitness,
-            max(donor_fitness, acceptor_fitness),
-            min(donor_fitness, acceptor_fitness),
-        )
-        df.vstack(
-            pl.DataFrame(
-                {"RecombID": recomb_id, "NormFitness": min_max_fitness, "Date": month}
-            ),
-            in_place=True,
-        )
+    csv_outfile: str (Optional)
+        The CSV file to write the normalized fitness to.
+
+    Returns
+    ----------
+    DataFrame
+        The 'RecombID', 'NormFitness' and 'Date' (month) of each recombinant.
+    """
+    df = recomb_data_df.lazy().select(
+        pl.col("Node").cast(pl.String).alias("RecombID"),
+        min_max_norm_fitness().alias("NormFitness"),
+        pl.col("Month").cast(pl.String).alias("Date"),
+    ).collect()
     assert len(df) == len(recomb_data_df)
     if csv_outfile is not None:
         df.write_csv(csv_outfile)
@@ -1097,6 +1191,7 @@ def get_recombinant_data(recombination_data_filename):
     return df
 
 
+@profiled(unit="rows")
 def get_recombinant_nodes(rivet_results_filename, sample_months):
     """
     Get all the RIVET-inferred recombinant nodes to be included in this study,
@@ -1107,25 +1202,21 @@ def get_recombinant_nodes(rivet_results_filename, sample_months):
     rivet_results_filename: str
         The RIVET results file.
 
-    sample_months: Dict[str, str]
-        The dictionary of samples (tips and internal node ids) to their inferred months.
+    sample_months: MonthIndex
+        The index of samples (tips and internal node ids) to their inferred months.
 
     Returns
     ----------
-    List[str]
-        The list of RIVET-inferred recombinant nodes, with either the 'PASS' or only the 'Too_many_mutations_near_INDELs'
-        QC flag and within the months in the 'MONTHS' list.
+    DataFrame
+        The RIVET results rows of the recombinants, with either the 'PASS' or only the 'Too_many_mutations_near_INDELs'
+        QC flag and within the months in the 'MONTHS' list, with their inferred 'Month'.
     """
     # Get all recombinant nodes with 'PASS' or only 'indel' flag
-    nodes_to_consider, passing_rows = get_included_recombinants(rivet_results_filename)
-    final_recomb_nodes = filter_recombs_to_date_range(
-        nodes_to_consider, passing_rows, sample_months
-    )
-    assert len(final_recomb_nodes) == len(passing_rows)
-    assert set(final_recomb_nodes) == set(
-        [row["Recombinant Node ID"] for row in passing_rows]
-    )
-    return final_recomb_nodes, passing_rows
+    recombs = get_included_recombinants(rivet_results_filename)
+    count("rows", len(recombs))
+    recombs = filter_recombs_to_date_range(recombs, sample_months)
+    count("recombinants", len(recombs))
+    return recombs
 
 
 def write_results(outfile):
@@ -0,0 +1,219 @@
+"""
+Statistics of weighted values, computed directly from (value, weight) columns.
+
+Weights are frequency weights: a value with weight 3 counts as 3 observations, eg) the PyR0 score of a
+substitution weighted by its number of occurrences in the MAT. The results equal those of the values
+expanded into one copy per unit of weight (up to floating point rounding), without the memory and time
+proportional to the total weight. 'exact_mean_stddev' sums the values exactly instead, so its results are
+identical to those of 'statistics.mean' and 'statistics.stdev' on the expanded values.
+
+Kept free of the pyrocov dependency, so it can be used in every pixi environment (eg. by the figure server).
+"""
+
+import math
+import sys
+import numpy as np
+
+# Columns of the substitution scores file ('substitutions_scores.csv')
+SUBSTITUTION_SCORE_COL = "PyRoScore"
+OCCURRENCE_COL = "Occurrence"
+# Bits of the square root kept before rounding to a float, enough for the rounding to be correct
+SQRT_BITS = 2 * sys.float_info.mant_dig + 3
+
+
+def _as_arrays(values, weights):
+    x = np.asarray(values, dtype=np.float64)
+    w = np.asarray(weights, dtype=np.float64)
+    if x.shape != w.shape:
+        raise ValueError(f"Expected a weight for each value, got {len(w)} weights for {len(x)} values")
+    if (w < 0).any():
+        raise ValueError("Weights must be non-negative")
+    return x, w
+
+
+def weighted_mean(values, weights):
+    """
+    Get the mean of weighted values.
+
+    Parameters
+    ----------
+    values: array-like
+        The values, eg) a pl.Series or np.ndarray.
+
+    weights: array-like
+        The (frequency) weight of each value.
+
+    Returns
+    ----------
+    float
+        The weighted mean.
+    """
+    x, w = _as_arrays(values, weights)
+    return float(np.sum(w * x) / np.sum(w))
+
+
+def weighted_variance(values, weights, ddof=1):
+    """
+    Get the variance of weighted values, by default the sample variance (as 'statistics.variance').
+
+    Parameters
+    ----------
+    values: array-like
+        The values.
+
+    weights: array-like
+        The (frequency) weight of each value.
+
+    ddof: int (Optional)
+        Delta degrees of freedom, the variance is divided by the total weight minus 'ddof'.
+
+    Returns
+    ----------
+    float
+        The weighted variance.
+    """
+    x, w = _as_arrays(values, weights)
+    mean = np.sum(w * x) / np.sum(w)
+    return float(np.sum(w * (x - mean) ** 2) / (np.sum(w) - ddof))
+
+
+def weighted_stddev(values, weights, ddof=1):
+    """
+    Get the standard deviation of weighted values, by default the sample standard deviation
+    (as 'statistics.stdev'), see 'weighted_variance'.
+    """
+    return float(np.sqrt(weighted_variance(values, weights, ddof)))
+
+
+def _float_sqrt_of_fraction(n, m):
+    # Correctly rounded sqrt(n / m): the integer square root (scaled to SQRT_BITS bits) is rounded to odd,
+    # so its single rounding to a float is correct, as done by 'statistics.stdev'
+    q = (n.bit_length() - m.bit_length() - SQRT_BITS) // 2
+    if q >= 0:
+        m <<= 2 * q
+    else:
+        n <<= -2 * q
+    root = math.isqrt(n // m)
+    root |= root * root * m != n
+    return float(root << q) if q >= 0 else root / (1 << -q)
+
+
+def exact_mean_stddev(values, weights):
+    """
+    Get the mean and sample standard deviation of weighted values, summed exactly over the distinct values,
+    so they are identical to 'statistics.mean' and 'statistics.stdev' of the expanded values.
+
+    Parameters
+    ----------
+    values: array-like
+        The (finite) values.
+
+    weights: array-like
+        The integer frequency weight of each value.
+
+    Returns
+    ----------
+    Tuple[float, float]
+        The weighted mean and sample standard deviation.
+    """
+    x, w = _as_arrays(values, weights)
+    counts = w.astype(np.int64).tolist()
+    # Every float is an integer over a power of two, so all of them are integers over the largest denominator
+    ratios = [value.as_integer_ratio() for value in x.tolist()]
+    denominator = max(d for _, d in ratios)
+    scaled = [n * (denominator // d) for n, d in ratios]
+    total = sum(counts)
+    if total < 2:
+        raise ValueError("The standard deviation requires a total weight of at least 2")
+    sx = sum(c * v for c, v in zip(counts, scaled))
+    sxx = sum(c * v * v for c, v in zip(counts, scaled))
+    # Sum of squared deviations, (total * sxx - sx^2) / total, over (total - 1), in units of denominator^2
+    ss = total * sxx - sx * sx
+    return sx / (total * denominator), _float_sqrt_of_fraction(ss, total * (total - 1) * denominator * denominator)
+
+
+def weighted_quantiles(values, weights, quantiles):
+    """
+    Get quantiles of weighted values, with the linear interpolation of 'np.quantile' on the expanded values.
+
+    Parameters
+    ----------
+    values: array-like
+        The values.
+
+    weights: array-like
+        The (integer) frequency weight of each value.
+
+    quantiles: array-like
+        The quantiles to get, between 0 and 1.
+
+    Returns
+    ----------
+    np.ndarray
+        The value at each quantile.
+    """
+    x, w = _as_arrays(values, weights)
+    order = np.argsort(x, kind="stable")
+    x, w = x[order], w[order]
+    # Index (in the expanded values) of the last copy of each value
+    last = np.cumsum(w) - 1
+    h = (last[-1]) * np.asarray(quantiles, dtype=np.float64)
+    lo = x[np.searchsorted(last, np.floor(h))]
+    hi = x[np.searchsorted(last, np.ceil(h))]
+    return lo + (hi - lo) * (h - np.floor(h))
+
+
+def weighted_histogram(values, weights, start, end, thresholds):
+    """
+    Sum the weights of the values in each histogram bin, binning as done by d3.bin(): values outside the
+    domain [start, end] (and NaN) are dropped, and each value is in the bin following the last threshold
+    less than or equal to it.
+
+    Parameters
+    ----------
+    values: array-like
+        The values to bin.
+
+    weights: array-like
+        The weight of each value.
+
+    start: float
+        The start of the histogram domain.
+
+    end: float
+        The end of the histogram domain.
+
+    thresholds: List[float]
+        The sorted bin thresholds, within (start, end].
+
+    Returns
+    ----------
+    np.ndarray
+        The total weight in each of the len(thresholds) + 1 bins.
+    """
+    x, w = _as_arrays(values, weights)
+    in_domain = ~np.isnan(x) & (x >= start) & (x <= end)
+    idx = np.searchsorted(thresholds, x[in_domain], side="right")
+    return np.bincount(idx, weights=w[in_domain], minlength=len(thresholds) + 1)
+
+
+def substitution_weights(df, legacy_extra_copy=False):
+    """
+    The weight of each substitution in the substitution scores file, its number of occurrences in the MAT.
+
+    Parameters
+    ----------
+    df: pl.DataFrame
+        The substitution scores, with the 'Occurrence' of each substitution.
+
+    legacy_extra_copy: bool (Optional)
+        Count every substitution once more than its occurrences, reproducing the substitution fitness
+        statistics reported in the manuscript.
+
+    Returns
+    ----------
+    pl.Series
+        The weight of each substitution.
+    """
+    occurrences = df[OCCURRENCE_COL]
+    return occurrences + 1 if legacy_extra_copy else occurrences
@@ -1,27 +1,78 @@
 """
 Script to fetch and generate all the data used in recombination analysis.
+
+Only the pipeline stages that are out of date (missing outputs, or inputs whose content changed since
+their last run) are rerun, see 'notebooks/pipeline.py'.
 """
 
-from notebooks.util import *
+import argparse
+import os
+import sys
+
+# The analysis helpers are flat modules in the 'notebooks' directory that import each other
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "notebooks"))
+
+from util import *
+from pipeline import DEFAULT_TARGETS, load_pipeline
+from profiling import PROFILE_DIR_ENV, start_run_report
 
 CONFIG_FILENAME = "config.yaml"
+# JSON run report of the time, CPU, memory and throughput of each stage, written to the data directory
+RUN_REPORT_FILE = "run_report.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate all the data files used in the recombination analysis."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the stages that would run, with their estimated costs, without running them.",
+    )
+    parser.add_argument(
+        "--target",
+        nargs="+",
+        default=DEFAULT_TARGETS,
+        help="Pipeline stages to bring up to date, along with their upstream stages.",
+    )
+    parser.add_argument(
+        "--force",
+        nargs="+",
+        default=[],
+        help="Pipeline stages to rerun even if they are up to date.",
+    )
+    parser.add_argument(
+        "--report",
+        help=f"Path to write the JSON run report to, '{RUN_REPORT_FILE}' in the data directory by default.",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help=f"Directory to dump a cProfile of each stage to (same as setting '{PROFILE_DIR_ENV}').",
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     config = Config(CONFIG_FILENAME)
-    # Download necessary infection counts and mutation fitness data files
-    download_data_files(config.DATA_DIR)
+    pipeline = load_pipeline(config)
 
-    if config.RERUN_CHRONUMENTAL:
-        print("Generating Chronumental file.")
-        run_chronumental(config.MAT, config.METADATA, config.DATA_DIR)
+    if args.dry_run:
+        pipeline.print_plan(args.target, args.force)
+        return
 
+    if args.profile_dir:
+        os.environ[PROFILE_DIR_ENV] = os.path.abspath(args.profile_dir)
+    report = args.report or os.path.join(config.DATA_DIR, RUN_REPORT_FILE)
+    start_run_report(report)
+    pipeline.run(args.target, args.force)
     print(
         "All data files needed for analysis have been written to: {}".format(
             config.DATA_DIR
         )
     )
-    merge_datafiles(config)
+    print("Run report written to: ", report)
 
 
 if __name__ == "__main__":
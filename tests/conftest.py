@@ -0,0 +1,10 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The analysis modules, and the synthetic dataset generator of the benchmarks
+sys.path.insert(0, os.path.join(REPO_DIR, "notebooks"))
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+# The figure server and its shared modules
+sys.path.insert(0, os.path.join(REPO_DIR, "figures", "common"))
+sys.path.insert(0, os.path.join(REPO_DIR, "figures"))
@@ -0,0 +1,35 @@
+"""
+The Python panels of the render cache (see 'figures/common/render_cache.py'), rendered through the
+figure server and picked up by the export.
+"""
+
+import os
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("waitress")
+
+from export import export_tasks
+from render_cache import FIGURES_DIR, PYTHON_PANELS, RenderCache
+from server import create_app
+
+
+@pytest.mark.parametrize("figure, panel", sorted(PYTHON_PANELS))
+def test_python_panel_renders(figure, panel, tmp_path):
+    for path in PYTHON_PANELS[(figure, panel)].inputs:
+        assert os.path.isfile(os.path.join(FIGURES_DIR, path)), path
+    client = create_app(render_cache=RenderCache(str(tmp_path))).test_client()
+    response = client.get(f"/render/{figure}/{panel}.svg")
+    assert response.status_code == 200
+    assert response.mimetype == "image/svg+xml"
+    assert b"<svg" in response.data
+    # Served from the cache the second time
+    assert len(os.listdir(tmp_path)) == 1
+    assert client.get(f"/render/{figure}/{panel}.svg").status_code == 200
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_export_includes_python_panels():
+    tasks = export_tasks(["svg"])
+    for figure, panel in PYTHON_PANELS:
+        assert (figure, panel, "svg") in tasks
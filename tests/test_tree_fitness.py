@@ -0,0 +1,109 @@
+"""
+The node fitness accumulated down the MAT (see 'notebooks/tree_fitness.py') against scoring each node's
+haplotype directly with 'FitnessScorer', on a batch of the synthetic sample mutations store.
+"""
+
+import os
+import numpy as np
+import pytest
+
+# The translation engine needs the pyro-env environment
+pytest.importorskip("pyrocov")
+
+from mutation_store import open_store, read_batch
+from node_mutations import NodeMutationWriter, load_node_mutations
+from nucleotides import NUCLEOTIDES
+from scoring import FitnessScorer, get_fitness_scores
+from synthetic import Scale, generate
+from third_party.nuc_mutations_to_aa_mutations_modified import load_reference_sequence_modified
+from translation import AATranslator
+from tree_fitness import score_tree
+from util import Config
+
+SCALE = Scale(chronumental_rows=3_000, rivet_rows=100, store_samples=2_000, vcf_records=50)
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    dataset_dir = str(tmp_path_factory.mktemp("synthetic"))
+    generate(dataset_dir, SCALE, seed=0)
+    config = Config(os.path.join(dataset_dir, "config.yaml"))
+    refseq = load_reference_sequence_modified(config.DATA_DIR, "reference.fasta")
+    scorer = FitnessScorer(AATranslator(refseq), get_fitness_scores(config.PYRO_MUTATIONS_FILE))
+    batch = read_batch(open_store(config.sample_mutations_path), 0)
+    return config, refseq, scorer, batch
+
+
+def build_tree(path, refseq, batch):
+    """
+    Write a node mutations table where each sample hangs off an internal node holding the first half of
+    its mutations, shared by the samples with the same first half. Every other sample also reverts its
+    parent's first mutation, and mutates its last position again.
+
+    Returns
+    ----------
+    Dict[str, Dict[int, str]]
+        The haplotype (position -> allele, where it differs from the reference) of every node.
+    """
+    bounds = batch.sample_bounds()
+    # Group the samples under their internal node first, as the table is written in preorder
+    children = {}
+    for i, sample in enumerate(batch.samples):
+        mutations = list(
+            zip(
+                batch.positions[bounds[i] : bounds[i + 1]].tolist(),
+                [NUCLEOTIDES[alt] for alt in batch.alts[bounds[i] : bounds[i + 1]].tolist()],
+            )
+        )
+        head = tuple(mutations[: len(mutations) // 2])
+        children.setdefault(head, []).append((i, sample, mutations[len(head) :]))
+
+    haplotypes = {"root": {}}
+    with NodeMutationWriter(path) as writer:
+        root = writer.add("root", -1, False, [])
+        for j, (head, samples) in enumerate(children.items()):
+            parent_name = f"node_{j}"
+            parent = writer.add(parent_name, root, False, [f"{refseq[p - 1]}{p}{a}" for p, a in head])
+            haplotypes[parent_name] = dict(head)
+            for i, sample, tail in samples:
+                haplotype = dict(head)
+                branch = []
+                for position, alt in tail:
+                    branch.append(f"{refseq[position - 1]}{position}{alt}")
+                    haplotype[position] = alt
+                if i % 2 and head and tail:
+                    position, alt = head[0]
+                    branch.append(f"{alt}{position}{refseq[position - 1]}")
+                    del haplotype[position]
+                    position, alt = tail[-1]
+                    new_alt = next(nt for nt in "ACGT" if nt not in (alt, refseq[position - 1]))
+                    branch.append(f"{alt}{position}{new_alt}")
+                    haplotype[position] = new_alt
+                writer.add(sample, parent, True, branch)
+                haplotypes[sample] = haplotype
+    return haplotypes
+
+
+def test_tree_fitness_matches_scorer(dataset, tmp_path):
+    config, refseq, scorer, batch = dataset
+    path = str(tmp_path / "node_mutations.parquet")
+    haplotypes = build_tree(path, refseq, batch)
+    node_mutations = load_node_mutations(path)
+    log_fitness, num_nt, num_aa = score_tree(node_mutations, scorer)
+
+    # Score every node's haplotype directly
+    sample_idx, positions, alts = [], [], []
+    for i, node in enumerate(node_mutations.nodes):
+        for position, alt in sorted(haplotypes[node].items()):
+            sample_idx.append(i)
+            positions.append(position)
+            alts.append(NUCLEOTIDES.index(alt))
+    aa_mutations = scorer.translator.translate_batch(sample_idx, positions, alts)
+    fitness, expected_num_aa = scorer.score(aa_mutations, len(node_mutations))
+    expected_log_fitness = np.log(fitness)
+
+    assert num_nt == [len(haplotypes[node]) for node in node_mutations.nodes]
+    assert num_aa == np.asarray(expected_num_aa).tolist()
+    assert any(count > 0 for count in num_aa)
+    # The tree sums the Δlog R scores exactly, the scorer one at a time, so they agree to a few ulps
+    np.testing.assert_allclose(log_fitness, expected_log_fitness, rtol=0, atol=1e-12)